@@ -0,0 +1,235 @@
+import os
+from configparser import ConfigParser
+
+import numpy as np
+import pandas as pd
+
+import storage
+from measure_spec import MEASURES
+
+# Which concepts are reported by which companies, to tune the measure hierarchies of measure_spec.py.
+# The index is a concept x company presence bitmap (np.packbits, bit j of row i is set if company ciks[j] reports
+# concepts[i]) plus the first and last period end of every (concept, company) pair of the bitmap, saved in a single
+# .npz file.
+# Concepts are "<tax>:<measure>:<unit>", e.g. "us-gaap:Revenues:USD".
+#
+# Configuration in credentials.cfg (optional):
+# [coverage]
+# path = coverage_index.npz
+
+DEFAULT_PATH = "coverage_index.npz"
+
+# number of bits set in every byte
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+_coverage_index = None
+
+
+def get_coverage_index_path():
+    parser = ConfigParser()
+    _ = parser.read(os.path.join("credentials.cfg"))
+    return parser.get("coverage", "path", fallback=DEFAULT_PATH)
+
+
+def get_concept_name(tax, measure, unit="USD"):
+    return f"{tax}:{measure}:{unit}"
+
+
+def get_company_concepts(doc):
+    """
+    Get the concepts reported by a company and their period ends
+    :param doc: financial_data document (facts only)
+    :return: (cik, {concept: (first end, last end)}), dates are yyyy-mm-dd strings
+    """
+    concepts = {}
+    for tax, measures in doc.get("facts", {}).items():
+        for measure, measure_data in measures.items():
+            for unit, rows in measure_data.get("units", {}).items():
+                ends = [r["end"] for r in rows if r.get("end") is not None]
+                if len(ends) > 0:
+                    concepts[get_concept_name(tax, measure, unit)] = (min(ends), max(ends))
+    return doc["_id"], concepts
+
+
+def build_coverage_index(num_workers=None, path=None):
+    """
+    Stream financial_data (facts only) with parallel workers and save the coverage index
+    :param num_workers: number of processes, default number of cpus
+    :param path: index file, None uses the configured one
+    :return: (number of concepts, number of companies)
+    """
+    path = path if path is not None else get_coverage_index_path()
+
+    companies = storage.parallel_map_collection("financial_data", get_company_concepts, num_workers=num_workers,
+                                                projection=["facts"])
+    companies = sorted(companies, key=lambda c: c[0])
+    ciks = [c[0] for c in companies]
+
+    concepts = sorted({concept for _, company_concepts in companies for concept in company_concepts})
+    concept_index = {concept: i for i, concept in enumerate(concepts)}
+
+    bitmap = np.zeros((len(concepts), (len(ciks) + 7) // 8), dtype=np.uint8)
+    # (concept, company) pairs of the bitmap with their first and last period end
+    pair_concept, pair_company, pair_first_date, pair_last_date = [], [], [], []
+
+    for j, (_, company_concepts) in enumerate(companies):
+        rows = np.array([concept_index[c] for c in company_concepts], dtype=np.int64)
+        # same bit order as np.packbits
+        bitmap[rows, j >> 3] |= np.uint8(0x80 >> (j & 7))
+
+        pair_concept.append(rows.astype(np.int32))
+        pair_company.append(np.full(len(rows), j, dtype=np.int32))
+        pair_first_date.append(np.array([d[0] for d in company_concepts.values()], dtype="datetime64[D]"))
+        pair_last_date.append(np.array([d[1] for d in company_concepts.values()], dtype="datetime64[D]"))
+
+    # the file is replaced atomically
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, concepts=np.array(concepts), ciks=np.array(ciks), bitmap=bitmap,
+                            pair_concept=np.concatenate(pair_concept or [np.zeros(0, dtype=np.int32)]),
+                            pair_company=np.concatenate(pair_company or [np.zeros(0, dtype=np.int32)]),
+                            pair_first_date=np.concatenate(pair_first_date or [np.zeros(0, dtype="datetime64[D]")]),
+                            pair_last_date=np.concatenate(pair_last_date or [np.zeros(0, dtype="datetime64[D]")]))
+    os.replace(tmp_path, path)
+
+    print(f"coverage index: {len(concepts)} concepts, {len(ciks)} companies")
+    return len(concepts), len(ciks)
+
+
+class CoverageIndex:
+    """
+    Coverage index loaded in memory, queries are bitwise operations on the packed bitmap
+    """
+
+    def __init__(self, path=None):
+        path = path if path is not None else get_coverage_index_path()
+        with np.load(path) as data:
+            self.concepts = data["concepts"].tolist()
+            self.ciks = data["ciks"].tolist()
+            self.bitmap = data["bitmap"]
+            self.pair_concept = data["pair_concept"]
+            self.pair_company = data["pair_company"]
+            self.pair_first_date = data["pair_first_date"]
+            self.pair_last_date = data["pair_last_date"]
+
+        self.concept_index = {c: i for i, c in enumerate(self.concepts)}
+        self.cik_index = {c: i for i, c in enumerate(self.ciks)}
+
+    def get_cohort_bits(self, ciks=None):
+        """
+        Get the packed bits of a cohort of companies
+        :param ciks: list of ciks, None for all companies (ciks not in the index are skipped)
+        :return: uint8 array, same bit order as the rows of the bitmap
+        """
+        mask = np.zeros(len(self.ciks), dtype=bool)
+        if ciks is None:
+            mask[:] = True
+        else:
+            mask[[self.cik_index[c] for c in ciks if c in self.cik_index]] = True
+        return np.packbits(mask)
+
+    def count_companies(self, concepts=None, ciks=None):
+        """
+        Count the companies of a cohort reporting each concept
+        :param concepts: list of concepts, None for all concepts
+        :param ciks: list of ciks, None for all companies
+        :return: array of counts (same order as concepts)
+        """
+        rows = self.bitmap if concepts is None else self.bitmap[[self.concept_index[c] for c in concepts]]
+        return POPCOUNT[rows & self.get_cohort_bits(ciks)].sum(axis=1, dtype=np.int64)
+
+    def get_companies(self, concept):
+        """
+        Get the companies reporting a concept
+        :param concept: concept name
+        :return: list of ciks
+        """
+        bits = np.unpackbits(self.bitmap[self.concept_index[concept]])[:len(self.ciks)]
+        return [self.ciks[j] for j in np.flatnonzero(bits)]
+
+    def get_cohort_dates(self, ciks=None):
+        """
+        Get the first and last period end of every concept over the companies of a cohort
+        :param ciks: list of ciks, None for all companies
+        :return: (first dates, last dates) datetime64[D] arrays (same order as concepts), NaT for the concepts that
+        the cohort does not report
+        """
+        cohort_bits = self.get_cohort_bits(ciks)
+        in_cohort = np.unpackbits(cohort_bits)[:len(self.ciks)].astype(bool)
+        keep = in_cohort[self.pair_company]
+        concepts = self.pair_concept[keep]
+
+        # min / max on days since 1970, the sentinels are the concepts without pairs
+        first = np.full(len(self.concepts), np.iinfo(np.int64).max)
+        last = np.full(len(self.concepts), np.iinfo(np.int64).min)
+        np.minimum.at(first, concepts, self.pair_first_date[keep].astype(np.int64))
+        np.maximum.at(last, concepts, self.pair_last_date[keep].astype(np.int64))
+
+        nat = np.datetime64("NaT", "D")
+        first_date = np.where(first == np.iinfo(np.int64).max, nat, first.astype("datetime64[D]"))
+        last_date = np.where(last == np.iinfo(np.int64).min, nat, last.astype("datetime64[D]"))
+        return first_date, last_date
+
+    def get_cohort_concepts(self, ciks, min_share=0.0):
+        """
+        Which concepts does a cohort of companies use
+        :param ciks: list of ciks
+        :param min_share: keep only concepts reported by at least this share of the cohort
+        :return: DataFrame with concept, companies (number of companies of the cohort), share, first_date, last_date
+        (first and last period end reported by the companies of the cohort), sorted by companies
+        """
+        cohort_size = int(POPCOUNT[self.get_cohort_bits(ciks)].sum())
+        counts = self.count_companies(ciks=ciks)
+        first_date, last_date = self.get_cohort_dates(ciks)
+        df = pd.DataFrame({
+            "concept": self.concepts,
+            "companies": counts,
+            "share": counts / cohort_size if cohort_size > 0 else 0.0,
+            "first_date": first_date,
+            "last_date": last_date
+        })
+        df = df[(df.companies > 0) & (df.share >= min_share)]
+        return df.sort_values("companies", ascending=False).reset_index(drop=True)
+
+    def get_measure_coverage(self, measure, ciks=None):
+        """
+        Coverage of the concepts of a measure of measure_spec.MEASURES, in order of importance
+        :param measure: measure name
+        :param ciks: list of ciks, None for all companies
+        :return: DataFrame with concept, companies (reporting the concept), new_companies (reporting the concept but
+        none of the previous ones, i.e. the companies for which the concept is used)
+        """
+        spec = MEASURES[measure]
+        cohort_bits = self.get_cohort_bits(ciks)
+        covered = np.zeros_like(cohort_bits)
+
+        result = []
+        for c in spec["concepts"]:
+            concept = get_concept_name(spec.get("tax", "us-gaap"), c, spec.get("unit", "USD"))
+            if concept in self.concept_index:
+                bits = self.bitmap[self.concept_index[concept]] & cohort_bits
+            else:
+                bits = np.zeros_like(cohort_bits)
+            result.append({
+                "concept": concept,
+                "companies": int(POPCOUNT[bits].sum()),
+                "new_companies": int(POPCOUNT[bits & ~covered].sum())
+            })
+            covered |= bits
+
+        return pd.DataFrame(result, columns=["concept", "companies", "new_companies"])
+
+
+def get_coverage_index():
+    """
+    Get the coverage index shared by the process (loaded on first use)
+    :return: CoverageIndex
+    """
+    global _coverage_index
+    if _coverage_index is None:
+        _coverage_index = CoverageIndex()
+    return _coverage_index
+
+
+if __name__ == '__main__':
+    build_coverage_index()
@@ -7,7 +7,8 @@ from bs4 import BeautifulSoup
 from dateutil.relativedelta import relativedelta
 from pymongo.errors import DocumentTooLarge
 
-import mongodb
+import storage
+from financial_facts import get_facts_fingerprint
 
 AAPL_CIK = "0000320193"
 BABA_CIK = "0001577552"
@@ -37,7 +38,7 @@ def download_cik_ticker_map():
     response = make_edgar_request(CIK_TICKER_URL)
     r = response.json()
     r["_id"] = "cik_ticker"
-    mongodb.upsert_document("cik_ticker", r)
+    storage.upsert_document("cik_ticker", r)
 
 
 def get_df_cik_ticker_map():
@@ -46,7 +47,7 @@ def get_df_cik_ticker_map():
     :return: DataFrame
     """
     try:
-        cik_ticker = mongodb.get_collection_documents("cik_ticker").next()
+        cik_ticker = storage.get_document("cik_ticker", "cik_ticker", ["data", "fields"])
     except StopIteration:
         print("cik ticker document not found")
         return
@@ -92,7 +93,7 @@ def download_all_cik_submissions(cik):
     response = make_edgar_request(url)
     r = response.json()
     r["_id"] = cik
-    mongodb.upsert_document("submissions", r)
+    storage.upsert_document("submissions", r)
 
 
 def download_submissions_documents(cik, forms_to_download=("10-Q", "10-K", "8-K"), years=5):
@@ -105,7 +106,7 @@ def download_submissions_documents(cik, forms_to_download=("10-Q", "10-K", "8-K"
     :return:
     """
     try:
-        submissions = mongodb.get_document("submissions", cik)
+        submissions = storage.get_document("submissions", cik, ["cik", "filings.recent"])
     except StopIteration:
         print(f"submissions file not found in mongodb for {cik}")
         return
@@ -125,7 +126,7 @@ def download_submissions_documents(cik, forms_to_download=("10-Q", "10-K", "8-K"
         primary_document = filings["primaryDocument"][i]
         url = f"https://www.sec.gov/Archives/edgar/data/{cik_no_trailing}/{accession_no_symbols}/{primary_document}"
         # if we already have the document, we don't download it again
-        if mongodb.check_document_exists("documents", url):
+        if storage.check_document_exists("documents", url):
             continue
         print(f"{filing_date} ({form_type}): {url}")
         download_document(url, cik, form_type, filing_date)
@@ -144,9 +145,10 @@ def download_document(url, cik, form_type, filing_date, updated_at=None):
     """
     response = make_edgar_request(url)
     r = response.text
-    doc = {"html": r, "cik": cik, "form_type": form_type, "filing_date": filing_date, "updated_at": updated_at, "_id": url}
+    doc = {"html": r, "cik": cik, "form_type": form_type, "filing_date": filing_date, "updated_at": updated_at, "_id": url,
+           "inserted_at": datetime.datetime.utcnow()}
     try:
-        mongodb.insert_document("documents", doc)
+        storage.insert_document("documents", doc)
     except DocumentTooLarge:
         # DocumenTooLarge is raised by mongodb when uploading files larger than 16MB
         # To avoid this it is better to save this kind of files in a separate storate like S3 and retriving them when needed.
@@ -158,7 +160,8 @@ def download_document(url, cik, form_type, filing_date, updated_at=None):
 def download_financial_data(cik):
     """
     Download financial data for a company.
-    Upsert document on mongodb (each requests returns the entire history)
+    Upsert document on mongodb (each requests returns the entire history), unless its facts did not change: the stored
+    document (and its inserted_at) is left untouched, so cached extractions and the pipeline are not triggered again
     :param cik:
     :return:
     """
@@ -166,9 +169,20 @@ def download_financial_data(cik):
     response = make_edgar_request(url)
     try:
         r = response.json()
+        fingerprint = get_facts_fingerprint(r)
+
+        try:
+            stored = storage.get_document("financial_data", cik, ["facts_fingerprint"])
+            if stored.get("facts_fingerprint") == fingerprint:
+                return
+        except StopIteration:
+            pass
+
         r["_id"] = cik
         r["url"] = url
-        mongodb.upsert_document("financial_data", r)
+        r["inserted_at"] = datetime.datetime.utcnow()
+        r["facts_fingerprint"] = fingerprint
+        storage.upsert_document("financial_data", r)
     # ETFs, funds, trusts do not have financial information
     except:
         print(f"ERROR {cik} - {response} - {url}")
@@ -259,7 +273,7 @@ def get_latest_filings(form_type, start_date):
             url = f"https://www.sec.gov/{url.replace('/ix?doc=/','')}"
 
             # if we already have the document on mongodb we can skip
-            if mongodb.check_document_exists("documents", url):
+            if storage.check_document_exists("documents", url):
                 continue
 
             download_document(url, cik, entry_form_type, filed_date, entry_updated_at)
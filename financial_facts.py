@@ -0,0 +1,202 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+# columns of a companyfacts row (doc["facts"][tax][measure]["units"][unit] is a list of rows)
+FACT_COLUMNS = ["start", "end", "val", "accn", "fy", "fp", "form", "filed", "frame"]
+
+# frame is CY2022 (annual period), CY2022Q3 (quarterly period) or CY2022Q3I (instant at the end of the quarter)
+FRAME_PATTERN = r"^CY(\d{4})(?:Q(\d))?(I)?$"
+
+# as_of keys are period * PERIOD_KEY_FACTOR + filing day (days since 1970), facts without a filing date get the last day
+PERIOD_KEY_FACTOR = 2 ** 32
+UNKNOWN_FILED_DAY = 2 ** 32 - 1
+
+
+def get_facts_fingerprint(doc):
+    """
+    Fingerprint of the facts of a companyfacts document: two documents with the same facts have the same fingerprint,
+    whatever the order of their keys
+    :param doc: companyfacts document
+    :return: sha256 hex digest
+    """
+    facts = json.dumps(doc.get("facts", {}), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(facts.encode("utf-8")).hexdigest()
+
+
+def add_frame_columns(df):
+    """
+    Parse frame into integer columns: frame_year, frame_quarter (0 for annual frames) and frame_instant (bool).
+    Rows without a frame have year and quarter 0.
+    :param df: DataFrame with a frame column
+    :return: DataFrame with the new columns
+    """
+    parts = df["frame"].astype(object).where(df["frame"].notna(), "").str.extract(FRAME_PATTERN)
+    return df.assign(frame_year=pd.to_numeric(parts[0]).fillna(0).astype(int),
+                     frame_quarter=pd.to_numeric(parts[1]).fillna(0).astype(int),
+                     frame_instant=parts[2].notna().to_numpy())
+
+
+class FactTable:
+    """
+    All the facts of a companyfacts document (financial_data collection) in a single table, parsed once.
+    Columns: tax, measure, unit + FACT_COLUMNS, dates are parsed to datetime64 and val to numeric, frame is parsed to
+    frame_year, frame_quarter, frame_instant (see add_frame_columns).
+    Rows of a (tax, measure, unit) are contiguous and keep the order of the document, get() returns them as the
+    DataFrame that build_financial_df used to build from the raw document.
+    """
+
+    def __init__(self, doc):
+
+        # row: position of the row inside its (tax, measure, unit) list, index of the per measure DataFrames
+        columns = {c: [] for c in ["tax", "measure", "unit", "row"] + FACT_COLUMNS}
+        # (tax, measure, unit) -> (first row, last row + 1, whether the rows have a start date)
+        self.index = {}
+
+        # single pass over the raw document
+        n = 0
+        for tax, measures in doc.get("facts", {}).items():
+            for measure, measure_data in measures.items():
+                for unit, rows in measure_data.get("units", {}).items():
+                    has_start = False
+                    for i, row in enumerate(rows):
+                        columns["tax"].append(tax)
+                        columns["measure"].append(measure)
+                        columns["unit"].append(unit)
+                        columns["row"].append(i)
+                        for c in FACT_COLUMNS:
+                            columns[c].append(row.get(c))
+                        has_start = has_start or "start" in row
+                    self.index[(tax, measure, unit)] = (n, n + len(rows), has_start)
+                    n += len(rows)
+
+        df = pd.DataFrame(columns)
+        df["val"] = pd.to_numeric(df["val"])
+        for c in ["start", "end", "filed"]:
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+        df = add_frame_columns(df)
+
+        self.df = df
+        self._cache = {}
+        self._as_of_index = None
+
+    @classmethod
+    def from_rows(cls, df, index):
+        """
+        Build a FactTable from already parsed rows (e.g. a point in time view)
+        :param df: DataFrame with the columns of FactTable.df, rows of a measure contiguous
+        :param index: dictionary (tax, measure, unit) -> (first row, last row + 1, whether the rows have a start date)
+        :return: FactTable
+        """
+        table = cls.__new__(cls)
+        table.index = index
+        table.df = df
+        table._cache = {}
+        table._as_of_index = None
+        return table
+
+    def build_as_of_index(self):
+        """
+        Sort the facts by period (tax, measure, unit, start, end) and filing date, for as_of.
+        Only the most recent filing of a period has a frame in companyfacts: the frame is copied to all the filings
+        of the period.
+        :return: dictionary of arrays
+        """
+        df = self.df
+        period = df.groupby(["tax", "measure", "unit", "start", "end"], sort=False, dropna=False).ngroup().to_numpy()
+        num_periods = period.max() + 1 if len(period) > 0 else 0
+
+        # filing day, facts without a filing date are never known
+        filed = df["filed"].to_numpy().astype("datetime64[D]")
+        filed_day = np.where(np.isnat(filed), UNKNOWN_FILED_DAY, filed.astype(np.int64))
+
+        # sorted (period, filing day) keys, the last fact with key <= (period, day) is the one known at day
+        key = period.astype(np.int64) * PERIOD_KEY_FACTOR + filed_day
+        order = np.argsort(key, kind="stable")
+        sorted_key = key[order]
+        periods = np.arange(num_periods, dtype=np.int64) * PERIOD_KEY_FACTOR
+
+        period_frames = add_frame_columns(pd.DataFrame({"frame": df.groupby(period, sort=False)["frame"]
+                                                       .transform("first").to_numpy()}))
+
+        # measure of each row, rows of a measure are contiguous
+        measure_keys = list(self.index.keys())
+        measure_ids = np.repeat(np.arange(len(measure_keys)), [end - start for start, end, _ in self.index.values()])
+
+        return {
+            "order": order,
+            "sorted_key": sorted_key,
+            "periods": periods,
+            "period_first": np.searchsorted(sorted_key, periods, side="left"),
+            "period_frames": period_frames,
+            "measure_keys": measure_keys,
+            "measure_ids": measure_ids
+        }
+
+    def as_of(self, date):
+        """
+        Get the facts known at a date: for each period the value of the last filing filed on or before the date.
+        The index is built on first use, then every snapshot is a single searchsorted.
+        :param date: date (str, datetime or Timestamp)
+        :return: FactTable
+        """
+        if self._as_of_index is None:
+            self._as_of_index = self.build_as_of_index()
+        a = self._as_of_index
+
+        day = np.datetime64(pd.Timestamp(date).date(), "D").astype(np.int64)
+        last = np.searchsorted(a["sorted_key"], a["periods"] + day, side="right") - 1
+        known = last >= a["period_first"]
+        rows = np.sort(a["order"][last[known]])
+
+        df = self.df.iloc[rows].copy()
+        for c in ["frame", "frame_year", "frame_quarter", "frame_instant"]:
+            df[c] = a["period_frames"][c].to_numpy()[rows]
+        df = df.reset_index(drop=True)
+
+        # rows stay in document order, so the rows of a measure are still contiguous
+        measure_ids = a["measure_ids"][rows]
+        starts = np.flatnonzero(np.r_[True, measure_ids[1:] != measure_ids[:-1]]) if len(rows) > 0 else []
+        ends = np.r_[starts[1:], len(rows)] if len(rows) > 0 else []
+        index = {}
+        for start, end in zip(starts, ends):
+            key = a["measure_keys"][measure_ids[start]]
+            index[key] = (int(start), int(end), self.index[key][2])
+
+        return FactTable.from_rows(df, index)
+
+    def select(self, keys):
+        """
+        Get the rows of many measures (all rows, also the ones without a frame)
+        :param keys: list of (tax, measure, unit), missing measures are skipped
+        :return: DataFrame, rows of each measure are contiguous and in document order
+        """
+        ranges = [np.arange(self.index[k][0], self.index[k][1]) for k in keys if k in self.index]
+        return self.df.iloc[np.concatenate(ranges) if len(ranges) > 0 else []]
+
+    def get(self, measure, unit="USD", tax="us-gaap"):
+        """
+        Get the facts of a measure with a frame (same result as build_financial_df on the raw document).
+        The DataFrame is built once and shared by all callers: it must not be modified.
+        :param measure: measure we are interest in
+        :param unit: unit of measure
+        :param tax: taxonomy
+        :return: DataFrame, None if the company does not have the measure
+        """
+        key = (tax, measure, unit)
+        if key in self._cache:
+            return self._cache[key]
+
+        if key not in self.index:
+            df = None
+        else:
+            start, end, has_start = self.index[key]
+            df = self.df.iloc[start:end]
+            df = df[~df.frame.isna()]
+            drop = ["tax", "measure", "unit", "row"] if has_start else ["tax", "measure", "unit", "row", "start"]
+            df = df.set_index(df["row"].to_numpy()).drop(columns=drop)
+
+        self._cache[key] = df
+        return df
@@ -0,0 +1,670 @@
+# Declarative spec of the financial measures extracted from companyfacts documents (financial_data collection).
+#
+# MEASURES: measure name -> {
+#     "concepts": us-gaap (or other taxonomy) concepts in order of importance: for every value (ttm, most recent, year)
+#                 the first concept that has it wins (see quantitative_analysis.ExtractionPlan),
+#     "values": values to compute, among MOST_RECENT, TTM, YEARLY,
+#     "instant": True for balance sheet (snapshot) measures, False for income/cashflow statement (period) measures,
+#     "unit": unit of the concepts (default USD),
+#     "tax": taxonomy of the concepts (default us-gaap)
+# }
+# A measure without concepts starts empty and is built by the steps.
+#
+# STEPS: run in order after the measures are built
+#     (YEARLY, superset, subsets, must_include)  ->  merge_subsets_yearly
+#     (MOST_RECENT, superset, subsets)           ->  merge_subsets_most_recent on the most recent values
+#     (TTM, superset, subsets)                   ->  merge_subsets_most_recent on the ttm values
+#     (HOOK, name)                               ->  adjustments that are not merges (quantitative_analysis.EXTRACTION_HOOKS)
+#
+# OUTPUTS: key of extract_company_financial_information result -> (measure, value). CONTEXT values are the last annual
+# report date/fy (from ANNUAL_REPORT_MEASURE) and the quarter of the annual report (from ANNUAL_REPORT_QUARTER_MEASURES)
+# used by the yearly values of instant measures.
+#
+# Adding a metric is adding its measures, steps and outputs here: quantitative_analysis.ExtractionPlan reads every
+# concept once, whatever the number of measures using it.
+
+MOST_RECENT = "mr"
+TTM = "ttm"
+YEARLY = "yearly"
+HOOK = "hook"
+CONTEXT = "context"
+
+BALANCE_SHEET = {"instant": True, "values": [MOST_RECENT, YEARLY]}
+BALANCE_SHEET_MOST_RECENT = {"instant": True, "values": [MOST_RECENT]}
+
+ANNUAL_REPORT_MEASURE = "revenue"
+ANNUAL_REPORT_QUARTER_MEASURES = ["equity", "equity_no_mi"]
+
+MEASURES = {
+
+    #### Income statement ####
+
+    "revenue": {"values": [TTM, YEARLY], "concepts": [
+        "Revenues",
+        "RevenueFromContractWithCustomerExcludingAssessedTax",
+        "RevenueFromContractWithCustomerIncludingAssessedTax",
+        "SalesRevenueNet"
+    ]},
+
+    # R and D
+    "rd": {"values": [YEARLY], "concepts": ["ResearchAndDevelopmentExpense"]},
+    "rd_not_inprocess": {"values": [YEARLY], "concepts": ["ResearchAndDevelopmentExpenseExcludingAcquiredInProcessCost"]},
+    "rd_inprocess": {"values": [YEARLY], "concepts": ["ResearchAndDevelopmentInProcess"]},
+
+    # Net Income
+    "net_income": {"values": [TTM, YEARLY], "concepts": [
+        "NetIncomeLoss",
+        "NetIncomeLossAvailableToCommonStockholdersBasic",
+        "NetIncomeLossAvailableToCommonStockholdersDiluted",
+        "ComprehensiveIncomeNetOfTax",
+        "IncomeLossFromContinuingOperations",
+
+        # including minority interest
+        "ProfitLoss",
+        "IncomeLossFromContinuingOperationsIncludingPortionAttributableToNoncontrollingInterest",
+        "IncomeLossFromSubsidiariesNetOfTax"
+    ]},
+
+    # Interest Expenses
+    "interest_expenses": {"values": [TTM], "concepts": [
+        "InterestExpense",
+        "InterestAndDebtExpense",
+        "InterestPaid",
+        "InterestPaidNet",
+        "InterestCostsIncurred"
+    ]},
+
+    # Gross Profit
+    "gross_profit": {"values": [TTM, YEARLY], "concepts": ["Gross Profit"]},
+
+    # Depreciation
+    "depreciation_amortization": {"values": [YEARLY], "concepts": [
+        "DepreciationDepletionAndAmortization",
+        "DepreciationAmortizationAndAccretionNet"
+    ]},
+    "depreciation": {"values": [YEARLY], "concepts": ["Depreciation"]},
+    "amortization_fincost_disc": {"values": [YEARLY], "concepts": ["AmortizationOfFinancingCostsAndDiscounts"]},
+    "amortization_disc": {"values": [YEARLY], "concepts": ["AmortizationOfDebtDiscountPremium"]},
+    "amortization_fincost": {"values": [YEARLY], "concepts": ["AmortizationOfFinancingCosts"]},
+    "amortization_charges": {"values": [YEARLY], "concepts": ["AmortizationOfDeferredCharges"]},
+    "amortization_comm": {"values": [YEARLY], "concepts": ["AmortizationOfDeferredSalesCommissions"]},
+    "amortization_intan": {"values": [YEARLY], "concepts": ["AmortizationOfIntangibleAssets"]},
+    "amortization": {"values": [YEARLY], "concepts": []},
+
+    # EBIT
+    "ebit": {"values": [TTM, YEARLY], "concepts": [
+        "OperatingIncomeLoss",
+        "IncomeLossFromContinuingOperationsBeforeInterestExpenseInterestIncomeIncomeTaxesExtraordinaryItemsNoncontrollingInterestsNet",
+        "IncomeLossFromContinuingOperationsBeforeIncomeTaxesMinorityInterestAndIncomeLossFromEquityMethodInvestments",
+        "IncomeLossFromContinuingOperationsBeforeIncomeTaxesExtraordinaryItemsNoncontrollingInterest",
+        "IncomeLossFromContinuingOperationsBeforeIncomeTaxesForeign",
+        "IncomeLossFromContinuingOperationsBeforeIncomeTaxesDomestic",
+    ]},
+
+    #### Equity ####
+
+    "equity": {**BALANCE_SHEET, "concepts": ["StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest"]},
+    "equity_no_mi": {**BALANCE_SHEET, "concepts": ["StockholdersEquity"]},
+    "minority_interest": {**BALANCE_SHEET, "concepts": ["MinorityInterest"]},
+
+    #### Shares ####
+
+    "shares": {**BALANCE_SHEET, "unit": "shares", "tax": "dei", "concepts": ["EntityCommonStockSharesOutstanding"]},
+    "common_shares": {**BALANCE_SHEET, "unit": "shares", "concepts": ["CommonStockSharesOutstanding"]},
+    "average_shares": {"values": [MOST_RECENT, YEARLY], "unit": "shares",
+                       "concepts": ["WeightedAverageNumberOfSharesOutstandingBasic"]},
+
+    #### Current Assets ####
+
+    # Cash
+    "cash_and_restricted": {**BALANCE_SHEET,
+                            "concepts": ["CashCashEquivalentsRestrictedCashAndRestrictedCashEquivalents"]},
+    "cash": {**BALANCE_SHEET, "concepts": ["CashAndCashEquivalentsAtCarryingValue", "Cash"]},
+    "restricted_cash": {**BALANCE_SHEET, "concepts": [
+        "RestrictedCashAndCashEquivalentsAtCarryingValue",
+        "RestrictedCashAndCashEquivalents",
+        "RestrictedCash",
+        "RestrictedCashAndInvestmentsCurrent",
+        "RestrictedCashCurrent"
+    ]},
+
+    # Inventory
+    "inventory": {**BALANCE_SHEET, "concepts": [
+        "InventoryNet",
+        "InventoryGross",
+        "FIFOInventoryAmount",
+        "InventoryLIFOReserve",
+        "LIFOInventoryAmount",
+    ]},
+    "inventory_retail": {**BALANCE_SHEET, "concepts": [
+        "RetailRelatedInventory",
+        "RetailRelatedInventoryMerchandise"
+    ]},
+    "inventory_energy": {**BALANCE_SHEET, "concepts": ["EnergyRelatedInventory"]},
+    "inventory_utilities": {**BALANCE_SHEET, "concepts": ["PublicUtilitiesInventory"]},
+    "inventory_re": {**BALANCE_SHEET, "concepts": ["InventoryRealEstate"]},
+    "inventory_airline": {**BALANCE_SHEET, "concepts": ["AirlineRelatedInventory"]},
+
+    # Other Assets
+    "other_current_assets": {**BALANCE_SHEET, "concepts": [
+        "OtherAssetsCurrent",
+        "OtherAssetsMiscellaneousCurrent",
+        "PrepaidExpenseAndOtherAssetsCurrent",
+        "OtherAssetsFairValueDisclosure",
+        "OtherAssetsMiscellaneous",
+        "PrepaidExpenseAndOtherAssets"
+    ]},
+    "prepaid_exp": {**BALANCE_SHEET, "concepts": ["PrepaidExpenseCurrent"]},
+    "prepaid_ins": {**BALANCE_SHEET, "concepts": ["PrepaidInsurance"]},
+    "prepaid_tax": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "PrepaidTaxes",
+        "IncomeTaxesReceivable",
+        "IncomeTaxReceivable"
+    ]},
+
+    # Receivables
+    "receivables": {**BALANCE_SHEET, "concepts": [
+        "AccountsAndOtherReceivablesNetCurrent",
+        "AccountsNotesAndLoansReceivableNetCurrent",
+        "ReceivablesNetCurrent",
+        "NontradeReceivablesCurrent"
+    ]},
+    "ar": {**BALANCE_SHEET, "concepts": [
+        "AccountsReceivableNetCurrent",
+        "AccountsReceivableNet",
+        "AccountsReceivableGrossCurrent",
+        "AccountsReceivableGross"
+    ]},
+    "loans_rec": {**BALANCE_SHEET, "concepts": [
+        "LoansAndLeasesReceivableNetReportedAmount",
+        "LoansAndLeasesReceivableNetOfDeferredIncome",
+        "LoansReceivableFairValueDisclosure",
+        "LoansAndLeasesReceivableGrossCarryingAmount"
+    ]},
+    "notes_rec": {**BALANCE_SHEET, "concepts": [
+        "NotesReceivableNet",
+        "NotesReceivableFairValueDisclosure",
+        "NotesReceivableGross"
+    ]},
+
+    # Securities
+    "securities": {**BALANCE_SHEET, "concepts": [
+        "MarketableSecurities"
+        "AvailableForSaleSecurities"
+    ]},
+    "debt_securities": {**BALANCE_SHEET, "concepts": ["AvailableForSaleSecuritiesDebtSecurities"]},
+    "equity_securities": {**BALANCE_SHEET, "concepts": ["AvailableForSaleSecuritiesEquitySecurities"]},
+    "derivatives": {**BALANCE_SHEET, "concepts": [
+        "DerivativeAssets",
+        "DerivativeAssetsCurrent"
+    ]},
+    "held_securities": {**BALANCE_SHEET, "concepts": [
+        "HeldToMaturitySecurities",
+        "HeldToMaturitySecuritiesFairValue",
+        "HeldToMaturitySecuritiesCurrent",
+    ]},
+    "non_curr_securities": {**BALANCE_SHEET, "concepts": [
+        "AvailableForSaleSecuritiesNoncurrent",
+        "AvailableForSaleSecuritiesDebtSecuritiesNoncurrent",
+    ]},
+    "marketable_securities_cur": {**BALANCE_SHEET, "concepts": [
+        "MarketableSecuritiesCurrent",
+        "AvailableForSaleSecuritiesDebtSecuritiesCurrent"
+    ]},
+    "st_investments": {**BALANCE_SHEET, "concepts": ["ShortTermInvestments"]},
+    "money_market": {**BALANCE_SHEET, "concepts": ["MoneyMarketFundsAtCarryingValue"]},
+
+    #### Non-Current Assets ####
+
+    # Equity Investments
+    "equity_investments": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "EquityMethodInvestmentAggregateCost",
+        "EquityMethodInvestments",
+        "InvestmentOwnedAtCost",
+        "Investments",
+        "InvestmentsInAffiliatesSubsidiariesAssociatesAndJointVentures",
+    ]},
+    "equity_investments_fv": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "EquityMethodInvestmentsFairValueDisclosure",
+        "InvestmentOwnedAtFairValue",
+        "InvestmentsFairValueDisclosure",
+    ]},
+    "equity_investments_not_fv": {**BALANCE_SHEET_MOST_RECENT,
+                                  "concepts": ["EquitySecuritiesWithoutReadilyDeterminableFairValueAmount"]},
+    "marketable_securities_non_curr": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["MarketableSecuritiesNoncurrent"]},
+
+    # Other financial assets
+    "prepaid_non_curr": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "PrepaidExpenseNoncurrent",
+        "PrepaidExpenseOtherNoncurrent",
+    ]},
+    "restricted_cash_non_curr": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "RestrictedCashAndCashEquivalentsNoncurrent",
+        "RestrictedCashAndInvestmentsNoncurrent",
+        "RestrictedCashNoncurrent"
+    ]},
+    "derivatives_non_curr": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["DerivativeAssetsNoncurrent"]},
+    "escrow": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["EscrowDeposit"]},
+    "other_financial_assets": {**BALANCE_SHEET_MOST_RECENT, "concepts": []},
+
+    # PP&E
+    "ppe": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "PropertyPlantAndEquipmentNet",
+        "PropertyPlantAndEquipmentAndFinanceLeaseRightOfUseAssetAfterAccumulatedDepreciationAndAmortization"
+    ]},
+
+    # Investment property
+    "investment_property": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "RealEstateInvestments",
+        "RealEstateInvestmentPropertyNet",
+        "RealEstateInvestmentPropertyAtCost",
+        "RealEstateHeldforsale"
+    ]},
+    "buildings": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["InvestmentBuildingAndBuildingImprovements"]},
+    "land": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "LandAndLandImprovements",
+        "Land",
+    ]},
+
+    # Tax Benefits
+    "tax_benefits": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "UnrecognizedTaxBenefits",
+        "UnrecognizedTaxBenefitsThatWouldImpactEffectiveTaxRate",
+        "IncomeTaxesReceivableNoncurrent",
+    ]},
+
+    #### Debt ####
+
+    # DEBT LONG + SHORT
+    "debt": {**BALANCE_SHEET, "concepts": ["DebtLongtermAndShorttermCombinedAmount"]},
+    "mortgage": {**BALANCE_SHEET, "concepts": ["MortgageLoansOnRealEstate"]},
+    "other_borrowings": {**BALANCE_SHEET, "concepts": ["OtherBorrowings"]},
+
+    # DEBT SHORT
+    "debt_st": {**BALANCE_SHEET, "concepts": [
+        "ShortTermBorrowings",
+        "ShorttermDebtAverageOutstandingAmount",
+        "ShorttermDebtFairValue",
+    ]},
+    "commercial_paper": {**BALANCE_SHEET, "concepts": [
+        "CommercialPaper",
+        "CommercialPaperAtCarryingValue",
+    ]},
+    "overdraft": {**BALANCE_SHEET, "concepts": ["BankOverdrafts"]},
+    "loans_st": {**BALANCE_SHEET, "concepts": ["ShortTermBankLoansAndNotesPayable"]},
+    "bridge_loan": {**BALANCE_SHEET, "concepts": ["BridgeLoan"]},
+
+    # DEBT LONG
+    "debt_lt": {**BALANCE_SHEET, "concepts": [
+        "LongTermDebtAndCapitalLeaseObligationsIncludingCurrentMaturities",
+        "LongTermDebt",
+        "LongTermDebtFairValue",
+        "DebtInstrumentFaceAmount",
+        "DebtInstrumentCarryingAmount",
+    ]},
+    "convertible": {**BALANCE_SHEET, "concepts": [
+        "ConvertibleDebt",
+        "ConvertibleNotesPayable",
+    ]},
+    "revolver": {**BALANCE_SHEET, "concepts": [
+        "LineOfCredit",
+        "LineOfCreditFacilityFairValueOfAmountOutstanding",
+    ]},
+    "loans_payable": {**BALANCE_SHEET, "concepts": ["LoansPayable"]},
+    "debt_secured": {**BALANCE_SHEET, "concepts": ["SecuredDebt"]},
+    "debt_notes": {**BALANCE_SHEET, "concepts": [
+        "NotesPayable",
+        "SeniorNotes"
+    ]},
+    "debt_unsecured": {**BALANCE_SHEET, "concepts": ["UnsecuredDebt"]},
+
+    # DEBT LONG - CURRENT
+    "debt_lt_cur": {**BALANCE_SHEET, "concepts": [
+        "LongTermDebtAndCapitalLeaseObligationsCurrent",
+        "LongTermDebtCurrent",
+    ]},
+    "convertible_cur": {**BALANCE_SHEET, "concepts": [
+        "ConvertibleDebtCurrent",
+        "ConvertibleNotesPayableCurrent",
+    ]},
+    "revolver_cur": {**BALANCE_SHEET, "concepts": ["LinesOfCreditCurrent"]},
+    "notes_cur": {**BALANCE_SHEET, "concepts": [
+        "NotesPayableCurrent",
+        "SeniorNotesCurrent"
+    ]},
+    "debt_secured_cur": {**BALANCE_SHEET, "concepts": ["SecuredDebtCurrent"]},
+    "debt_unsecured_cur": {**BALANCE_SHEET, "concepts": ["UnsecuredDebtCurrent"]},
+
+    # DEBT LONG - NON CURRENT
+    "debt_lt_noncur": {**BALANCE_SHEET, "concepts": [
+        "LongTermDebtAndCapitalLeaseObligations",
+        "LongTermDebtNoncurrent",
+    ]},
+    "convertible_noncur": {**BALANCE_SHEET, "concepts": [
+        "ConvertibleDebtNoncurrent",
+        "ConvertibleLongTermNotesPayable",
+    ]},
+    "revolver_noncur": {**BALANCE_SHEET, "concepts": ["LongTermLineOfCredit"]},
+    "notes_noncur": {**BALANCE_SHEET, "concepts": [
+        "LongTermNotesPayable",
+        "SeniorLongTermNotes"
+    ]},
+    "debt_secured_noncur": {**BALANCE_SHEET, "concepts": ["SecuredLongTermDebt"]},
+    "debt_unsecured_noncur": {**BALANCE_SHEET, "concepts": ["UnsecuredLongTermDebt"]},
+
+    #### Liabilities ####
+
+    "liabilities": {**BALANCE_SHEET_MOST_RECENT, "concepts": [
+        "Liabilities",
+        "LiabilitiesFairValueDisclosure",
+        "LiabilitiesAssumed1",
+    ]},
+    "derivatives_liability": {**BALANCE_SHEET, "concepts": ["DerivativeLiabilities"]},
+    "ap": {**BALANCE_SHEET, "concepts": [
+        "AccountsPayableAndAccruedLiabilitiesCurrentAndNoncurrent",
+        "AccountsPayableCurrentAndNoncurrent",
+    ]},
+    "due_related_parties": {**BALANCE_SHEET, "concepts": ["DueToRelatedPartiesCurrentAndNoncurrent"]},
+    "due_affiliates": {**BALANCE_SHEET, "concepts": ["DueToAffiliateCurrentAndNoncurrent"]},
+
+    # Current
+    "liabilities_cur": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["LiabilitiesCurrent"]},
+    "ap_complete_cur": {**BALANCE_SHEET, "concepts": [
+        "AccountsPayableAndOtherAccruedLiabilitiesCurrent",
+        "AccountsPayableAndAccruedLiabilitiesCurrent",
+    ]},
+    "ap_cur": {**BALANCE_SHEET, "concepts": ["AccountsPayableCurrent"]},
+    "apother_cur": {**BALANCE_SHEET, "concepts": ["AccountsPayableOtherCurrent"]},
+    "ap_rel_cur": {**BALANCE_SHEET, "concepts": ["AccountsPayableRelatedPartiesCurrent"]},
+    "ap_trade_cur": {**BALANCE_SHEET, "concepts": ["AccountsPayableTradeCurrent"]},
+    "due_affiliates_cur": {**BALANCE_SHEET, "concepts": ["DueToAffiliateCurrent"]},
+    "due_related_cur": {**BALANCE_SHEET, "concepts": ["DueToRelatedPartiesCurrent"]},
+    "derivatives_liability_cur": {**BALANCE_SHEET, "concepts": ["DerivativeLiabilitiesCurrent"]},
+
+    # Non - Current
+    "liabilities_noncur": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["LiabilitiesNoncurrent"]},
+    "derivatives_liability_noncur": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["DerivativeLiabilitiesNoncurrent"]},
+    "due_affiliates_noncur": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["DueToAffiliateNoncurrent"]},
+    "due_related_noncur": {**BALANCE_SHEET_MOST_RECENT, "concepts": ["DueToRelatedPartiesNoncurrent"]},
+
+    # liabilities ex debt + debt, used when more recent than (or greater than) total liabilities
+    "combo_liabilities": {**BALANCE_SHEET_MOST_RECENT, "concepts": []},
+
+    #### Cashflow statement ####
+
+    # DIVIDENDS
+    "dividends": {"values": [TTM, YEARLY], "concepts": [
+        "Dividends",
+        "DividendsCash",
+        "PaymentsOfDividends",
+        "PaymentsOfOrdinaryDividends"
+    ]},
+    "dividends_cs": {"values": [TTM, YEARLY], "concepts": [
+        "DividendsCommonStock",
+        "DividendsCommonStockCash",
+        "PaymentsOfDividendsCommonStock"
+    ]},
+    "dividends_ps": {"values": [TTM, YEARLY], "concepts": [
+        "DividendsPreferredStock",
+        "DividendsPreferredStockCash",
+        "PaymentsOfDividendsPreferredStockAndPreferenceStock"
+    ]},
+
+    # CAPEX - Acquisition
+    "acquisition_costs": {"values": [YEARLY], "concepts": ["BusinessAcquisitionCostOfAcquiredEntityTransactionCosts"]},
+    "acquisition_adj": {"values": [YEARLY], "concepts": [
+        "PaymentsForPreviousAcquisition",
+        "PaymentsForProceedsFromPreviousAcquisition",
+    ]},
+    "acquisition": {"values": [YEARLY], "concepts": [
+        "PaymentsToAcquireBusinessesNetOfCashAcquired",
+        "PaymentsToAcquireBusinessesGross",
+    ]},
+    "acquisition2": {"values": [YEARLY], "concepts": ["PaymentsToAcquireBusinessTwoNetOfCashAcquired"]},
+    "sub_aff": {"values": [YEARLY], "concepts": ["PaymentsToAcquireInterestInSubsidiariesAndAffiliates"]},
+    "sub": {"values": [YEARLY], "concepts": ["PaymentsToAcquireAdditionalInterestInSubsidiaries"]},
+    "aff": {"values": [YEARLY], "concepts": ["PaymentsToAcquireBusinessesAndInterestInAffiliates"]},
+    "jv": {"values": [YEARLY], "concepts": ["PaymentsToAcquireInterestInJointVenture"]},
+
+    # CAPEX - PP&E
+    "capex_not_paid": {"values": [YEARLY], "concepts": ["CapitalExpendituresIncurredButNotYetPaid"]},
+    "capex_imp": {"values": [YEARLY], "concepts": ["PaymentsForCapitalImprovements"]},
+    "productive_assets_other": {"values": [YEARLY], "concepts": ["PaymentsToAcquireOtherProductiveAssets"]},
+    "ppe_other": {"values": [YEARLY], "concepts": ["PaymentsToAcquireOtherPropertyPlantAndEquipment"]},
+    "productive_assets": {"values": [YEARLY], "concepts": ["PaymentsToAcquireProductiveAssets"]},
+    "ppe_payments": {"values": [YEARLY], "concepts": ["PaymentsToAcquirePropertyPlantAndEquipment"]},
+    "sw": {"values": [YEARLY], "concepts": ["PaymentsForSoftware"]},
+    "sw_dev": {"values": [YEARLY], "concepts": ["PaymentsToDevelopSoftware"]},
+
+    # CAPEX - Intangibles
+    "intangibles": {"values": [YEARLY], "concepts": ["PaymentsToAcquireIntangibleAssets"]},
+
+    "capex": {"values": [YEARLY], "concepts": []},
+
+    #### Operating leases ####
+
+    # Last year expenses
+    "op_leases_expense": {"values": [TTM], "concepts": [
+        "OperatingLeasePayments",
+        "OperatingLeaseCost",
+        "OperatingLeaseExpense",
+    ]},
+    # Next years expenses
+    "op_leases_next_year": {"values": [MOST_RECENT], "concepts": [
+        "LesseeOperatingLeaseLiabilityPaymentsDueNextTwelveMonths",
+        "OperatingLeasesFutureMinimumPaymentsDueCurrent",
+        "LesseeOperatingLeaseLiabilityPaymentsDueNextRollingTwelveMonths",
+    ]},
+    "op_leases_next_2year": {"values": [MOST_RECENT], "concepts": [
+        "LesseeOperatingLeaseLiabilityPaymentsDueYearTwo",
+        "OperatingLeasesFutureMinimumPaymentsDueInTwoYears",
+        "LesseeOperatingLeaseLiabilityPaymentsDueInRollingYearTwo",
+    ]},
+    "op_leases_next_3year": {"values": [MOST_RECENT], "concepts": [
+        "LesseeOperatingLeaseLiabilityPaymentsDueYearThree",
+        "OperatingLeasesFutureMinimumPaymentsDueInThreeYears",
+        "LesseeOperatingLeaseLiabilityPaymentsDueInRollingYearThree",
+    ]},
+    "op_leases_next_4year": {"values": [MOST_RECENT], "concepts": [
+        "LesseeOperatingLeaseLiabilityPaymentsDueYearFour",
+        "OperatingLeasesFutureMinimumPaymentsDueInFourYears",
+        "LesseeOperatingLeaseLiabilityPaymentsDueInRollingYearFour",
+    ]},
+    "op_leases_next_5year": {"values": [MOST_RECENT], "concepts": [
+        "LesseeOperatingLeaseLiabilityPaymentsDueYearFive",
+        "OperatingLeasesFutureMinimumPaymentsDueInFiveYears",
+        "LesseeOperatingLeaseLiabilityPaymentsDueInRollingYearFive",
+    ]},
+    "op_leases_after_5year": {"values": [MOST_RECENT], "concepts": [
+        "LesseeOperatingLeaseLiabilityPaymentsDueAfterYearFive",
+        "OperatingLeasesFutureMinimumPaymentsDueThereafter",
+        "LesseeOperatingLeaseLiabilityPaymentsDueAfterRollingYearFive",
+    ]},
+
+    #### Options ####
+
+    "sbc": {"values": [MOST_RECENT], "concepts": [
+        "EmployeeServiceShareBasedCompensationNonvestedAwardsTotalCompensationCostNotYetRecognized",
+    ]},
+    "sbc_options": {"values": [MOST_RECENT], "concepts": [
+        "EmployeeServiceShareBasedCompensationNonvestedAwardsTotalCompensationCostNotYetRecognizedStockOptions",
+        "ShareBasedCompensationArrangementByShareBasedPaymentAwardOptionsOutstandingIntrinsicValue",
+        "ShareBasedCompensationArrangementByShareBasedPaymentAwardOptionsVestedAndExpectedToVestOutstandingAggregateIntrinsicValue",
+        "ShareBasedCompensationArrangementByShareBasedPaymentAwardOptionsVestedAndExpectedToVestExercisableAggregateIntrinsicValue",
+        "SharebasedCompensationArrangementBySharebasedPaymentAwardOptionsExercisableIntrinsicValue1",
+    ]},
+    "sbc_non_options": {"values": [MOST_RECENT], "concepts": [
+        "EmployeeServiceShareBasedCompensationNonvestedAwardsTotalCompensationCostNotYetRecognizedShareBasedAwardsOtherThanOptions",
+        "SharebasedCompensationArrangementBySharebasedPaymentAwardEquityInstrumentsOtherThanOptionsAggregateIntrinsicValueOutstanding",
+        "SharebasedCompensationArrangementBySharebasedPaymentAwardEquityInstrumentsOtherThanOptionsAggregateIntrinsicValueNonvested",
+    ]},
+}
+
+STEPS = [
+
+    #### Income statement ####
+    (YEARLY, "rd", ["rd_not_inprocess", "rd_inprocess"], None),
+    (YEARLY, "amortization_fincost_disc", ["amortization_disc", "amortization_fincost"], None),
+    (YEARLY, "amortization", ["amortization_fincost_disc", "amortization_charges", "amortization_comm",
+                              "amortization_intan"], None),
+    (YEARLY, "depreciation_amortization", ["depreciation", "amortization"], None),
+
+    #### Equity ####
+    (YEARLY, "equity", ["equity_no_mi", "minority_interest"], (0,)),
+    (HOOK, "equity_most_recent"),
+
+    #### Shares ####
+    (MOST_RECENT, "shares", ["common_shares"]),
+    (MOST_RECENT, "shares", ["average_shares"]),
+    (YEARLY, "common_shares", ["average_shares"], None),
+    (YEARLY, "shares", ["common_shares"], None),
+    (HOOK, "shares_unit"),
+
+    #### Current Assets ####
+    (YEARLY, "cash_and_restricted", ["cash", "restricted_cash"], (0,)),
+    (HOOK, "cash_most_recent"),
+    (MOST_RECENT, "inventory", ["inventory_retail", "inventory_airline", "inventory_energy", "inventory_re",
+                                "inventory_utilities"]),
+    (YEARLY, "inventory", ["inventory_retail", "inventory_airline", "inventory_energy", "inventory_re",
+                           "inventory_utilities"], None),
+    (YEARLY, "other_current_assets", ["prepaid_exp", "prepaid_ins", "prepaid_tax"], None),
+    (MOST_RECENT, "other_current_assets", ["prepaid_exp", "prepaid_ins", "prepaid_tax"]),
+    (YEARLY, "receivables", ["ar", "loans_rec", "notes_rec"], None),
+    (MOST_RECENT, "receivables", ["ar", "loans_rec", "notes_rec"]),
+    (YEARLY, "securities", ["debt_securities", "equity_securities"], None),
+    (MOST_RECENT, "securities", ["debt_securities", "equity_securities"]),
+    (YEARLY, "securities", ["derivatives", "held_securities", "non_curr_securities", "marketable_securities_cur",
+                            "st_investments", "money_market"], None),
+    (MOST_RECENT, "securities", ["derivatives", "held_securities", "non_curr_securities", "marketable_securities_cur",
+                                 "st_investments", "money_market"]),
+
+    #### Non-Current Assets ####
+    (MOST_RECENT, "equity_investments", ["equity_investments_fv", "equity_investments_not_fv"]),
+    (MOST_RECENT, "equity_investments", ["marketable_securities_non_curr"]),
+    (MOST_RECENT, "other_financial_assets", ["prepaid_non_curr", "restricted_cash_non_curr", "derivatives_non_curr",
+                                             "escrow"]),
+    (MOST_RECENT, "investment_property", ["buildings", "land"]),
+
+    #### Debt ####
+    (YEARLY, "debt_st", ["commercial_paper", "overdraft", "bridge_loan", "loans_st"], None),
+    (YEARLY, "debt_lt", ["convertible", "revolver", "loans_payable", "debt_secured", "debt_notes", "debt_unsecured"],
+     None),
+    (YEARLY, "debt_lt_cur", ["convertible_cur", "revolver_cur", "notes_cur", "debt_secured_cur", "debt_unsecured_cur"],
+     None),
+    (YEARLY, "debt_lt_noncur", ["convertible_noncur", "revolver_noncur", "notes_noncur", "debt_secured_noncur",
+                                "debt_unsecured_noncur"], None),
+    (YEARLY, "debt_lt", ["debt_lt_cur", "debt_lt_noncur"], None),
+    (YEARLY, "debt", ["debt_lt", "debt_st"], None),
+    (YEARLY, "debt", ["debt", "mortgage", "other_borrowings"], (0,)),
+    (MOST_RECENT, "debt_st", ["commercial_paper", "overdraft", "bridge_loan", "loans_st"]),
+    (MOST_RECENT, "debt_lt", ["convertible", "revolver", "loans_payable", "debt_secured", "debt_notes",
+                              "debt_unsecured"]),
+    (MOST_RECENT, "debt_lt_cur", ["convertible_cur", "revolver_cur", "notes_cur", "debt_secured_cur",
+                                  "debt_unsecured_cur"]),
+    (MOST_RECENT, "debt_lt_noncur", ["convertible_noncur", "revolver_noncur", "notes_noncur", "debt_secured_noncur",
+                                     "debt_unsecured_noncur"]),
+    (MOST_RECENT, "debt_lt", ["debt_lt_cur", "debt_lt_noncur"]),
+    (MOST_RECENT, "debt", ["debt_lt", "debt_st"]),
+    (HOOK, "debt_other_borrowings"),
+
+    #### Liabilities ####
+    (YEARLY, "ap_complete_cur", ["ap_cur", "apother_cur", "ap_rel_cur", "ap_trade_cur"], None),
+    (MOST_RECENT, "ap_complete_cur", ["ap_cur", "apother_cur", "ap_rel_cur", "ap_trade_cur"]),
+    (MOST_RECENT, "ap", ["ap_complete_cur"]),
+    (MOST_RECENT, "derivatives_liability", ["derivatives_liability_cur", "derivatives_liability_noncur"]),
+    (MOST_RECENT, "due_affiliates", ["due_affiliates_cur", "due_affiliates_noncur"]),
+    (MOST_RECENT, "due_related_parties", ["due_related_cur", "due_related_noncur"]),
+    (MOST_RECENT, "liabilities", ["liabilities_cur", "liabilities_noncur"]),
+    (MOST_RECENT, "combo_liabilities", ["ap", "derivatives_liability", "due_affiliates", "due_related_parties",
+                                        "debt"]),
+    (HOOK, "liabilities_most_recent"),
+    # for working capital
+    (YEARLY, "ap_complete_cur", ["ap"], None),
+    (YEARLY, "due_affiliates_cur", ["due_affiliates"], None),
+    (YEARLY, "due_related_cur", ["due_related_parties"], None),
+
+    #### Cashflow statement ####
+    (YEARLY, "dividends", ["dividends_cs", "dividends_ps"], None),
+    (TTM, "dividends", ["dividends_cs", "dividends_ps"]),
+    (YEARLY, "sub_aff", ["sub", "aff"], None),
+    (YEARLY, "capex", ["acquisition_costs", "acquisition_adj", "acquisition", "acquisition2", "sub_aff", "jv",
+                       "capex_not_paid", "capex_imp", "productive_assets_other", "ppe_other", "productive_assets",
+                       "ppe_payments", "sw", "sw_dev", "intangibles"], None),
+
+    #### Options ####
+    (MOST_RECENT, "sbc", ["sbc_options", "sbc_non_options"]),
+]
+
+OUTPUTS = {
+    # shares
+    "mr_shares": ("shares", MOST_RECENT),
+    "shares": ("shares", YEARLY),
+
+    # income statement
+    "ttm_revenue": ("revenue", TTM),
+    "ttm_gross_profit": ("gross_profit", TTM),
+    "ttm_ebit": ("ebit", TTM),
+    "ttm_net_income": ("net_income", TTM),
+    "ttm_interest_expenses": ("interest_expenses", TTM),
+    "revenue": ("revenue", YEARLY),
+    "gross_profit": ("gross_profit", YEARLY),
+    "rd": ("rd", YEARLY),
+    "ebit": ("ebit", YEARLY),
+    "depreciation": ("depreciation_amortization", YEARLY),
+    "net_income": ("net_income", YEARLY),
+    "last_annual_report_date": (CONTEXT, "last_annual_report_date"),
+    "last_annual_report_fy": (CONTEXT, "last_annual_report_fy"),
+
+    # current assets
+    "mr_cash": ("cash_and_restricted", MOST_RECENT),
+    "cash": ("cash_and_restricted", YEARLY),
+    "mr_inventory": ("inventory", MOST_RECENT),
+    "inventory": ("inventory", YEARLY),
+    "mr_other_assets": ("other_current_assets", MOST_RECENT),
+    "other_assets": ("other_current_assets", YEARLY),
+    "mr_receivables": ("receivables", MOST_RECENT),
+    "receivables": ("receivables", YEARLY),
+    "mr_securities": ("securities", MOST_RECENT),
+    "securities": ("securities", YEARLY),
+
+    # non-current assets
+    "mr_equity_investments": ("equity_investments", MOST_RECENT),
+    "mr_other_financial_assets": ("other_financial_assets", MOST_RECENT),
+    "mr_ppe": ("ppe", MOST_RECENT),
+    "mr_investment_property": ("investment_property", MOST_RECENT),
+    "mr_tax_benefits": ("tax_benefits", MOST_RECENT),
+
+    # debt
+    "mr_debt": ("debt", MOST_RECENT),
+    "debt": ("debt", YEARLY),
+
+    # liabilities
+    "mr_liabilities": ("liabilities", MOST_RECENT),
+    "account_payable": ("ap_complete_cur", YEARLY),
+    "due_to_affiliates": ("due_affiliates_cur", YEARLY),
+    "due_to_related_parties": ("due_related_cur", YEARLY),
+
+    # equity
+    "mr_equity": ("equity", MOST_RECENT),
+    "equity": ("equity", YEARLY),
+    "mr_minority_interest": ("minority_interest", MOST_RECENT),
+    "quarter_of_annual_report": (CONTEXT, "quarter_of_annual_report"),
+    "years_diff": (CONTEXT, "years_diff"),
+
+    # cashflow statement
+    "ttm_dividends": ("dividends", TTM),
+    "dividends": ("dividends", YEARLY),
+    "capex": ("capex", YEARLY),
+
+    # operating leases
+    "mr_op_leases_expense": ("op_leases_expense", TTM),
+    "mr_op_leases_next_year": ("op_leases_next_year", MOST_RECENT),
+    "mr_op_leases_next_2year": ("op_leases_next_2year", MOST_RECENT),
+    "mr_op_leases_next_3year": ("op_leases_next_3year", MOST_RECENT),
+    "mr_op_leases_next_4year": ("op_leases_next_4year", MOST_RECENT),
+    "mr_op_leases_next_5year": ("op_leases_next_5year", MOST_RECENT),
+    "mr_op_leases_after_5year": ("op_leases_after_5year", MOST_RECENT),
+
+    # options
+    "mr_sbc": ("sbc", MOST_RECENT),
+}
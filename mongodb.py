@@ -1,14 +1,35 @@
+from concurrent.futures import ProcessPoolExecutor
 from configparser import ConfigParser
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReplaceOne
 import os
+import zstandard
 
 DB_NAME = 'company_eval'
 
-def get_mongodb_client():
+# (cik, form_type, filing_date) lets "latest filing of a company" queries be answered by an index scan
+DOCUMENTS_INDEXES = [
+    [("cik", ASCENDING), ("form_type", ASCENDING), ("filing_date", DESCENDING)],
+    [("cik", ASCENDING), ("filing_date", ASCENDING)],
+    [("inserted_at", ASCENDING)],
+]
+# inserted_at is used by the polling fallback of the pipeline (see pipeline.py)
+FINANCIAL_DATA_INDEXES = [
+    [("inserted_at", ASCENDING)],
+]
+_indexes_created = False
+
+# fields of a "documents" record that are not the html payload
+DOCUMENT_METADATA_FIELDS = ["cik", "form_type", "filing_date", "updated_at"]
+
+# html of the filings is kept apart from their metadata, zstd compressed and keyed by the same url _id
+PAYLOAD_COLLECTION = "documents_html"
+PAYLOAD_COMPRESSION_LEVEL = 10
+
+def get_connection_string():
     """
-    Get mongodb client
-    :return: mongodb client
+    Get mongodb connection string
+    :return: connection string
     """
 
     # Get credentials
@@ -27,8 +48,16 @@ def get_mongodb_client():
 
     connection_string = LOCAL_CONNECTION
 
+    return connection_string
+
+def get_mongodb_client():
+    """
+    Get mongodb client
+    :return: mongodb client
+    """
+
     # Create a connection using MongoClient
-    client = MongoClient(connection_string)
+    client = MongoClient(get_connection_string())
 
     return client
 
@@ -36,6 +65,23 @@ def get_collection(collection_name):
     db = get_mongodb_client()[DB_NAME]
     return db[collection_name]
 
+def create_indexes():
+    """
+    Create the indexes used by metadata queries on "documents" and "financial_data" collections.
+    Creating an index that already exists is a no-op on mongodb, so this can be safely run more than once.
+    It is executed only once per process.
+    """
+    global _indexes_created
+    if _indexes_created:
+        return
+    collection = get_collection("documents")
+    for keys in DOCUMENTS_INDEXES:
+        collection.create_index(keys)
+    collection = get_collection("financial_data")
+    for keys in FINANCIAL_DATA_INDEXES:
+        collection.create_index(keys)
+    _indexes_created = True
+
 def get_file_size(file_name):
     file_stats = os.stat(file_name)
     print(f'File Size in Bytes is {file_stats.st_size}')
@@ -54,14 +100,243 @@ def insert_document(collection_name, data):
     collection = get_collection(collection_name)
     collection.insert_one(data)
 
-def get_document(collection_name, document_id):
+def get_document(collection_name, document_id, projection=None):
+    """
+    Get a single document by id
+    :param collection_name: name of the collection
+    :param document_id: id of the document
+    :param projection: list of fields (or mongodb projection dict) to return, None returns the entire document
+    :return: the document, raise StopIteration if not found
+    """
     collection = get_collection(collection_name)
-    return collection.find({"_id": document_id}).next()
+    return collection.find({"_id": document_id}, projection).next()
+
+def upsert_documents(collection_name, documents):
+    """
+    Upsert many documents (by _id) in a single bulk write
+    :param collection_name: name of the collection
+    :param documents: list of documents, each with an _id
+    """
+    if len(documents) == 0:
+        return
+    collection = get_collection(collection_name)
+    collection.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in documents], ordered=False)
+
+def insert_documents(collection_name, documents):
+    """
+    Insert many documents in a single bulk write
+    :param collection_name: name of the collection
+    :param documents: list of documents
+    """
+    if len(documents) == 0:
+        return
+    collection = get_collection(collection_name)
+    collection.insert_many(documents, ordered=False)
+
+def get_documents(collection_name, document_ids, projection=None):
+    """
+    Get many documents by id with a single query
+    :param collection_name: name of the collection
+    :param document_ids: list of ids
+    :param projection: list of fields (or mongodb projection dict) to return, None returns entire documents
+    :return: list of documents found (missing ids are skipped)
+    """
+    collection = get_collection(collection_name)
+    return list(collection.find({"_id": {"$in": list(document_ids)}}, projection))
 
 def check_document_exists(collection_name, document_id):
     collection = get_collection(collection_name)
     return collection.count_documents({"_id": document_id}, limit=1) > 0
 
-def get_collection_documents(collection_name):
+def get_collection_documents(collection_name, query=None, projection=None):
+    """
+    Get documents of a collection
+    :param collection_name: name of the collection
+    :param query: mongodb filter, None returns all documents
+    :param projection: list of fields (or mongodb projection dict) to return, None returns entire documents
+    :return: cursor over the documents
+    """
+    collection = get_collection(collection_name)
+    return collection.find(query if query is not None else {}, projection)
+
+def iter_collection(collection_name, query=None, projection=None, batch_size=100, start_after=None, id_range=None):
+    """
+    Stream the documents of a collection in _id order, one page of batch_size documents at a time.
+    Each page is a new query that resumes after the last _id seen: no cursor is kept open between pages (no cursor
+    timeouts on long jobs) and only one page is held in memory.
+    :param collection_name: name of the collection
+    :param query: mongodb filter, None for all documents
+    :param projection: list of fields (or mongodb projection dict) to return, _id must not be excluded
+    :param batch_size: number of documents per page
+    :param start_after: resume the iteration after this _id (last _id processed by an interrupted job)
+    :param id_range: tuple (start_at, end_before), iterate only _id >= start_at and _id < end_before
+    (None for no bound), see get_id_partitions
+    :return: generator of documents
+    """
+    collection = get_collection(collection_name)
+    start_at, end_before = id_range if id_range is not None else (None, None)
+
+    last_id = start_after
+    while True:
+
+        id_filter = {}
+        if last_id is not None:
+            id_filter["$gt"] = last_id
+        elif start_at is not None:
+            id_filter["$gte"] = start_at
+        if end_before is not None:
+            id_filter["$lt"] = end_before
+
+        page_query = query if query is not None else {}
+        if len(id_filter) > 0:
+            page_query = {"$and": [page_query, {"_id": id_filter}]}
+
+        docs = list(collection.find(page_query, projection).sort("_id", ASCENDING).limit(batch_size))
+        for doc in docs:
+            yield doc
+
+        if len(docs) < batch_size:
+            return
+        last_id = docs[-1]["_id"]
+
+def get_id_partitions(collection_name, num_partitions, query=None):
+    """
+    Split the documents of a collection in contiguous _id ranges with a similar number of documents
+    :param collection_name: name of the collection
+    :param num_partitions: number of ranges wanted
+    :param query: mongodb filter, None for all documents
+    :return: list of (start_at, end_before) to be passed as id_range to iter_collection
+    """
     collection = get_collection(collection_name)
-    return collection.find({})
\ No newline at end of file
+    pipeline = [
+        {"$match": query if query is not None else {}},
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": num_partitions}}
+    ]
+    buckets = list(collection.aggregate(pipeline, allowDiskUse=True))
+
+    # bucket max is the min of the next bucket, the last bucket is left unbounded
+    partitions = []
+    for i, b in enumerate(buckets):
+        end_before = b["_id"]["max"] if i < len(buckets) - 1 else None
+        partitions.append((b["_id"]["min"], end_before))
+    return partitions
+
+def _map_partition(collection_name, func, query, projection, batch_size, id_range):
+    result = []
+    for doc in iter_collection(collection_name, query, projection, batch_size, id_range=id_range):
+        r = func(doc)
+        if r is not None:
+            result.append(r)
+    return result
+
+def parallel_map_collection(collection_name, func, num_workers=None, query=None, projection=None, batch_size=100):
+    """
+    Apply func to every document of a collection, splitting the collection in _id ranges processed by
+    num_workers processes. Each worker streams its range with iter_collection.
+    :param collection_name: name of the collection
+    :param func: module level function (it must be picklable) taking a document, None results are discarded
+    :param num_workers: number of processes, default number of cpus
+    :param query: mongodb filter, None for all documents
+    :param projection: list of fields (or mongodb projection dict) to return
+    :param batch_size: number of documents per page
+    :return: list of func results
+    """
+    num_workers = num_workers if num_workers is not None else os.cpu_count()
+    partitions = get_id_partitions(collection_name, num_workers, query)
+
+    result = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        tasks = [executor.submit(_map_partition, collection_name, func, query, projection, batch_size, p)
+                 for p in partitions]
+        for t in tasks:
+            result.extend(t.result())
+    return result
+
+def get_document_metadata(document_id):
+    """
+    Get a filing from "documents" collection without its html
+    :param document_id: url of the filing
+    :return: dict with _id, cik, form_type, filing_date, updated_at
+    """
+    return get_document("documents", document_id, DOCUMENT_METADATA_FIELDS)
+
+def get_documents_metadata(query=None):
+    """
+    Get filings from "documents" collection without their html
+    :param query: mongodb filter, None returns all filings
+    :return: cursor over dicts with _id, cik, form_type, filing_date, updated_at
+    """
+    return get_collection_documents("documents", query, DOCUMENT_METADATA_FIELDS)
+
+def compress_payload(text):
+    return zstandard.ZstdCompressor(level=PAYLOAD_COMPRESSION_LEVEL).compress(text.encode("utf-8"))
+
+def decompress_payload(data):
+    return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+
+def upsert_document_payload(document_id, html):
+    """
+    Save the compressed html of a filing in the payload collection
+    :param document_id: url of the filing
+    :param html: html string
+    """
+    upsert_document(PAYLOAD_COLLECTION, {"_id": document_id, "html": compress_payload(html)})
+
+def get_document_payload(document_id):
+    """
+    Get the html of a filing from the payload collection
+    :param document_id: url of the filing
+    :return: html string
+    """
+    try:
+        payload = get_document(PAYLOAD_COLLECTION, document_id)
+    except StopIteration:
+        # filings saved before the payload split still have their html inside "documents"
+        doc = get_document("documents", document_id, ["html"])
+        if "html" in doc:
+            return doc["html"]
+        # html moved to the cold tier (imported here, tiering depends on this module)
+        import tiering
+        return tiering.get_cold_payload(document_id)
+    return decompress_payload(payload["html"])
+
+class FilingDocument(dict):
+    """
+    A filing from "documents" collection. The html is loaded (and decompressed) from the payload collection only
+    the first time doc["html"] is accessed.
+    """
+
+    def __missing__(self, key):
+        if key != "html":
+            raise KeyError(key)
+        html = get_document_payload(self["_id"])
+        self["html"] = html
+        return html
+
+def insert_filing(doc):
+    """
+    Insert a filing (dict with html, cik, form_type, filing_date, updated_at, _id) splitting the html
+    in the payload collection.
+    The payload is saved first, so a filing present in "documents" always has its html.
+    :param doc: filing document
+    """
+    metadata = {k: v for k, v in doc.items() if k != "html"}
+    upsert_document_payload(doc["_id"], doc["html"])
+    insert_document("documents", metadata)
+
+def get_filing(document_id):
+    """
+    Get a filing from "documents" collection, html is lazily loaded
+    :param document_id: url of the filing
+    :return: FilingDocument, raise StopIteration if not found
+    """
+    return FilingDocument(get_document("documents", document_id))
+
+def split_documents_payload():
+    """
+    Move the html of filings saved before the payload split from "documents" to the compressed payload collection.
+    """
+    collection = get_collection("documents")
+    for doc in collection.find({"html": {"$exists": True}}, ["html"]):
+        upsert_document_payload(doc["_id"], doc["html"])
+        collection.update_one({"_id": doc["_id"]}, {"$unset": {"html": ""}})
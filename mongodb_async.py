@@ -0,0 +1,143 @@
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne
+
+import tiering
+from mongodb import DB_NAME, PAYLOAD_COLLECTION, get_connection_string, compress_payload, decompress_payload
+
+# Async counterpart of mongodb module, to be used from asyncio code (fetchers, summarizers) without blocking the
+# event loop. Same collections and same semantics, except that a missing document raises DocumentNotFoundException
+# (StopIteration cannot be raised from a coroutine).
+
+_client = None
+
+
+class DocumentNotFoundException(Exception):
+    pass
+
+
+def get_mongodb_client():
+    """
+    Get motor (async) mongodb client. The client is created once and shared, it must be used from a single event loop.
+    :return: motor client
+    """
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(get_connection_string())
+    return _client
+
+
+def get_collection(collection_name):
+    db = get_mongodb_client()[DB_NAME]
+    return db[collection_name]
+
+
+async def upsert_document(collection_name, data):
+    collection = get_collection(collection_name)
+    await collection.replace_one({"_id": data["_id"]}, data, upsert=True)
+
+
+async def insert_document(collection_name, data):
+    collection = get_collection(collection_name)
+    await collection.insert_one(data)
+
+
+async def get_document(collection_name, document_id, projection=None):
+    """
+    Get a single document by id
+    :param collection_name: name of the collection
+    :param document_id: id of the document
+    :param projection: list of fields (or mongodb projection dict) to return, None returns the entire document
+    :return: the document, raise DocumentNotFoundException if not found
+    """
+    collection = get_collection(collection_name)
+    doc = await collection.find_one({"_id": document_id}, projection)
+    if doc is None:
+        raise DocumentNotFoundException(f"{document_id} not found in {collection_name}")
+    return doc
+
+
+async def check_document_exists(collection_name, document_id):
+    collection = get_collection(collection_name)
+    return await collection.count_documents({"_id": document_id}, limit=1) > 0
+
+
+def get_collection_documents(collection_name, query=None, projection=None):
+    """
+    Get documents of a collection
+    :param collection_name: name of the collection
+    :param query: mongodb filter, None returns all documents
+    :param projection: list of fields (or mongodb projection dict) to return, None returns entire documents
+    :return: async cursor over the documents (use "async for")
+    """
+    collection = get_collection(collection_name)
+    return collection.find(query if query is not None else {}, projection)
+
+
+async def upsert_documents(collection_name, documents):
+    """
+    Upsert many documents (by _id) in a single bulk write
+    :param collection_name: name of the collection
+    :param documents: list of documents, each with an _id
+    """
+    if len(documents) == 0:
+        return
+    collection = get_collection(collection_name)
+    await collection.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in documents], ordered=False)
+
+
+async def insert_documents(collection_name, documents):
+    """
+    Insert many documents in a single bulk write
+    :param collection_name: name of the collection
+    :param documents: list of documents
+    """
+    if len(documents) == 0:
+        return
+    collection = get_collection(collection_name)
+    await collection.insert_many(documents, ordered=False)
+
+
+async def get_documents(collection_name, document_ids, projection=None):
+    """
+    Get many documents by id with a single query
+    :param collection_name: name of the collection
+    :param document_ids: list of ids
+    :param projection: list of fields (or mongodb projection dict) to return, None returns entire documents
+    :return: list of documents found (missing ids are skipped)
+    """
+    collection = get_collection(collection_name)
+    return await collection.find({"_id": {"$in": list(document_ids)}}, projection).to_list(length=None)
+
+
+async def insert_filing(doc):
+    """
+    Insert a filing splitting the html in the compressed payload collection (see mongodb.insert_filing)
+    :param doc: filing document
+    """
+    metadata = {k: v for k, v in doc.items() if k != "html"}
+    await upsert_document(PAYLOAD_COLLECTION, {"_id": doc["_id"], "html": compress_payload(doc["html"])})
+    await insert_document("documents", metadata)
+
+
+async def get_document_payload(document_id):
+    """
+    Get the html of a filing from the payload collection
+    :param document_id: url of the filing
+    :return: html string, raise DocumentNotFoundException if not found
+    """
+    try:
+        payload = await get_document(PAYLOAD_COLLECTION, document_id)
+    except DocumentNotFoundException:
+        # filings saved before the payload split still have their html inside "documents"
+        doc = await get_document("documents", document_id, ["html", "cik", "filing_date"])
+        if "html" in doc:
+            return doc["html"]
+        # html moved to the cold tier, the archive is read in a thread (blocking file io)
+        filings = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: tiering.read_archive(tiering.get_archive_path(doc["cik"], doc["filing_date"])))
+        if document_id not in filings:
+            raise DocumentNotFoundException(f"{document_id} not found in the cold tier")
+        return filings[document_id]
+    return decompress_payload(payload["html"])
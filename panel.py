@@ -0,0 +1,232 @@
+import datetime
+import json
+import os
+import shutil
+from configparser import ConfigParser
+
+import numpy as np
+import pandas as pd
+
+import storage
+from measure_spec import OUTPUTS, MOST_RECENT, TTM, YEARLY
+from quantitative_analysis import get_company_financial_information
+from yearly_series import get_year_range
+
+# Universe wide financial panel: the output of extract_company_financial_information for every company of the
+# financial_data collection, stored as NumPy arrays that can be memory mapped. Every build is written to its own
+# version directory and CURRENT (replaced atomically) holds the name of the version to read:
+#
+#   <path>/CURRENT                        ->  name of the current version, e.g. 20240115T103000123456
+#   <path>/<version>/index.json           ->  {"ciks": [...], "base_year": 2005, "num_years": 19,
+#                                              "yearly_metrics": [...], "value_metrics": [...], "created_at": "..."}
+#   <path>/<version>/<yearly metric>.npy  ->  float64 array (companies x years), row i is ciks[i], column j is
+#                                             base_year + j
+#   <path>/<version>/<value metric>.npy   ->  float64 array (companies), most recent / ttm values
+#
+# Missing values are NaN. Metrics are the outputs of measure_spec.OUTPUTS.
+#
+# Configuration in credentials.cfg (optional):
+# [panel]
+# path = panel
+
+DEFAULT_PATH = "panel"
+CURRENT_FILE = "CURRENT"
+# versions kept on disk (the current one and the previous ones, for readers that opened them before a swap)
+KEEP_VERSIONS = 2
+
+YEARLY_METRICS = [k for k, (_, value) in OUTPUTS.items() if value == YEARLY]
+VALUE_METRICS = [k for k, (_, value) in OUTPUTS.items() if value in [MOST_RECENT, TTM]]
+
+_panel = None
+
+
+def get_panel_path():
+    parser = ConfigParser()
+    _ = parser.read(os.path.join("credentials.cfg"))
+    return parser.get("panel", "path", fallback=DEFAULT_PATH)
+
+
+def get_current_version(path):
+    """
+    Get the current version of a panel
+    :param path: panel directory
+    :return: version directory name, None if no panel was built
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def extract_panel_row(doc):
+    """
+    Get the panel metrics of a company (cached extraction if up to date, otherwise it is extracted and cached)
+    :param doc: financial_data document (only _id is used)
+    :return: (cik, {yearly metric: YearlySeries}, {value metric: value}), None if the extraction fails
+    """
+    cik = doc["_id"]
+    try:
+        data = get_company_financial_information(cik)
+    except Exception as e:
+        print(f"ERROR {cik} - {e}")
+        return None
+
+    yearly = {m: data[m] for m in YEARLY_METRICS}
+    values = {m: data[m]["value"] for m in VALUE_METRICS}
+    return cik, yearly, values
+
+
+def build_panel(num_workers=None, path=None):
+    """
+    Extract financial information of every company in financial_data (in parallel) and write the panel.
+    The new panel is written to a new version directory and becomes the current one when complete, the current
+    panel stays readable during the build and the swap.
+    :param num_workers: number of processes, default number of cpus
+    :param path: panel directory, None uses the configured one
+    :return: number of companies in the panel
+    """
+    path = path if path is not None else get_panel_path()
+
+    rows = storage.parallel_map_collection("financial_data", extract_panel_row, num_workers=num_workers,
+                                           projection=["_id"])
+    rows = sorted(rows, key=lambda r: r[0])
+    ciks = [r[0] for r in rows]
+
+    base_year, num_years = get_year_range([s for r in rows for s in r[1].values()])
+    if num_years == 0:
+        print("panel: no yearly values")
+        return 0
+
+    created_at = datetime.datetime.utcnow()
+    version = created_at.strftime("%Y%m%dT%H%M%S%f")
+    version_path = os.path.join(path, version)
+    os.makedirs(version_path)
+
+    for m in YEARLY_METRICS:
+        a = np.lib.format.open_memmap(os.path.join(version_path, f"{m}.npy"), mode="w+", dtype=np.float64,
+                                      shape=(len(ciks), num_years))
+        a[:] = np.nan
+        for i, (_, yearly, _) in enumerate(rows):
+            values, mask = yearly[m].reindex(base_year, num_years)
+            a[i, mask] = values[mask]
+        a.flush()
+        del a
+
+    for m in VALUE_METRICS:
+        a = np.array([np.nan if r[2][m] is None else r[2][m] for r in rows], dtype=np.float64)
+        np.save(os.path.join(version_path, f"{m}.npy"), a)
+
+    with open(os.path.join(version_path, "index.json"), "w") as f:
+        json.dump({
+            "ciks": ciks,
+            "base_year": base_year,
+            "num_years": num_years,
+            "yearly_metrics": YEARLY_METRICS,
+            "value_metrics": VALUE_METRICS,
+            "created_at": created_at.isoformat()
+        }, f)
+
+    current_tmp = os.path.join(path, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(path, CURRENT_FILE))
+
+    # arrays already mapped by readers of removed versions stay valid until they are closed
+    versions = sorted(d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+
+    print(f"panel: {len(ciks)} companies, {num_years} years from {base_year}")
+    return len(ciks)
+
+
+class Panel:
+    """
+    Read only view of a version of a panel written by build_panel, all the arrays of the version are memory mapped
+    when the panel is opened, so that a later build never mixes with the index read here
+    """
+
+    def __init__(self, path=None, version=None):
+        path = path if path is not None else get_panel_path()
+        self.version = version if version is not None else get_current_version(path)
+        if self.version is None:
+            raise FileNotFoundError(f"no panel in {path}")
+        self.path = os.path.join(path, self.version)
+        with open(os.path.join(self.path, "index.json")) as f:
+            index = json.load(f)
+
+        self.ciks = index["ciks"]
+        self.base_year = index["base_year"]
+        self.num_years = index["num_years"]
+        self.yearly_metrics = index["yearly_metrics"]
+        self.value_metrics = index["value_metrics"]
+        self.created_at = index["created_at"]
+
+        self.cik_index = {cik: i for i, cik in enumerate(self.ciks)}
+        self._arrays = {m: np.load(os.path.join(self.path, f"{m}.npy"), mmap_mode="r")
+                        for m in self.yearly_metrics + self.value_metrics}
+
+    @property
+    def years(self):
+        return np.arange(self.base_year, self.base_year + self.num_years)
+
+    def get(self, metric):
+        """
+        Get the array of a metric
+        :param metric: yearly metric (companies x years) or value metric (companies)
+        :return: read only memory mapped array
+        """
+        return self._arrays[metric]
+
+    def get_years(self, metric, start, end):
+        """
+        Get the values of a yearly metric for a range of years, for all companies
+        :param metric: yearly metric
+        :param start: initial year
+        :param end: final year (included)
+        :return: array (companies x (end - start + 1)), NaN outside of the panel years
+        """
+        a = self.get(metric)
+        result = np.full((len(self.ciks), end - start + 1), np.nan)
+        first = max(start, self.base_year)
+        last = min(end, self.base_year + self.num_years - 1)
+        if first <= last:
+            result[:, first - start:last - start + 1] = a[:, first - self.base_year:last - self.base_year + 1]
+        return result
+
+    def get_company(self, cik, metric):
+        """
+        Get the values of a metric for a company
+        :param cik: company cik
+        :param metric: yearly or value metric
+        :return: array of the years of the panel (yearly metric) or value, raise KeyError if the company is not in the
+        panel
+        """
+        return self.get(metric)[self.cik_index[cik]]
+
+    def to_df(self, metric):
+        """
+        Get a metric as a DataFrame (copy of the array)
+        :param metric: yearly or value metric
+        :return: DataFrame indexed by cik, with a column per year (yearly metric) or a single column named as the metric
+        """
+        if metric in self.yearly_metrics:
+            return pd.DataFrame(np.asarray(self.get(metric)), index=self.ciks, columns=self.years)
+        return pd.DataFrame({metric: np.asarray(self.get(metric))}, index=self.ciks)
+
+
+def get_panel():
+    """
+    Get the panel shared by the process (loaded on first use, reloaded when a new version is built)
+    :return: Panel
+    """
+    global _panel
+    path = get_panel_path()
+    if _panel is None or get_current_version(path) != _panel.version:
+        _panel = Panel(path)
+    return _panel
+
+
+if __name__ == '__main__':
+    build_panel()
@@ -0,0 +1,218 @@
+import datetime
+import queue
+import threading
+import time
+import traceback
+
+from pymongo.errors import OperationFailure
+
+import mongodb
+import storage
+from qualitative_analysis import sections_summary
+from quantitative_analysis import get_company_financial_information
+from utils import parse_document
+
+# Event driven precomputation of derived artifacts.
+# New filings ("documents") are parsed (parsed_documents) and summarized (items_summary), new or updated companyfacts
+# ("financial_data") are extracted (financial_extractions), so that valuation(..., qualitative=True) only reads
+# cached results.
+#
+# Changes are read from mongodb change streams (they require a replica set, a single node replica set is enough).
+# Documents inserted before the stream is opened (e.g. while the pipeline was down) are caught up once from their
+# inserted_at field. When change streams are not available (standalone mongod or SQLite storage) new documents are
+# polled using their inserted_at field.
+
+PARSE = "parse"
+SUMMARIZE = "summarize"
+EXTRACT = "extract"
+
+WATCHED_COLLECTIONS = ["documents", "financial_data"]
+SUMMARIZED_FORM_TYPES = ["10-K", "10-Q", "8-K"]
+
+# inserted_at is set by the writer before its write is committed: a document can become visible after documents
+# with a later inserted_at were polled, so every poll looks this far back (documents already seen are skipped)
+POLL_OVERLAP = datetime.timedelta(minutes=10)
+
+
+def run_parse(document_id):
+    """
+    Parse a filing, unless it is already parsed
+    :param document_id: url of the filing
+    :return: list of (stage, id) to run next
+    """
+    if not storage.check_document_exists("parsed_documents", document_id):
+        parse_document(storage.get_document("documents", document_id))
+    return [(SUMMARIZE, document_id)]
+
+
+def run_summarize(document_id):
+    """
+    Summarize a parsed filing with openAI, unless it is already summarized
+    :param document_id: url of the filing
+    :return: list of (stage, id) to run next
+    """
+    if storage.check_document_exists("items_summary", document_id):
+        return []
+    parsed_doc = storage.get_document("parsed_documents", document_id)
+    if parsed_doc["form_type"] in SUMMARIZED_FORM_TYPES:
+        sections_summary(parsed_doc)
+    return []
+
+
+def run_extract(cik):
+    """
+    Extract financial information of a company from its companyfacts document, unless the cached extraction is up
+    to date
+    :param cik: company cik
+    :return: list of (stage, id) to run next
+    """
+    get_company_financial_information(cik)
+    return []
+
+
+STAGES = {
+    PARSE: run_parse,
+    SUMMARIZE: run_summarize,
+    EXTRACT: run_extract,
+}
+
+
+def get_first_stage(collection_name, doc):
+    """
+    Get the stage triggered by a new document
+    :param collection_name: collection of the document
+    :param doc: the document (only _id is used)
+    :return: (stage, id)
+    """
+    if collection_name == "documents":
+        return PARSE, doc["_id"]
+    return EXTRACT, doc["_id"]
+
+
+class Pipeline:
+    """
+    Run the stages triggered by new documents with a pool of worker threads.
+    Stages not in stages are skipped (e.g. stages=(PARSE, EXTRACT) does not call openAI).
+    """
+
+    def __init__(self, stages=(PARSE, SUMMARIZE, EXTRACT), num_workers=2, poll_interval=30):
+        self.stages = stages
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.tasks = queue.Queue()
+        self.stop_event = threading.Event()
+
+    def enqueue(self, stage, item_id):
+        if stage in self.stages:
+            self.tasks.put((stage, item_id))
+
+    def on_document(self, collection_name, doc):
+        stage, item_id = get_first_stage(collection_name, doc)
+        self.enqueue(stage, item_id)
+
+    def worker(self):
+        while not self.stop_event.is_set():
+            try:
+                stage, item_id = self.tasks.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                for next_stage, next_id in STAGES[stage](item_id):
+                    self.enqueue(next_stage, next_id)
+            except Exception:
+                print(f"ERROR {stage} {item_id}")
+                traceback.print_exc()
+            finally:
+                self.tasks.task_done()
+
+    def catch_up(self, collection_name, since):
+        """
+        Process once the documents inserted after a given time
+        :param collection_name: name of the collection
+        :param since: datetime
+        """
+        for doc in storage.find_inserted_after(collection_name, since, ["inserted_at"]):
+            self.on_document(collection_name, doc)
+
+    def watch(self, collection_name, since):
+        """
+        Follow the change stream of a collection. The documents inserted after since and before the stream was opened
+        are processed first. Fall back to polling if change streams are not supported.
+        :param collection_name: name of the collection
+        :param since: datetime, start of the catch up (and of the polling fallback)
+        """
+        collection = mongodb.get_collection(collection_name)
+        change_pipeline = [{"$match": {"operationType": {"$in": ["insert", "replace", "update"]}}}]
+        try:
+            with collection.watch(change_pipeline) as stream:
+                # the stream is open before the catch up: nothing falls between them, a document inserted meanwhile
+                # is processed twice (stages skip what is already done)
+                self.catch_up(collection_name, since)
+                while not self.stop_event.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        time.sleep(1)
+                        continue
+                    self.on_document(collection_name, change["documentKey"])
+        except OperationFailure:
+            print(f"change streams not available for {collection_name}, polling every {self.poll_interval}s")
+            self.poll(collection_name, since)
+
+    def poll(self, collection_name, since=None):
+        """
+        Look for documents inserted since the last poll (minus POLL_OVERLAP).
+        :param collection_name: name of the collection
+        :param since: datetime, only documents inserted after it are processed (None processes all documents)
+        """
+        last_inserted_at = since
+        # (_id, inserted_at) of the documents processed inside the overlap window, a replaced document has a new
+        # inserted_at and is processed again
+        seen = set()
+        while not self.stop_event.is_set():
+            start = last_inserted_at - POLL_OVERLAP if last_inserted_at is not None else None
+            docs = storage.find_inserted_after(collection_name, start, ["inserted_at"])
+            for doc in docs:
+                key = (doc["_id"], doc["inserted_at"])
+                if key in seen or (since is not None and doc["inserted_at"] <= since):
+                    continue
+                seen.add(key)
+                self.on_document(collection_name, doc)
+                if last_inserted_at is None or doc["inserted_at"] > last_inserted_at:
+                    last_inserted_at = doc["inserted_at"]
+
+            if last_inserted_at is not None:
+                seen = {k for k in seen if k[1] > last_inserted_at - POLL_OVERLAP}
+            self.stop_event.wait(self.poll_interval)
+
+    def run(self, since=None):
+        """
+        Start workers and watchers, block until stop() is called (or KeyboardInterrupt).
+        :param since: process also documents inserted after this datetime, e.g. while the pipeline was down
+        (default: only new ones)
+        """
+        if since is None:
+            since = datetime.datetime.utcnow()
+
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.num_workers)]
+        for collection_name in WATCHED_COLLECTIONS:
+            target = self.watch if isinstance(storage.get_storage(), storage.MongoStorage) else self.poll
+            threads.append(threading.Thread(target=target, args=(collection_name, since), daemon=True))
+
+        for t in threads:
+            t.start()
+
+        try:
+            while not self.stop_event.is_set():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+        for t in threads:
+            t.join()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+if __name__ == '__main__':
+    Pipeline().run()
@@ -1,11 +1,18 @@
+import atexit
+import io
 import math
+import threading
 from configparser import ConfigParser
 import os
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
 
 import pandas as pd
 
 import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 from dateutil.relativedelta import relativedelta
 
 from investing_com import get_10y_bond_yield
@@ -255,26 +262,81 @@ industry_translation = {
     'Staffing & Outsourcing Services': 'Business & Consumer Services',
     'Entertainment - Diversified': 'Entertainment'}
 
-def get_connection():
+# Per company lookups of a valuation, prepared once per pooled connection and executed with bound parameters
+# ($1, $2, ...)
+PREPARED_STATEMENTS = {
+    "generic_info": """SELECT y.symbol, y.long_name, y.currency, y.financial_currency, a.country, a.industry
+                       FROM yahoo_equity_tickers_latest y
+                       JOIN tickers_additional_info a ON a.symbol = y.symbol
+                       WHERE y.symbol = ANY($1)""",
+}
+
+# Snapshots of the reference tables loaded over time (every load has its own created_at).
+# A materialized view keeps the rows of one load, indexed on the lookup columns:
+# view name: (table, created_at of the snapshot, indexed columns)
+# Views are refreshed CONCURRENTLY (readers are not blocked), which needs a unique index: every view has a
+# SNAPSHOT_ROW column numbering its rows, dropped by get_df_from_table.
+# Views are created and refreshed by an explicit step that needs DDL rights (refresh_snapshot_views, run by the loaders
+# after inserting a new snapshot, or `python postgresql.py`). Readers only run read only queries: a view that does not
+# exist or does not hold the current snapshot of its table is not used, reads go to the table instead.
+LATEST_SNAPSHOT = "SELECT MAX(created_at) FROM {table}"
+PREVIOUS_YEAR_SNAPSHOT = "SELECT MAX(created_at) FROM {table} WHERE created_at < date_trunc('year',now())"
+SNAPSHOT_VIEWS = {
+    "damodaran_bond_spread_latest": ("damodaran_bond_spread", LATEST_SNAPSHOT, []),
+    "damodaran_country_stats_latest": ("damodaran_country_stats", LATEST_SNAPSHOT, ["country"]),
+    "damodaran_industry_data_latest": ("damodaran_industry_data", LATEST_SNAPSHOT, ["industry_name"]),
+    "damodaran_industry_data_previous_year": ("damodaran_industry_data", PREVIOUS_YEAR_SNAPSHOT, ["industry_name"]),
+    "yahoo_equity_tickers_latest": ("yahoo_equity_tickers", LATEST_SNAPSHOT, ["symbol"]),
+}
+SNAPSHOT_ROW = "snapshot_row"
+# the views usable by readers are checked again when older than this
+SNAPSHOT_VIEWS_CHECK_INTERVAL = timedelta(minutes=1)
+_snapshot_views_lock = threading.Lock()
+_snapshot_views_checked_at = None
+_fresh_snapshot_views = frozenset()
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """
+    psycopg2 connection that keeps track of the statements prepared on it (prepared statements live as long as
+    the database session).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# pools inherited from the parent process, kept referenced so that their connections are never finalized by the child
+_inherited_pools = []
+
+def get_connection_params():
+    """
+    Read connection parameters and pool size from credentials.cfg
+    :return: (connection parameters, min pool size, max pool size)
+    """
 
     parser = ConfigParser()
     _ = parser.read(os.path.join("credentials.cfg"))
-    database = parser.get("postgresql", "DB_NAME")
-    user = parser.get("postgresql", "DB_USER")
-    password = parser.get("postgresql", "DB_PASS")
-    host = parser.get("postgresql", "DB_HOST")
+    params = {
+        'database': parser.get("postgresql", "DB_NAME"),
+        'user': parser.get("postgresql", "DB_USER"),
+        'password': parser.get("postgresql", "DB_PASS"),
+        'host': parser.get("postgresql", "DB_HOST")
+    }
+    min_connections = parser.getint("postgresql", "POOL_MIN", fallback=1)
+    max_connections = parser.getint("postgresql", "POOL_MAX", fallback=10)
+
+    return params, min_connections, max_connections
+
+def get_connection():
+    """ Connect to the PostgreSQL database server (a new connection, to be closed by the caller) """
+
+    params, _, _ = get_connection_params()
 
-    """ Connect to the PostgreSQL database server """
     conn = None
     try:
-        # connection parameters
-        params = {
-            'database': database,
-            'user': user,
-            'password': password,
-            'host': host
-        }
-
         # connect to the PostgreSQL server
         # print('Connecting to the PostgreSQL database...')
         conn = psycopg2.connect(**params)
@@ -284,45 +346,525 @@ def get_connection():
         if conn is not None:
             conn.close()
 
-def get_df_from_table(tablename, where=";", most_recent=False):
-    if most_recent:
-        if where == ";":
-            where = f" WHERE created_at = (SELECT MAX(created_at) FROM {tablename})"
-        else:
-            where += f" AND created_at = (SELECT MAX(created_at) FROM {tablename})"
+def get_pool():
+    """
+    Get the connection pool of the current process. The pool is created on first use.
+    A process forked from a process with a pool (e.g. ProcessPoolExecutor workers) creates its own pool: the sockets
+    inherited from the parent are shared with it, so they are neither used nor closed by the child.
+    :return: ThreadedConnectionPool
+    """
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            if _pool is not None:
+                _inherited_pools.append(_pool)
+            params, min_connections, max_connections = get_connection_params()
+            try:
+                _pool = ThreadedConnectionPool(min_connections, max_connections,
+                                               connection_factory=PreparingConnection, **params)
+                _pool_pid = pid
+            except (Exception, psycopg2.DatabaseError) as error:
+                print("CONNECTION ERROR: ", error)
+                raise
+    return _pool
+
+@contextmanager
+def pooled_connection():
+    """
+    Check out a connection from the pool, the transaction is committed on exit (rolled back on error) and the
+    connection is given back to the pool.
+    Usage: with pooled_connection() as conn: ...
+    :return: psycopg2 connection
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+def close_pool():
+    """ Close all the connections of the pool of the current process """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+atexit.register(close_pool)
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(f"""SELECT * FROM {tablename} {where}""")
+def get_df_from_cursor(cur):
     data = cur.fetchall()
     cols = []
     for elt in cur.description:
         cols.append(elt[0])
-    df = pd.DataFrame(data=data, columns=cols)
-    cur.close()
+    return pd.DataFrame(data=data, columns=cols)
+
+def create_snapshot_views(cur):
+    """
+    Create SNAPSHOT_VIEWS (and the created_at index of their tables) if they do not exist.
+    Views select all the columns of their table when they are created: drop them if the table gets new columns.
+    Views created without SNAPSHOT_ROW (they cannot be refreshed concurrently) are created again.
+    :param cur: cursor
+    """
+    for view, (table, snapshot, indexed_columns) in SNAPSHOT_VIEWS.items():
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL AND NOT EXISTS "
+                    "(SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = %s)",
+                    (view, view, SNAPSHOT_ROW))
+        if cur.fetchone()[0]:
+            cur.execute(sql.SQL("DROP MATERIALIZED VIEW {}").format(sql.Identifier(view)))
+
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (created_at)")
+                    .format(sql.Identifier(f"{table}_created_at"), sql.Identifier(table)))
+        cur.execute(sql.SQL("CREATE MATERIALIZED VIEW IF NOT EXISTS {} AS "
+                            "SELECT row_number() OVER () AS {}, * FROM {} WHERE created_at = ({})")
+                    .format(sql.Identifier(view), sql.Identifier(SNAPSHOT_ROW), sql.Identifier(table),
+                            sql.SQL(snapshot.format(table=table))))
+        cur.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})")
+                    .format(sql.Identifier(f"{view}_{SNAPSHOT_ROW}"), sql.Identifier(view),
+                            sql.Identifier(SNAPSHOT_ROW)))
+        for column in indexed_columns:
+            cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})")
+                        .format(sql.Identifier(f"{view}_{column}"), sql.Identifier(view), sql.Identifier(column)))
+
+def refresh_snapshot_views(tablename=None, only_stale=False):
+    """
+    Create the snapshot views that do not exist and refresh the views of a table. To be run by the loaders after
+    loading a new snapshot of a table (needs DDL rights, readers never create nor refresh views).
+    Views are refreshed concurrently: readers keep reading the previous rows during the refresh.
+    :param tablename: table whose views are refreshed, None refreshes all of them
+    :param only_stale: refresh only views whose created_at is not the one of their snapshot
+    (a cheap check, MAX(created_at) is read from the index)
+    """
+    global _snapshot_views_checked_at
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            # views are created once, even when many loaders run together
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('snapshot_views'))")
+            create_snapshot_views(cur)
+            for view, (table, snapshot, _) in SNAPSHOT_VIEWS.items():
+                if tablename is not None and table != tablename:
+                    continue
+                if only_stale:
+                    cur.execute(sql.SQL("SELECT (SELECT MAX(created_at) FROM {}) IS NOT DISTINCT FROM ({})")
+                                .format(sql.Identifier(view), sql.SQL(snapshot.format(table=table))))
+                    if cur.fetchone()[0]:
+                        continue
+                cur.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(sql.Identifier(view)))
+
+    # readers of this process use the refreshed views right away
+    with _snapshot_views_lock:
+        _snapshot_views_checked_at = None
+
+
+def check_snapshot_views(cur):
+    """
+    Get the snapshot views that exist and hold the current snapshot of their table (read only queries)
+    :param cur: cursor
+    :return: set of view names
+    """
+    cur.execute("SELECT relname FROM pg_class WHERE relkind = 'm' AND relname = ANY(%s) "
+                "AND pg_table_is_visible(oid)", (list(SNAPSHOT_VIEWS),))
+    views = [row[0] for row in cur.fetchall()]
+    if len(views) == 0:
+        return set()
+
+    cur.execute(sql.SQL(" UNION ALL ").join(
+        sql.SQL("SELECT {}, (SELECT MAX(created_at) FROM {}) IS NOT DISTINCT FROM ({})")
+        .format(sql.Literal(view), sql.Identifier(view),
+                sql.SQL(SNAPSHOT_VIEWS[view][1].format(table=SNAPSHOT_VIEWS[view][0])))
+        for view in views))
+    return {view for view, fresh in cur.fetchall() if fresh}
+
+
+def get_fresh_snapshot_views():
+    """
+    Get the snapshot views readers can use (see check_snapshot_views), checked again every
+    SNAPSHOT_VIEWS_CHECK_INTERVAL: a view is used at most SNAPSHOT_VIEWS_CHECK_INTERVAL after a new snapshot was
+    loaded in its table without refreshing it
+    :return: frozenset of view names
+    """
+    global _snapshot_views_checked_at, _fresh_snapshot_views
+    with _snapshot_views_lock:
+        if _snapshot_views_checked_at is None or \
+                datetime.now() - _snapshot_views_checked_at > SNAPSHOT_VIEWS_CHECK_INTERVAL:
+            with pooled_connection() as conn:
+                with conn.cursor() as cur:
+                    _fresh_snapshot_views = frozenset(check_snapshot_views(cur))
+            _snapshot_views_checked_at = datetime.now()
+        return _fresh_snapshot_views
+
+
+def get_snapshot_rows_query(view):
+    """
+    Query reading the rows of a snapshot view from its table (when the view cannot be used)
+    :param view: key of SNAPSHOT_VIEWS
+    :return: SQL string
+    """
+    table, snapshot, _ = SNAPSHOT_VIEWS[view]
+    return f"SELECT * FROM {table} WHERE created_at = ({snapshot.format(table=table)})"
+
+# postgresql type oids (cursor.description type_code) handled by get_df_from_copy
+BOOL_OID = 16
+DATE_OID = 1082
+TIMESTAMP_OIDS = (1114, 1184)
+TEXT_OIDS = (25, 1042, 1043)
+
+
+def get_df_from_copy(cur, query, params=None):
+    """
+    Run a query with COPY ... TO STDOUT and parse the CSV with pandas: columns are parsed in bulk by the csv reader
+    instead of creating a Python object per value. Faster than fetchall for large tables.
+    Numbers are returned as int64/float64 (numeric too), dates as datetime.date, timestamps as datetime64.
+    :param cur: cursor
+    :param query: query (string or psycopg2.sql object, with %s placeholders)
+    :param params: values bound to the placeholders
+    :return: DataFrame
+    """
+    query = cur.mogrify(query, params).decode("utf-8").strip().rstrip(";")
+
+    # column types, without reading any row
+    cur.execute(f"SELECT * FROM ({query}) q LIMIT 0")
+    description = cur.description
+
+    buffer = io.BytesIO()
+    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+    buffer.seek(0)
+
+    dtype = {c.name: str for c in description if c.type_code in TEXT_OIDS}
+    parse_dates = [c.name for c in description if c.type_code == DATE_OID or c.type_code in TIMESTAMP_OIDS]
+    df = pd.read_csv(buffer, dtype=dtype, parse_dates=parse_dates, keep_default_na=False, na_values=[""],
+                     true_values=["t"], false_values=["f"])
+
+    # read_csv leaves the date columns of an empty result as object
+    for c in description:
+        if c.type_code == DATE_OID:
+            df[c.name] = pd.to_datetime(df[c.name]).dt.date
+        elif c.type_code in TIMESTAMP_OIDS:
+            df[c.name] = pd.to_datetime(df[c.name])
     return df
 
-def get_generic_info(ticker):
 
-    ticker_info = get_df_from_table("yahoo_equity_tickers", f"where symbol = '{ticker}'", most_recent=True).iloc[0]
-    ticker_additional_info = get_df_from_table("tickers_additional_info", f"where symbol = '{ticker}'").iloc[0]
-    company_name = ticker_info["long_name"]
-    country = ticker_additional_info["country"]
-    industry = ticker_additional_info["industry"]
+def get_df_from_table(tablename, where=";", most_recent=False, params=None, columns=None, previous_year=False,
+                      columnar=False):
+    """
+    Read a table into a DataFrame
+    :param tablename: name of the table
+    :param where: where clause, values should be passed as %s placeholders and bound with params
+    :param most_recent: keep only the rows with the most recent created_at
+    :param params: values bound to the %s placeholders of where
+    :param columns: list of columns to read, None reads all columns
+    :param previous_year: keep only the rows of the last created_at before the current year
+    :param columnar: read with COPY (see get_df_from_copy), for large tables
+    :return: DataFrame
+    """
+    view = None
+    if most_recent:
+        view = f"{tablename}_latest"
+    elif previous_year:
+        view = f"{tablename}_previous_year"
 
-    try:
-        region = country_to_region[country.replace(" ","")]
-    except:
+    if view is not None and view in get_fresh_snapshot_views():
+        # the view only has the rows of the snapshot
+        tablename = view
+    elif most_recent or previous_year:
+        snapshot = (LATEST_SNAPSHOT if most_recent else PREVIOUS_YEAR_SNAPSHOT).format(table=tablename)
+        if where == ";":
+            where = f" WHERE created_at = ({snapshot})"
+        else:
+            where += f" AND created_at = ({snapshot})"
+
+    if columns is None:
+        select = sql.SQL("*")
+    else:
+        select = sql.SQL(", ").join(map(sql.Identifier, columns))
+    query = sql.SQL("SELECT {} FROM {} {}").format(select, sql.Identifier(tablename), sql.SQL(where))
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if columnar:
+                df = get_df_from_copy(cur, query, params)
+            else:
+                cur.execute(query, params)
+                df = get_df_from_cursor(cur)
+
+    if SNAPSHOT_ROW in df.columns and tablename in SNAPSHOT_VIEWS:
+        df = df.drop(columns=[SNAPSHOT_ROW])
+    return df
+
+def get_df_from_prepared(name, params):
+    """
+    Run one of PREPARED_STATEMENTS. The statement is prepared the first time it is used on a connection, after that
+    only EXECUTE is sent and the server reuses the plan.
+    :param name: key of PREPARED_STATEMENTS
+    :param params: tuple of values for $1, $2, ...
+    :return: DataFrame
+    """
+    statement = PREPARED_STATEMENTS[name]
+    # snapshot views that cannot be used are replaced by their table
+    fresh_views = get_fresh_snapshot_views()
+    if any(view in statement and view not in fresh_views for view in SNAPSHOT_VIEWS):
+        name = f"{name}_from_tables"
+        for view in SNAPSHOT_VIEWS:
+            statement = statement.replace(view, f"({get_snapshot_rows_query(view)})")
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if name not in conn.prepared_statements:
+                cur.execute(sql.SQL("PREPARE {} AS ").format(sql.Identifier(name)) + sql.SQL(statement))
+                conn.prepared_statements.add(name)
+            cur.execute(sql.SQL("EXECUTE {} ({})").format(sql.Identifier(name),
+                                                        sql.SQL(", ").join(sql.Placeholder() * len(params))), params)
+            df = get_df_from_cursor(cur)
+    return df
+
+def get_generic_info_batch(tickers):
+    """
+    Get name, country, industry, region and currencies of many tickers with a single query.
+    Country is mapped to region with country_to_region ("Global" if not found), industry is mapped to Damodaran
+    industries with industry_translation ("Total Market" if not found).
+    :param tickers: list of tickers
+    :return: DataFrame indexed by ticker with company_name, country, industry, region, currency, financial_currency.
+    Tickers not found are not included.
+    """
+    df = get_df_from_prepared("generic_info", (list(tickers),))
+    # a ticker could have more than one row of additional info, keep the first one
+    df = df.drop_duplicates("symbol").set_index("symbol")
+
+    region = df["country"].str.replace(" ", "").map(country_to_region)
+    for country in df.loc[region.isna(), "country"].unique():
         print("country not found in country_to_region dict:", country)
-        region = "Global"
 
-    try:
-        industry = industry_translation[industry]
-    except:
-        print(f"\n#######\nCould not find industry: {industry} mapping. "
+    industry = df["industry"].map(industry_translation)
+    for i in df.loc[industry.isna(), "industry"].unique():
+        print(f"\n#######\nCould not find industry: {i} mapping. "
               f"Check industry_translation dictionary.\n#######\n")
-        industry = "Total Market"
 
-    return company_name, country, industry, region
+    return pd.DataFrame({
+        "company_name": df["long_name"],
+        "country": df["country"],
+        "industry": industry.fillna("Total Market"),
+        "region": region.fillna("Global"),
+        "currency": df["currency"],
+        "financial_currency": df["financial_currency"],
+    }, index=df.index)
+
+def get_generic_info(ticker):
+
+    info = get_generic_info_batch([ticker]).iloc[0]
+
+    return info["company_name"], info["country"], info["industry"], info["region"]
+
+# Tables where valuation outputs are saved: table -> columns identifying the rows of one valuation.
+# Writing the rows of a (ticker, created_at) replaces the rows already saved for it.
+VALUATION_OUTPUT_TABLES = {
+    "valuation_company_info": ["ticker", "created_at"],
+    "valuation_financial_data": ["ticker", "created_at"],
+    "valuation_geo_segments": ["ticker", "created_at"],
+    "valuation_summary": ["ticker", "created_at"],
+}
+
+def get_sql_type(series):
+    """
+    Get the postgresql type of a DataFrame column
+    :param series: column
+    :return: type name
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(series):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(series):
+        return "DOUBLE PRECISION"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "TIMESTAMP"
+
+    values = series.dropna()
+    if len(values) > 0:
+        if isinstance(values.iloc[0], datetime):
+            return "TIMESTAMP"
+        if isinstance(values.iloc[0], date):
+            return "DATE"
+        if isinstance(values.iloc[0], (int, float)):
+            return "DOUBLE PRECISION"
+    return "TEXT"
+
+
+# postgresql names (format_type) of the types of get_sql_type
+SQL_TYPE_NAMES = {
+    "boolean": "BOOLEAN",
+    "bigint": "BIGINT",
+    "double precision": "DOUBLE PRECISION",
+    "timestamp without time zone": "TIMESTAMP",
+    "date": "DATE",
+    "text": "TEXT",
+}
+
+
+def get_common_sql_type(type_a, type_b):
+    """
+    Get a type that can hold the values of two types of get_sql_type
+    :param type_a: type name
+    :param type_b: type name
+    :return: type name
+    """
+    if type_a == type_b:
+        return type_a
+    if {type_a, type_b} <= {"BIGINT", "DOUBLE PRECISION"}:
+        return "DOUBLE PRECISION"
+    if {type_a, type_b} <= {"DATE", "TIMESTAMP"}:
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def create_table_from_df(cur, df, tablename, key_columns):
+    """
+    Create a table with the columns of a DataFrame, indexed on key_columns, if it does not exist.
+    If it exists, the columns of the DataFrame it does not have are added and the columns whose type cannot hold the
+    values of the DataFrame are widened (BIGINT to DOUBLE PRECISION, DATE to TIMESTAMP, else to TEXT).
+    :param cur: cursor
+    :param df: DataFrame
+    :param tablename: name of the table
+    :param key_columns: columns of the index
+    """
+    columns = sql.SQL(", ").join(sql.SQL("{} {}").format(sql.Identifier(c), sql.SQL(get_sql_type(df[c])))
+                                 for c in df.columns)
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} ({})").format(sql.Identifier(tablename), columns))
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})")
+                .format(sql.Identifier(f"{tablename}_key"), sql.Identifier(tablename),
+                        sql.SQL(", ").join(map(sql.Identifier, key_columns))))
+
+    cur.execute("SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+                "WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped", (tablename,))
+    table_types = dict(cur.fetchall())
+
+    changes = []
+    for c in df.columns:
+        sql_type = get_sql_type(df[c])
+        if c not in table_types:
+            changes.append(sql.SQL("ADD COLUMN IF NOT EXISTS {} {}").format(sql.Identifier(c), sql.SQL(sql_type)))
+            continue
+        # a column without values says nothing about its type, columns of other types are left as they are
+        table_type = SQL_TYPE_NAMES.get(table_types[c])
+        if table_type is None or df[c].isna().all():
+            continue
+        common_type = get_common_sql_type(table_type, sql_type)
+        if common_type != table_type:
+            changes.append(sql.SQL("ALTER COLUMN {c} TYPE {t} USING {c}::{t}")
+                           .format(c=sql.Identifier(c), t=sql.SQL(common_type)))
+    if len(changes) > 0:
+        cur.execute(sql.SQL("ALTER TABLE {} {}").format(sql.Identifier(tablename), sql.SQL(", ").join(changes)))
+
+
+def get_key_batches(df, key_columns, batch_size):
+    """
+    Split a DataFrame in batches of about batch_size rows, rows with the same key are always in the same batch
+    :param df: DataFrame
+    :param key_columns: columns of the key
+    :param batch_size: number of rows per batch
+    :return: list of DataFrames
+    """
+    codes = df.groupby(key_columns, sort=False, dropna=False).ngroup().to_numpy()
+    order = codes.argsort(kind="stable")
+    df = df.iloc[order]
+    codes = codes[order]
+
+    batches = []
+    start = 0
+    while start < len(df):
+        end = min(start + batch_size, len(df))
+        # extend the batch to the end of the last key
+        while end < len(df) and codes[end] == codes[end - 1]:
+            end += 1
+        batches.append(df.iloc[start:end])
+        start = end
+    return batches
+
+def copy_df_to_table(df, tablename, key_columns, batch_size=50000):
+    """
+    Upsert the rows of a DataFrame with COPY. Every batch is copied into a temporary staging table, the rows of the
+    target table with the same keys are deleted and the staging rows are inserted, in a single transaction.
+    The table is created if it does not exist, and updated to hold the columns of the DataFrame if it does.
+    :param df: DataFrame
+    :param tablename: target table
+    :param key_columns: columns identifying the rows to replace
+    :param batch_size: number of rows per transaction
+    """
+    if df is None or df.empty:
+        return
+
+    columns = sql.SQL(", ").join(map(sql.Identifier, df.columns))
+    keys = sql.SQL(" AND ").join(sql.SQL("t.{k} = s.{k}").format(k=sql.Identifier(k)) for k in key_columns)
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            create_table_from_df(cur, df, tablename, key_columns)
+
+    for batch in get_key_batches(df, key_columns, batch_size):
+        buffer = io.StringIO()
+        batch.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("CREATE TEMP TABLE staging (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP")
+                            .format(sql.Identifier(tablename)))
+                cur.copy_expert(sql.SQL("COPY staging ({}) FROM STDIN WITH (FORMAT csv)").format(columns), buffer)
+                cur.execute(sql.SQL("DELETE FROM {} t USING (SELECT DISTINCT {} FROM staging) s WHERE {}")
+                            .format(sql.Identifier(tablename),
+                                    sql.SQL(", ").join(map(sql.Identifier, key_columns)), keys))
+                cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM staging")
+                            .format(sql.Identifier(tablename), columns, columns))
+
+class ValuationOutputWriter:
+    """
+    Collect the DataFrames returned by valuation and save them with COPY every batch_companies companies.
+    Anything that is not a DataFrame (e.g. the None frames of a failed valuation) is skipped.
+    Usage:
+        with ValuationOutputWriter() as writer:
+            for cik in ciks:
+                *_, company_info_df, financial_data_df, geo_segments_df, summary_df = valuation(cik)
+                writer.add(company_info_df, financial_data_df, geo_segments_df, summary_df)
+    """
+
+    def __init__(self, batch_companies=1000):
+        self.batch_companies = batch_companies
+        self.frames = {t: [] for t in VALUATION_OUTPUT_TABLES}
+        self.companies = 0
+
+    def add(self, company_info_df, financial_data_df, geo_segments_df, summary_df=None):
+        for tablename, df in zip(VALUATION_OUTPUT_TABLES,
+                                 [company_info_df, financial_data_df, geo_segments_df, summary_df]):
+            if isinstance(df, pd.DataFrame) and not df.empty:
+                self.frames[tablename].append(df)
+        self.companies += 1
+        if self.companies >= self.batch_companies:
+            self.flush()
+
+    def flush(self):
+        for tablename, frames in self.frames.items():
+            if len(frames) > 0:
+                copy_df_to_table(pd.concat(frames, ignore_index=True), tablename, VALUATION_OUTPUT_TABLES[tablename])
+        self.frames = {t: [] for t in VALUATION_OUTPUT_TABLES}
+        self.companies = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
 
 
+if __name__ == '__main__':
+    # set up the snapshot views and refresh the stale ones (e.g. after loading reference tables by hand)
+    refresh_snapshot_views(only_stale=True)
@@ -3,13 +3,14 @@ import traceback
 from datetime import datetime
 
 import pandas as pd
-import pymongo
 from bs4 import BeautifulSoup
 
 import mongodb
+import storage
 from edgar_utils import company_from_cik, AAPL_CIK, download_all_cik_submissions, download_submissions_documents
 from openai_interface import summarize_section
-from postgresql import get_df_from_table, country_to_region, area_to_repr_country
+from postgresql import country_to_region, area_to_repr_country
+from reference_data import get_reference_data
 
 
 def restructure_parsed_10k(doc):
@@ -186,7 +187,7 @@ def sections_summary(doc, verbose=False):
         print(f"{section_title} original_len: {original_len} summary_len: {summary_len} reduction: {reduction}% "
               f"cost: {cost}$ duration:{duration}s used {model} w/ chain {chain_type}")
 
-    mongodb.upsert_document("items_summary", result)
+    storage.upsert_document("items_summary", result)
 
     total_duration = round(time.time() - total_start_time, 1)
 
@@ -291,7 +292,7 @@ def map_geographic_area(string):
     elif "northamerica" in string:
         return "North America"
 
-def geography_distribution(segments, ticker):
+def geography_distribution(segments, ticker, reference_data=None):
 
     df = pd.DataFrame(segments)
 
@@ -357,7 +358,9 @@ def geography_distribution(segments, ticker):
 
     # MAP SEGMENTS
     # 1st try and match countries
-    country_stats = get_df_from_table("damodaran_country_stats", most_recent=True)[["country","alpha_2_code"]]
+    if reference_data is None:
+        reference_data = get_reference_data()
+    country_stats = reference_data.country_stats[["country","alpha_2_code"]]
     df = pd.merge(df, country_stats, left_on="segment", right_on="alpha_2_code", how="left").drop("alpha_2_code", axis=1)
 
     # 2st try and map regions
@@ -404,10 +407,9 @@ def try_geo_segments():
     # url = "https://www.sec.gov/Archives/edgar/data/2098/000156459023003422/acu-10k_20221231.htm" # ACU 10-K
     # url = "https://www.sec.gov/Archives/edgar/data/4447/000162828023005059/hes-20221231.htm" # HES 10-K
 
-    docs = mongodb.get_collection_documents("documents")
+    docs = mongodb.iter_collection("documents", {"form_type": "10-K"}, mongodb.DOCUMENT_METADATA_FIELDS)
     for doc in docs:
-        if doc["form_type"] != "10-K":
-            continue
+        doc = mongodb.FilingDocument(doc)
 
         print(doc["_id"])
         ticker = doc["_id"].split("/")[-1].split("-")[0]
@@ -423,27 +425,32 @@ def get_last_document(cik, form_type):
     download_all_cik_submissions(cik)
     download_submissions_documents(cik, forms_to_download=("10-K", "10-Q", "8-K",), years=1)
 
-    collection = mongodb.get_collection("documents")
-    docs = collection.find({"cik": cik, "form_type": form_type})
+    # filing_date is stored as yyyy-mm-dd, so the string order is the chronological order
+    docs = storage.find_documents("documents", cik=cik, form_type=form_type, sort=storage.DESCENDING, limit=1)
 
-    last_doc = None
-    last_date = None
-    for doc in docs:
-        filing_date = datetime.strptime(doc["filing_date"], "%Y-%m-%d")
-        if last_date is None or filing_date > last_date:
-            last_date = filing_date
-            last_doc = doc
+    return docs[0] if len(docs) > 0 else None
 
-    return last_doc
+def get_last_documents(ciks, form_type="10-K"):
+    """
+    Batch version of get_last_document. Retrieve the most recent document of form_type for many companies
+    with a single aggregation.
+    Submissions are not downloaded here, documents must already be in the storage.
+    :param ciks: list of company ciks
+    :param form_type: form type of the documents (10-K, 10-Q, 8-K)
+    :return: dictionary {cik: document}, companies without a document of form_type are not included.
+    html is lazily loaded (see mongodb.FilingDocument)
+    """
+    return storage.get_last_documents(ciks, form_type)
 
 def get_recent_docs(cik, filing_date):
-    collection = mongodb.get_collection("documents")
-    docs = collection.find({"cik": cik, "filing_date": {"$gte":filing_date}})
-
-    # sort by date asc
-    docs = docs.sort("filing_date", pymongo.ASCENDING)
-
-    return docs
+    """
+    Get metadata (no html) of the documents of a company filed since filing_date
+    :param cik: company cik
+    :param filing_date: yyyy-mm-dd
+    :return: list of documents metadata, sorted by filing_date
+    """
+    return storage.find_documents("documents", cik=cik, filing_date_gte=filing_date, sort=storage.ASCENDING,
+                                  projection=mongodb.DOCUMENT_METADATA_FIELDS)
 
 
 if __name__ == '__main__':
@@ -1,18 +1,26 @@
 import datetime
+import pickle
 import traceback
 
+import numpy as np
 import pandas as pd
-import mongodb
+
+import storage
 from edgar_utils import company_from_cik, cik_from_ticker, download_financial_data
-from postgresql import get_df_from_table, get_generic_info
+from financial_facts import FactTable, add_frame_columns, get_facts_fingerprint
+from measure_spec import MEASURES, STEPS, OUTPUTS, ANNUAL_REPORT_MEASURE, ANNUAL_REPORT_QUARTER_MEASURES, \
+    MOST_RECENT, TTM, YEARLY, HOOK, CONTEXT
+from postgresql import get_generic_info_batch
 from qualitative_analysis import get_last_document, extract_segments, geography_distribution, get_recent_docs, \
     sections_summary
+from reference_data import get_reference_data
 from utils import parse_document, find_auditor
 from valuation_helper import convert_currencies, get_target_info, get_normalized_info, get_dividends_info, \
     get_final_info, calculate_liquidation_value, dividends_valuation, fcff_valuation, get_status, summary_valuation, \
     r_and_d_amortization, get_growth_ttm, capitalize_rd, debtize_op_leases, get_roe_roc, get_spread_from_dscr, \
     company_complexity, company_share_diluition, get_company_type, currency_bond_yield, get_industry_data
 from yahoo_finance import get_current_price_from_yahoo
+from yearly_series import YearlySeries
 
 EARNINGS_TTM = "EARNINGS_TTM"
 EARNINGS_NORM = "EARNINGS_NORM"
@@ -24,18 +32,26 @@ STATUS_OK = "OK"
 STATUS_NI = "NI"
 STATUS_KO = "KO"
 
+# version of the extraction (measure_spec.py, ExtractionPlan, extraction hooks and helpers), increase it when they change
+# so that cached extractions (financial_extractions collection) are computed again
+EXTRACTOR_VERSION = 2
+
 def build_financial_df(doc, measure, unit="USD", tax="us-gaap"):
 
     """
     Build a DataFrame from a company financial document (containing all history and all measures).
     DataFrame is built on a specific subsection of the document, identified with taxonomy, measure, unit
-    :param doc: company financial document
+    :param doc: company financial document, or its FactTable (parsed once, the DataFrame is shared and must not be
+    modified)
     :param measure: measure we are interest in
     :param unit: unit of measure (usually is a single one for each measure)
     :param tax: taxonomy
     :return: DataFrame
     """
 
+    if isinstance(doc, FactTable):
+        return doc.get(measure, unit, tax)
+
     try:
         data = doc["facts"][tax][measure]["units"][unit]
     except:
@@ -63,42 +79,47 @@ def build_financial_df(doc, measure, unit="USD", tax="us-gaap"):
 
     try:
         df = df[~df.frame.isna()]
+        df = add_frame_columns(df)
     except:
         df = df[0:0]
 
     return df
 
-def get_ttm_from_df(df):
+def get_ttm_from_facts(df, keys):
     """
-    Compute TTM (trailing twelve months) value from a DataFrame containing quarterly and annual values.
-    :param df: DataFrame containing quarterly and annual values
-    :return: ttm value, year of last annual value in DataFrame
+    Compute TTM (trailing twelve months) of many measures at once: for every measure, last annual value + quarterly
+    values after it - corresponding quarterly values one year before (same frame one year before).
+    :param df: facts DataFrame (FactTable.df or a selection of it, or the facts of many companies) with start, end, val,
+    frame and the frame columns of add_frame_columns, rows of each measure in document order
+    :param keys: columns identifying a measure, e.g. ["tax", "measure", "unit"] (+ "cik" for many companies)
+    :return: DataFrame indexed by keys with columns value (ttm) and date (end of last annual value), measures without
+    an annual value are not in the result
     """
 
-    # create a copy as we are going to edit and filter it
-    ttm_df = df.copy()
+    # rows with a frame (as build_financial_df), annual and quarterly periods only, pos keeps the document order
+    ttm_df = df[df.frame.notna()].reset_index(drop=True)
+    ttm_df = ttm_df.assign(period=(ttm_df["end"] - ttm_df["start"]).dt.days, pos=np.arange(len(ttm_df)))
+    ttm_df = ttm_df[(ttm_df.frame_quarter == 0) | (ttm_df.period < 100)]
+    ttm_df = ttm_df.assign(group=ttm_df.groupby(keys, sort=False).ngroup().to_numpy(),
+                           frame_key=ttm_df.frame_year * 100 + ttm_df.frame_quarter * 10 + ttm_df.frame_instant)
 
-    # Get last annual value
-    try:
-        # Keep only annual and quarterly periods
-        ttm_df["period"] = (ttm_df["end"] - ttm_df["start"]).dt.days
-        ttm_df = ttm_df[~(ttm_df.frame.str.contains("Q")) | ((ttm_df.frame.str.contains("Q")) & (ttm_df.period < 100))]
-        last_yearly_row = ttm_df[ttm_df.period > 100].iloc[-1]
-    except:
-        return None, None
+    # last annual row of each measure
+    last_yearly_rows = ttm_df[ttm_df.period > 100].groupby("group").tail(1).set_index("group")
+    ttm_df = ttm_df[ttm_df.group.isin(last_yearly_rows.index)]
 
-    # Get quarterly values AFTER the annual value
-    post_quarterly_rows = ttm_df[ttm_df.index > last_yearly_row.name]
+    # quarterly values AFTER the annual value
+    post_quarterly_rows = ttm_df[ttm_df.pos.to_numpy() > last_yearly_rows.pos.reindex(ttm_df.group).to_numpy()]
 
-    # Get corresponding quarterly values BEFORE the annual value
-    pre_frames = list(post_quarterly_rows.frame)
-    pre_frames = [x[:2] + str(int(x[2:6]) - 1) + x[6:] for x in pre_frames]
-    pre_quarterly_rows = ttm_df[ttm_df.frame.isin(pre_frames)]
+    # corresponding quarterly values BEFORE the annual value (same frame one year before), each row counted once
+    pre_frame_keys = post_quarterly_rows[["group"]].assign(frame_key=post_quarterly_rows.frame_key - 100) \
+        .drop_duplicates()
+    pre_quarterly_rows = ttm_df.merge(pre_frame_keys, on=["group", "frame_key"])
 
-    # TTM = annual value + quarterly values after - corresponding quarterly values before
-    ttm = last_yearly_row.val + post_quarterly_rows.val.sum() - pre_quarterly_rows.val.sum()
+    post_sum = post_quarterly_rows.groupby("group").val.sum().reindex(last_yearly_rows.index, fill_value=0)
+    pre_sum = pre_quarterly_rows.groupby("group").val.sum().reindex(last_yearly_rows.index, fill_value=0)
 
-    return ttm, last_yearly_row.end
+    result = last_yearly_rows[keys].assign(value=last_yearly_rows.val + post_sum - pre_sum, date=last_yearly_rows.end)
+    return result.set_index(keys)[["value", "date"]]
 
 def get_most_recent_value_from_df(df):
     """
@@ -113,8 +134,8 @@ def get_last_annual_report_date_and_fy(df):
     if df is None:
         return None, None
 
-    year_df = df[~df.frame.str.contains("Q")]
-    dates = list((year_df.frame.str.replace("CY", "")).astype(int))
+    year_df = df[df.frame_quarter == 0]
+    dates = list(year_df.frame_year)
 
     last_annual_report_date = year_df.iloc[-1].end if len(year_df) > 0 else None
     last_annual_report_fy = dates[-1] if len(dates) > 0 else None
@@ -131,13 +152,12 @@ def get_quarter_of_annual_report(df, last_annual_report_date, last_annual_report
         return None, None
 
     # frame is a string CYXXXXQXI, we want the X between Q and I
-    try:
-        quarter_of_annual_report = last_annual_report_row.iloc[0]["frame"][7]
-    except:
+    quarter_of_annual_report = last_annual_report_row.iloc[0]["frame_quarter"]
+    if quarter_of_annual_report == 0:
         print(last_annual_report_row)
         return None, None
 
-    year_bs = int(last_annual_report_row.frame.iloc[0][2:6])
+    year_bs = last_annual_report_row.iloc[0]["frame_year"]
     years_diff = year_bs - last_annual_report_fy
 
     return quarter_of_annual_report, years_diff
@@ -152,11 +172,7 @@ def get_yearly_values_from_df(df, instant=False, quarter_of_annual_report=None,
     :param quarter_of_annual_report: in case of instant measure, we also need the quarter when the annual report is
     released
     :param years_diff: used when the fiscal year ends in a different solar year
-    :return: dict {
-        "dates": [date1, date2, ..., dateN],
-        "values": [val1, val2, ..., valN],
-        "last_annual_report_date": date
-    }
+    :return: YearlySeries (series["dates"] = [year1, ..., yearN], series["values"] = [val1, ..., valN])
     """
 
     # create a copy as we are going to edit and filter it
@@ -166,121 +182,17 @@ def get_yearly_values_from_df(df, instant=False, quarter_of_annual_report=None,
     if not instant:
 
         # get only annual frames
-        year_df = year_df[~year_df.frame.str.contains("Q")]
-        dates = list((year_df.frame.str.replace("CY", "")).astype(int))
+        year_df = year_df[year_df.frame_quarter == 0]
 
-        return {"dates": dates,
-                "values": list(year_df.val)}
+        return YearlySeries.from_years(year_df.frame_year.to_numpy(), year_df.val.to_numpy())
 
     # balance sheet
     else:
 
         # keep only only rows with quarters of annual reports
-        year_df = year_df[year_df.frame.str.contains(f"Q{quarter_of_annual_report}I")]
-        year_df["frame"] = year_df.frame.str.replace("CY", "").str.replace(f"Q{quarter_of_annual_report}I","").astype(int) - years_diff
-
-        return {"dates": list(year_df.frame),
-                "values": list(year_df.val)}
-
-def get_values_from_measures(doc, measures, get_ttm=True, get_most_recent=True, get_yearly=True, instant=False,
-                             quarter_of_annual_report=None, years_diff=0, debug=False, unit="USD", tax="us-gaap"):
-
-    """
-    Retrieve requested financial values from company financial document (containing all history and all measures).
-    Measures are interpreted in a hierarchical way, meaning that if we have a value for 2020 for the first measure,
-    and a value for 2020 for the second measure, we are going to keep the first.
-    This is done in order to account for different possible measures that represent the same metric but could be present
-    in a company but not in another. The hierarchy is useful in case a company has more than one measure and we need
-    to choose which one to keep
-    :param doc: company financial document
-    :param measures: measures we are interest in (in order of "importance")
-    :param get_ttm: bool, whether to compute ttm value
-    :param get_most_recent: bool, whether to compute most recent value
-    :param get_yearly: bool, whether to compute yearly values
-    :param instant: bool, indicates if the measures are instantaneous (snapshot, balance sheet) or not (period,
-    income statement / cashflow statement)
-    :param quarter_of_annual_report: quarter of annual report, used for instant measures
-    :param years_diff: difference between fiscal year and solar year, used for instant measures
-    :param debug: bool, print debug statements
-    :param unit: unit for build_financial_df
-    :param tax: taxonomy for build_financial_df
-    :return: most recent value, ttm value, yearly values (0 or empty if not requested)
-    """
-
-    ttm = 0
-    ttm_year = None
-    most_recent = 0
-    most_recent_date = None
-    yearly = {"dates": [], "values": []}
-
-    for m in measures:
-
-        # Build the DataFrame
-        df = build_financial_df(doc, m, unit, tax)
-
-        # The df is None if the company does not have the measure m in its financial data
-        if df is None or df.empty:
-            continue
-
-        if get_ttm:
-
-            # Get TTM
-            ttm_value_tmp, ttm_year_tmp = get_ttm_from_df(df)
-
-            if ttm_value_tmp is not None:
-
-                # We override ttm if we have a more recent value
-                if ttm_year is None or ttm_year_tmp > ttm_year:
-                    ttm = ttm_value_tmp
-                    ttm_year = ttm_year_tmp
-
-                if debug:
-                    print(m, ttm_year_tmp, ttm_value_tmp)
-
-        if get_most_recent:
-
-            # Get most recent value
-            most_recent_tmp = get_most_recent_value_from_df(df)
+        year_df = year_df[(year_df.frame_quarter == quarter_of_annual_report) & year_df.frame_instant]
 
-            if most_recent_tmp["value"] is not None:
-
-                # We override most_recent_value if we have a more recent value
-                if most_recent_date is None or most_recent_tmp["date"] > most_recent_date:
-                    most_recent_date = most_recent_tmp["date"]
-                    most_recent = most_recent_tmp["value"]
-
-                if debug:
-                    print(m, most_recent_tmp["date"], most_recent_tmp["value"])
-
-        if get_yearly:
-
-            # Get yearly values
-            yearly_tmp = get_yearly_values_from_df(df, instant, quarter_of_annual_report, years_diff)
-
-            if yearly_tmp is not None:
-
-                # for each date
-                for i, d in enumerate(yearly_tmp["dates"]):
-
-                    # if we don't have it already (hierarchical), we add the values
-                    if d not in yearly["dates"]:
-                        yearly["dates"].append(d)
-                        yearly["values"].append(yearly_tmp["values"][i])
-
-                if debug:
-                    print(m, yearly_tmp)
-
-    # sort dates and values from the least recent to the most recent
-    sort = sorted(zip(yearly["dates"], yearly["values"]))
-    yearly["dates"] = [x for x, _ in sort]
-    yearly["values"] = [x for _, x in sort]
-
-    if debug:
-        print("ttm", ttm)
-        print("most recent", most_recent)
-        print("yearly", yearly)
-
-    return {"date":most_recent_date, "value":most_recent}, {"date":ttm_year, "value":ttm}, yearly
+        return YearlySeries.from_years((year_df.frame_year - years_diff).to_numpy(), year_df.val.to_numpy())
 
 def merge_subsets_yearly(superset, subsets, must_include=None):
 
@@ -300,80 +212,10 @@ def merge_subsets_yearly(superset, subsets, must_include=None):
     :return:
     """
 
-    to_add = {"dates":[],"values":[]}
-
-    # if no must_include
-    if must_include is None:
-
-        # for each subset
-        for s in subsets:
-
-            # for each date in the subset
-            for i, d in enumerate(s["dates"]):
-
-                # if that date is not in superset
-                if d not in superset["dates"]:
-
-                    # if it's the first subset with that date, append the value
-                    if d not in to_add["dates"]:
-                        to_add["dates"].append(d)
-                        to_add["values"].append(s["values"][i])
-
-                    # else add the value to the existing one
-                    else:
-                        idx = to_add["dates"].index(d)
-                        to_add["values"][idx] += s["values"][i]
-
-    # if must_include
-    else:
-
-        if not isinstance(must_include, tuple):
-            raise Exception("must_include must be a tuple")
-
-        # get dates for the first must_include (all others in must_include must have the same dates for the date
-        # to be included)
-        tmp_dates = subsets[must_include[0]]["dates"]
-
-        remove_dates = []
-
-        # for each date
-        for d in tmp_dates:
+    if must_include is not None and not isinstance(must_include, tuple):
+        raise Exception("must_include must be a tuple")
 
-            # for each index in must_include
-            for m in must_include:
-
-                # if the subset does not have the date we remove it
-                s = subsets[m]
-                if d not in s["dates"]:
-                    remove_dates.append(d)
-
-        # keep only the dates where we have values for every must_include subset
-        must_include_dates = [x for x in tmp_dates if x not in remove_dates and x not in superset["dates"]]
-
-        # if none return
-        if len(must_include_dates) == 0:
-            return
-
-        # set to 0 the values for each date
-        for m in must_include_dates:
-            to_add["dates"].append(m)
-            to_add["values"].append(0)
-
-        # for each subset, add the value for the dates
-        for s in subsets:
-            for i, d in enumerate(s["dates"]):
-                if d in to_add["dates"]:
-                    idx = to_add["dates"].index(d)
-                    to_add["values"][idx] += s["values"][i]
-
-    for i, d in enumerate(to_add["dates"]):
-        superset["dates"].append(d)
-        superset["values"].append(to_add["values"][i])
-
-    # sort date and values in superset
-    sort = sorted(zip(superset["dates"], superset["values"]))
-    superset["dates"] = [x for x, _ in sort]
-    superset["values"] = [x for _, x in sort]
+    superset.merge_subsets(subsets, must_include)
 
 def merge_subsets_most_recent(superset, subsets):
 
@@ -412,54 +254,26 @@ def merge_subsets_most_recent(superset, subsets):
             if s["date"] == d:
                 superset["value"] += s["value"]
 
-def extract_shares(doc, quarter_of_annual_report, years_diff):
+class NoSharesException(Exception):
+    pass
+
+def equity_most_recent(values, context):
     """
-    Extract number of shares from company financial document
-    :param doc: company financial document
-    :return: number of common shares outstanding (most recent and annual)
+    Most recent equity: equity without minority interest + minority interest, if more recent than total equity
     """
+    most_recent_equity = values["equity"][MOST_RECENT]
+    most_recent_equity_no_mi = values["equity_no_mi"][MOST_RECENT]
 
-    df = build_financial_df(doc, "EntityCommonStockSharesOutstanding", unit="shares", tax="dei")
-
-    debug = False
-
-    if debug:
-        print(df.to_markdown())
-
-    try:
-        most_recent_shares = get_most_recent_value_from_df(df)
-    except:
-        most_recent_shares = {"date":None, "value":0}
-
-    measures = ["CommonStockSharesOutstanding"]
-
-    mr_common_shares, _, yearly_common_shares = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report,
-        years_diff=years_diff, get_ttm=False,
-        get_most_recent=True, debug=debug, unit="shares")
-
-    measures = ["WeightedAverageNumberOfSharesOutstandingBasic"]
-
-    mr_average_shares, _, yearly_average_shares = get_values_from_measures(
-        doc, measures, instant=False, quarter_of_annual_report=quarter_of_annual_report,
-        years_diff=years_diff, get_ttm=False,
-        get_most_recent=True, debug=debug, unit="shares")
-
-    merge_subsets_most_recent(most_recent_shares, [mr_common_shares])
-    merge_subsets_most_recent(most_recent_shares, [mr_average_shares])
-
-    try:
-        yearly_shares = get_yearly_values_from_df(df, instant=True, quarter_of_annual_report=quarter_of_annual_report,
-        years_diff=years_diff)
-
-        merge_subsets_yearly(yearly_common_shares, [yearly_average_shares])
-        merge_subsets_yearly(yearly_shares, [yearly_common_shares])
-
-    except:
-        merge_subsets_yearly(yearly_common_shares, [yearly_average_shares])
-        yearly_shares = yearly_common_shares
+    if most_recent_equity["date"] is None or \
+            (most_recent_equity_no_mi["date"] is not None and most_recent_equity_no_mi["date"] > most_recent_equity["date"]):
+        merge_subsets_most_recent(most_recent_equity, [most_recent_equity_no_mi, values["minority_interest"][MOST_RECENT]])
 
-    # in some filings the company report shares with a wrong unit of measure (million shares instead of thousand shares)
+def shares_unit(values, context):
+    """
+    In some filings the company report shares with a wrong unit of measure (million shares instead of thousand shares)
+    """
+    most_recent_shares = values["shares"][MOST_RECENT]
+    yearly_shares = values["shares"][YEARLY]
 
     try:
         max_num_shares = max(yearly_shares["values"])
@@ -469,288 +283,14 @@ def extract_shares(doc, quarter_of_annual_report, years_diff):
     yearly_shares["values"] = [x * 1000 if x / max_num_shares < 0.01 else x for x in yearly_shares["values"]]
     if most_recent_shares["value"] / max_num_shares < 0.01:
         most_recent_shares["value"] *= 1000
-    return {
-        "mr_shares": most_recent_shares,
-        "shares": yearly_shares,
-    }
 
-class NoSharesException(Exception):
-    pass
-
-def extract_income_statement(doc):
+def cash_most_recent(values, context):
     """
-    Extract income statement measures from company financial document.
-    Measures include:
-    - revenue
-    - R&D
-    - net income
-    - interest expense
-    - gross profit
-    - depreciation and amortization
-    - EBIT
-    :param doc: company financial document
-    :return: dict with ttm and yearly measures
+    Most recent cash: cash + restricted cash, if more recent than cash including restricted cash
     """
-
-    measures = [
-        "Revenues",
-        "RevenueFromContractWithCustomerExcludingAssessedTax",
-        "RevenueFromContractWithCustomerIncludingAssessedTax",
-        "SalesRevenueNet"
-    ]
-    _, ttm_revenue, yearly_revenue = get_values_from_measures(doc, measures, get_most_recent=False, debug=False)
-
-    last_annual_report_date = None
-    last_annual_report_fy = None
-    for m in measures:
-        df = build_financial_df(doc, m)
-        if df is not None and not df.empty and "frame" in df.columns:
-            annual_rd, annual_fy = get_last_annual_report_date_and_fy(df)
-            if last_annual_report_date is None or (annual_rd is not None and annual_rd > last_annual_report_date):
-                last_annual_report_date = annual_rd
-                last_annual_report_fy = annual_fy
-
-    #### R and D ####
-    measures = ["ResearchAndDevelopmentExpense"]
-    _, _, yearly_rd = get_values_from_measures(
-        doc, measures, get_ttm=False, get_most_recent=False, debug=False)
-
-    measures = ["ResearchAndDevelopmentExpenseExcludingAcquiredInProcessCost"]
-    _, _, yearly_rd_not_inprocess = get_values_from_measures(
-        doc, measures, get_ttm=False, get_most_recent=False, debug=False)
-
-    measures = ["ResearchAndDevelopmentInProcess"]
-    _, _, yearly_rd_inprocess = get_values_from_measures(
-        doc, measures, get_ttm=False, get_most_recent=False, debug=False)
-
-    merge_subsets_yearly(yearly_rd, [yearly_rd_not_inprocess, yearly_rd_inprocess])
-
-    #### Net Income ####
-    measures = [
-        "NetIncomeLoss",
-        "NetIncomeLossAvailableToCommonStockholdersBasic",
-        "NetIncomeLossAvailableToCommonStockholdersDiluted",
-        "ComprehensiveIncomeNetOfTax",
-        "IncomeLossFromContinuingOperations",
-
-        # including minority interest
-        "ProfitLoss",
-        "IncomeLossFromContinuingOperationsIncludingPortionAttributableToNoncontrollingInterest",
-        "IncomeLossFromSubsidiariesNetOfTax"
-    ]
-
-    _, ttm_net_income, yearly_net_income = get_values_from_measures(doc, measures, get_most_recent=False, debug=False)
-
-    #### Interest Expenses ####
-    measures = [
-        "InterestExpense",
-        "InterestAndDebtExpense",
-        "InterestPaid",
-        "InterestPaidNet",
-        "InterestCostsIncurred"]
-
-    _, ttm_interest_expenses, _ = get_values_from_measures(doc, measures, get_most_recent=False, get_yearly=False,
-                                                                                  debug=False)
-
-    # Probably we don't need yearly interest expenses
-    # measures = ["InterestExpenseDebt",
-    #             "InterestExpenseDebtExcludingAmortization"]
-    # _, ttm_ie_debt, yearly_ie_debt = get_values_from_measures(doc, measures, get_most_recent=False,
-    #                                                           debug=False)
-    #
-    # measures = ["InterestExpenseLongTermDebt"]
-    # _, ttm_ie_debt_lt, yearly_ie_debt_lt = get_values_from_measures(doc, measures, get_most_recent=False,
-    #                                                                 debug=False)
-    #
-    # measures = ["InterestExpenseShortTermBorrowings"]
-    # _, ttm_ie_debt_st, yearly_ie_debt_st = get_values_from_measures(doc, measures, get_most_recent=False,
-    #                                                                 debug=False)
-    # merge_subsets(yearly_ie_debt, [yearly_ie_debt_lt, yearly_ie_debt_st])
-    #
-    #
-    # measures = ["InterestExpenseBorrowings"]
-    # _, ttm_ie_borrowings, yearly_ie_borrowings = get_values_from_measures(doc, measures, get_most_recent=False,
-    #                                                                       debug=False)
-    # measures = ["InterestExpenseDeposits"]
-    # _, ttm_ie_deposits, yearly_ie_deposits = get_values_from_measures(doc, measures, get_most_recent=False,
-    #                                                                   debug=False)
-    # measures = ["InterestExpenseOther"]
-    # _, ttm_ie_others, yearly_ie_others = get_values_from_measures(doc, measures, get_most_recent=False,
-    #                                                               debug=False)
-    # measures = ["InterestExpenseRelatedParty"]
-    # _, ttm_ie_related, yearly_ie_related = get_values_from_measures(doc, measures, get_most_recent=False,
-    #                                                                 debug=False)
-    #
-    # merge_subsets(yearly_ie_borrowings, [yearly_ie_debt, yearly_ie_deposits, yearly_ie_others, yearly_ie_related])
-    # merge_subsets(yearly_interest_expenses, [yearly_ie_borrowings])
-
-
-
-    #### Gross Profit ####
-
-    if ttm_interest_expenses == 0:
-
-        measures = ["InterestExpenseBorrowings"]
-        _, ttm_ie_borrowings, _ = get_values_from_measures(doc, measures, get_most_recent=False, get_yearly=False,
-                                                           debug=False)
-
-        if ttm_ie_borrowings["value"] == 0:
-
-            measures = ["InterestExpenseDebt",
-                        "InterestExpenseDebtExcludingAmortization"]
-            _, ttm_ie_debt, _ = get_values_from_measures(doc, measures, get_most_recent=False, get_yearly=False,
-                                                                      debug=False)
-
-            if ttm_ie_debt["value"] == 0:
-
-                measures = ["InterestExpenseLongTermDebt"]
-                _, ttm_ie_debt_lt, _ = get_values_from_measures(doc, measures, get_most_recent=False, get_yearly=False,
-                                                                debug=False)
-                measures = ["InterestExpenseShortTermBorrowings"]
-                _, ttm_ie_debt_st, _ = get_values_from_measures(doc, measures, get_most_recent=False, get_yearly=False,
-                                                                debug=False)
-
-                merge_subsets_most_recent(ttm_ie_debt, [ttm_ie_debt_lt, ttm_ie_debt_st])
-
-
-            measures = ["InterestExpenseDeposits"]
-            _, ttm_ie_deposits, _ = get_values_from_measures(doc, measures, get_most_recent=False, get_yearly=False,
-                                                                              debug=False)
-            measures = ["InterestExpenseOther"]
-            _, ttm_ie_others, _ = get_values_from_measures(doc, measures, get_most_recent=False, get_yearly=False,
-                                                                          debug=False)
-            measures = ["InterestExpenseRelatedParty"]
-            _, ttm_ie_related, _ = get_values_from_measures(doc, measures, get_most_recent=False, get_yearly=False,
-                                                                            debug=False)
-
-            ttm_ie_borrowings = merge_subsets_most_recent(ttm_ie_borrowings,
-                                                          [ttm_ie_debt, ttm_ie_deposits, ttm_ie_others, ttm_ie_related])
-
-        ttm_interest_expenses = ttm_ie_borrowings
-
-    measures = ["Gross Profit"]
-    _, ttm_gross_profit, yearly_gross_profit = get_values_from_measures(doc, measures, get_most_recent=False,
-                                                                        debug=False)
-
-    #### Depreciation ####
-    measures = [
-        "DepreciationDepletionAndAmortization",
-        "DepreciationAmortizationAndAccretionNet"]
-    _, _, yearly_depreciation_amortization = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                                  debug=False)
-
-    measures = ["Depreciation"]
-    _, _, yearly_depreciation = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                        debug=False)
-
-    measures = ["AmortizationOfFinancingCostsAndDiscounts"]
-    _, _, yearly_amortization_fincost_disc = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                                  debug=False)
-
-    measures = ["AmortizationOfDebtDiscountPremium"]
-    _, _, yearly_amortization_disc = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                  debug=False)
-    measures = ["AmortizationOfFinancingCosts"]
-    _, _, yearly_amortization_fincost = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                        debug=False)
-
-    merge_subsets_yearly(yearly_amortization_fincost_disc, [yearly_amortization_disc, yearly_amortization_fincost])
-
-    measures = ["AmortizationOfDeferredCharges"]
-    _, _, yearly_amortization_charges = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                        debug=False)
-    measures = ["AmortizationOfDeferredSalesCommissions"]
-    _, _, yearly_amortization_comm = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                  debug=False)
-    measures = ["AmortizationOfIntangibleAssets"]
-    _, _, yearly_amortization_intan = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                    debug=False)
-
-    yearly_amortization = {"dates":[], "values":[]}
-    merge_subsets_yearly(yearly_amortization, [yearly_amortization_fincost_disc, yearly_amortization_charges,
-                                               yearly_amortization_comm, yearly_amortization_intan])
-    merge_subsets_yearly(yearly_depreciation_amortization, [yearly_depreciation, yearly_amortization])
-
-    #### EBIT ####
-    measures = ["OperatingIncomeLoss",
-                "IncomeLossFromContinuingOperationsBeforeInterestExpenseInterestIncomeIncomeTaxesExtraordinaryItemsNoncontrollingInterestsNet",
-                "IncomeLossFromContinuingOperationsBeforeIncomeTaxesMinorityInterestAndIncomeLossFromEquityMethodInvestments",
-                "IncomeLossFromContinuingOperationsBeforeIncomeTaxesExtraordinaryItemsNoncontrollingInterest",
-                "IncomeLossFromContinuingOperationsBeforeIncomeTaxesForeign",
-                "IncomeLossFromContinuingOperationsBeforeIncomeTaxesDomestic",
-                ]
-    _, ttm_ebit, yearly_ebit = get_values_from_measures(doc, measures, get_most_recent=False,
-                                                        debug=False)
-
-    return {
-        "ttm_revenue": ttm_revenue,
-        "ttm_gross_profit": ttm_gross_profit,
-        "ttm_ebit": ttm_ebit,
-        "ttm_net_income": ttm_net_income,
-        "ttm_interest_expenses": ttm_interest_expenses,
-        "revenue": yearly_revenue,
-        "gross_profit": yearly_gross_profit,
-        "rd": yearly_rd,
-        "ebit": yearly_ebit,
-        "depreciation": yearly_depreciation_amortization,
-        "net_income": yearly_net_income,
-        "last_annual_report_date": last_annual_report_date,
-        "last_annual_report_fy": last_annual_report_fy
-    }
-
-def extract_balance_sheet_current_assets(doc, quarter_of_annual_report, years_diff):
-    """
-    Extract balance sheet measures (Current Assets) from company financial document.
-    Measures include:
-    - cash
-    - inventory
-    - other assets
-    - receivables
-    - securities
-    :param doc: company financial document
-    :param quarter_of_annual_report: quarter of annual report
-    :param years_diff: difference between fiscal year and solar year
-    :return: dict with most recent and yearly measures
-    """
-
-    # No need for aggregate values
-    # #### ASSETS ####
-    # measures = ["Assets"]
-    # most_recent_assets, _, yearly_assets = get_values_from_measures(
-    #     doc, measures, instant=True, last_annual_report_date=last_annual_report_date, get_ttm=False, debug=False)
-    #
-    # #### Current Assets ####
-    # measures = ["AssetsCurrent"]
-    # most_recent_current_assets, _, yearly_current_assets = get_values_from_measures(
-    #     doc, measures, instant=True, last_annual_report_date=last_annual_report_date, get_ttm=False, debug=False)
-
-
-
-    #### Inventory ####
-
-    #### Cash ####
-    measures = ["CashCashEquivalentsRestrictedCashAndRestrictedCashEquivalents"]
-    most_recent_cash_and_restricted, _, yearly_cash_and_restricted = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["CashAndCashEquivalentsAtCarryingValue", "Cash"]
-    most_recent_cash, _, yearly_cash = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "RestrictedCashAndCashEquivalentsAtCarryingValue",
-        "RestrictedCashAndCashEquivalents",
-        "RestrictedCash",
-        "RestrictedCashAndInvestmentsCurrent",
-        "RestrictedCashCurrent"
-    ]
-    most_recent_restrictedcash, _, yearly_restrictedcash = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    merge_subsets_yearly(yearly_cash_and_restricted, [yearly_cash, yearly_restrictedcash], must_include=(0,))
+    most_recent_cash_and_restricted = values["cash_and_restricted"][MOST_RECENT]
+    most_recent_cash = values["cash"][MOST_RECENT]
+    most_recent_restrictedcash = values["restricted_cash"][MOST_RECENT]
 
     if most_recent_cash_and_restricted["date"] is None \
             or (most_recent_cash["date"] is not None and most_recent_cash["date"] > most_recent_cash_and_restricted["date"]):
@@ -760,725 +300,21 @@ def extract_balance_sheet_current_assets(doc, quarter_of_annual_report, years_di
         if most_recent_restrictedcash["date"] == most_recent_cash["date"]:
             most_recent_cash_and_restricted["value"] += most_recent_restrictedcash["value"]
 
-    #### Inventory ####
-    measures = [
-        "InventoryNet",
-        "InventoryGross",
-        "FIFOInventoryAmount",
-        "InventoryLIFOReserve",
-        "LIFOInventoryAmount",
-    ]
-    most_recent_inventory, _, yearly_inventory = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "RetailRelatedInventory",
-        "RetailRelatedInventoryMerchandise"
-    ]
-    most_recent_inventory_retail, _, yearly_inventory_retail = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "EnergyRelatedInventory"
-    ]
-    most_recent_inventory_energy, _, yearly_inventory_energy = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "PublicUtilitiesInventory"
-    ]
-    most_recent_inventory_utilities, _, yearly_inventory_utilities = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "InventoryRealEstate"
-    ]
-    most_recent_inventory_re, _, yearly_inventory_re = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "AirlineRelatedInventory"
-    ]
-    most_recent_inventory_airline, _, yearly_inventory_airline = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    merge_subsets_most_recent(most_recent_inventory,
-                              [most_recent_inventory_retail, most_recent_inventory_airline,
-                               most_recent_inventory_energy, most_recent_inventory_re, most_recent_inventory_utilities])
-    merge_subsets_yearly(yearly_inventory, [yearly_inventory_retail, yearly_inventory_airline, yearly_inventory_energy,
-                                            yearly_inventory_re, yearly_inventory_utilities])
-
-    #### Other Assets ####
-    measures = [
-        "OtherAssetsCurrent",
-        "OtherAssetsMiscellaneousCurrent",
-        "PrepaidExpenseAndOtherAssetsCurrent",
-        "OtherAssetsFairValueDisclosure",
-        "OtherAssetsMiscellaneous",
-        "PrepaidExpenseAndOtherAssets"
-    ]
-    most_recent_other_current_assets, _, yearly_other_current_assets = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["PrepaidExpenseCurrent"]
-    most_recent_prepaid_exp, _, yearly_prepaid_exp = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-    measures = ["PrepaidInsurance"]
-    most_recent_prepaid_ins, _, yearly_prepaid_ins = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-    measures = ["PrepaidTaxes",
-                "IncomeTaxesReceivable",
-                "IncomeTaxReceivable"]
-    most_recent_prepaid_tax, _, yearly_prepaid_tax = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-    merge_subsets_yearly(yearly_other_current_assets, [yearly_prepaid_exp, yearly_prepaid_ins, yearly_prepaid_tax])
-
-    merge_subsets_most_recent(most_recent_other_current_assets,
-                              [most_recent_prepaid_exp, most_recent_prepaid_ins, most_recent_prepaid_tax])
-
-    #### Receivables ####
-    measures = [
-        "AccountsAndOtherReceivablesNetCurrent",
-        "AccountsNotesAndLoansReceivableNetCurrent",
-        "ReceivablesNetCurrent",
-        "NontradeReceivablesCurrent"]
-    most_recent_receivables, _, yearly_receivables = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["AccountsReceivableNetCurrent",
-                "AccountsReceivableNet",
-                "AccountsReceivableGrossCurrent",
-                "AccountsReceivableGross"]
-    most_recent_ar, _, yearly_ar = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["LoansAndLeasesReceivableNetReportedAmount",
-                "LoansAndLeasesReceivableNetOfDeferredIncome",
-                "LoansReceivableFairValueDisclosure",
-                "LoansAndLeasesReceivableGrossCarryingAmount"]
-    most_recent_loans_rec, _, yearly_loans_rec = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["NotesReceivableNet",
-                "NotesReceivableFairValueDisclosure",
-                "NotesReceivableGross"]
-    most_recent_notes_rec, _, yearly_notes_rec = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    merge_subsets_yearly(yearly_receivables, [yearly_ar, yearly_loans_rec, yearly_notes_rec])
-    merge_subsets_most_recent(most_recent_receivables,
-                              [most_recent_ar, most_recent_loans_rec, most_recent_notes_rec])
-
-    #### Securities ####
-    measures = [
-        "MarketableSecurities"
-        "AvailableForSaleSecurities"]
-    most_recent_securities, _, yearly_securities = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["AvailableForSaleSecuritiesDebtSecurities"]
-    most_recent_debtsecurities, _, yearly_debtsecurities = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["AvailableForSaleSecuritiesEquitySecurities"]
-    most_recent_equitysecurities, _, yearly_equitysecurities = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    merge_subsets_yearly(yearly_securities, [yearly_debtsecurities, yearly_equitysecurities])
-    merge_subsets_most_recent(most_recent_securities,
-                              [most_recent_debtsecurities, most_recent_equitysecurities])
-
-    measures = ["DerivativeAssets",
-                "DerivativeAssetsCurrent"]
-    most_recent_derivatives, _, yearly_derivatives = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["HeldToMaturitySecurities",
-                "HeldToMaturitySecuritiesFairValue",
-                "HeldToMaturitySecuritiesCurrent",
-                ]
-    most_recent_held_securities, _, yearly_held_securities = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["AvailableForSaleSecuritiesNoncurrent",
-                "AvailableForSaleSecuritiesDebtSecuritiesNoncurrent",
-                ]
-    most_recent_non_curr_sec, _, yearly_non_curr_sec = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["MarketableSecuritiesCurrent",
-                "AvailableForSaleSecuritiesDebtSecuritiesCurrent"]
-    most_recent_marksecurities_cur, _, yearly_marksecurities_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["ShortTermInvestments"]
-    most_recent_st_inv, _, yearly_st_inv = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["MoneyMarketFundsAtCarryingValue"]
-    most_recent_mm, _, yearly_mm = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    merge_subsets_yearly(yearly_securities, [yearly_derivatives, yearly_held_securities, yearly_non_curr_sec,
-                                             yearly_marksecurities_cur, yearly_st_inv, yearly_mm])
-    merge_subsets_most_recent(most_recent_securities,
-                              [most_recent_derivatives, most_recent_held_securities, most_recent_non_curr_sec,
-                               most_recent_marksecurities_cur, most_recent_st_inv, most_recent_mm])
-
-    # merge_subsets(yearly_current_assets, [yearly_cash_and_restricted, yearly_inventory, yearly_other_current_assets,
-    #                                       yearly_receivables, yearly_securities])
-
-    return {
-        "mr_cash": most_recent_cash_and_restricted,
-        "cash": yearly_cash_and_restricted,
-        "mr_inventory": most_recent_inventory,
-        "inventory": yearly_inventory,
-        "mr_other_assets": most_recent_other_current_assets,
-        "other_assets": yearly_other_current_assets,
-        "mr_receivables": most_recent_receivables,
-        "receivables": yearly_receivables,
-        "mr_securities": most_recent_securities,
-        "securities": yearly_securities
-    }
-
-def extract_balance_sheet_noncurrent_assets(doc, quarter_of_annual_report, years_diff):
+def debt_other_borrowings(values, context):
     """
-    Extract balance sheet measures (Non-Current Assets) from company financial document.
-    Measures include:
-    - equity investments
-    - other financial assets
-    - PP&E
-    - investment property
-    - tax benefits
-    :param doc: company financial document
-    :param quarter_of_annual_report: quarter of annual report
-    :param years_diff: difference between fiscal year and solar year
-    :return: dict with most recent measures
+    Add mortgages and other borrowings to the most recent debt (same date only)
     """
-
-    # ##### Non current assets ####
-    # measures = ["AssetsNoncurrent",
-    #             "NoncurrentAssets"]
-    # most_recent_non_curr_asset, _, yearly_non_curr_asset = get_values_from_measures(
-    #     doc, measures, instant=True, last_annual_report_date=last_annual_report_date, get_ttm=False, debug=False)
-
-    #### Equity investments ####
-
-    #### Equity Investments ####
-    measures = [
-        "EquityMethodInvestmentAggregateCost",
-        "EquityMethodInvestments",
-        "InvestmentOwnedAtCost",
-        "Investments",
-        "InvestmentsInAffiliatesSubsidiariesAssociatesAndJointVentures",
-    ]
-    most_recent_equity_investments, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False,
-        debug=False)
-
-    measures = [
-        "EquityMethodInvestmentsFairValueDisclosure",
-        "InvestmentOwnedAtFairValue",
-        "InvestmentsFairValueDisclosure",
-    ]
-    most_recent_equity_inv_fv, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = ["EquitySecuritiesWithoutReadilyDeterminableFairValueAmount", ]
-    most_recent_equity_inv_notfv, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    # merge_subsets_yearly(yearly_equity_investments, [yearly_equity_inv_fv, yearly_equity_inv_notfv])
-    merge_subsets_most_recent(most_recent_equity_investments,
-                              [most_recent_equity_inv_fv, most_recent_equity_inv_notfv])
-
-    measures = ["MarketableSecuritiesNoncurrent"]
-    most_recent_securities_non_curr, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    # yearly_equity_investments_and_securities = {"dates": [], "values": []}
-    # merge_subsets_yearly(yearly_equity_investments_and_securities, [yearly_equity_investments, yearly_securities_non_curr])
-
-    merge_subsets_most_recent(most_recent_equity_investments, [most_recent_securities_non_curr])
-
-    #### Other financial assets ####
-    measures = [
-        "PrepaidExpenseNoncurrent",
-        "PrepaidExpenseOtherNoncurrent",
-    ]
-    most_recent_prepaid_non_curr, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = [
-        "RestrictedCashAndCashEquivalentsNoncurrent",
-        "RestrictedCashAndInvestmentsNoncurrent",
-        "RestrictedCashNoncurrent"
-    ]
-    most_recent_cash_non_curr, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = ["DerivativeAssetsNoncurrent", ]
-    most_recent_derivatives_non_curr, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = ["EscrowDeposit"]
-    most_recent_escrow, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    # yearly_other_financial_assets = {"dates": [], "values": []}
-    # merge_subsets_yearly(yearly_other_financial_assets, [yearly_prepaid_non_curr, yearly_cash_non_curr,
-    #                                                      yearly_derivatives_non_curr, yearly_escrow])
-
-    most_recent_other_financial_assets = {"date":None, "value":0}
-    merge_subsets_most_recent(most_recent_other_financial_assets,
-                              [most_recent_prepaid_non_curr, most_recent_cash_non_curr,
-                               most_recent_derivatives_non_curr, most_recent_escrow])
-
-    #### PP&E ####
-    measures = [
-        "PropertyPlantAndEquipmentNet",
-        "PropertyPlantAndEquipmentAndFinanceLeaseRightOfUseAssetAfterAccumulatedDepreciationAndAmortization"
-    ]
-    most_recent_ppe, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    #### Investment property ####
-    measures = [
-        "RealEstateInvestments",
-        "RealEstateInvestmentPropertyNet",
-        "RealEstateInvestmentPropertyAtCost",
-        "RealEstateHeldforsale"
-    ]
-    most_recent_property, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = ["InvestmentBuildingAndBuildingImprovements"]
-    most_recent_buildings, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = [
-        "LandAndLandImprovements",
-        "Land",
-    ]
-    most_recent_land, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    # merge_subsets_yearly(yearly_property, [yearly_buildings, yearly_land])
-    merge_subsets_most_recent(most_recent_property,
-                              [most_recent_buildings, most_recent_land])
-
-    # merge_subsets(yearly_non_curr_asset, [yearly_property, yearly_ppe, yearly_other_financial_assets,
-    #                                       yearly_equity_investments_and_securities])
-    # merge_subsets(yearly_assets, [yearly_current_assets, yearly_non_curr_asset])
-
-    #### Tax Benefits ####
-    measures = [
-        "UnrecognizedTaxBenefits",
-        "UnrecognizedTaxBenefitsThatWouldImpactEffectiveTaxRate",
-        "IncomeTaxesReceivableNoncurrent",
-    ]
-    most_recent_tax_benefit, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    return {
-        "mr_equity_investments": most_recent_equity_investments,
-        "mr_other_financial_assets": most_recent_other_financial_assets,
-        "mr_ppe": most_recent_ppe,
-        "mr_investment_property": most_recent_property,
-        "mr_tax_benefits": most_recent_tax_benefit
-    }
-
-def extract_balance_sheet_debt(doc, quarter_of_annual_report, years_diff):
-    """
-    Extract balance sheet DEBT measures (Current + Non-Current) from company financial document.
-    :param doc: company financial document
-    :param quarter_of_annual_report: quarter of annual report
-    :param years_diff: difference between fiscal year and solar year
-    :return: dict with most recent and yearly measures
-    """
-
-    # DEBT LONG + SHORT
-    measures = ["DebtLongtermAndShorttermCombinedAmount"]
-    most_recent_debt, _, yearly_debt = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["MortgageLoansOnRealEstate"]
-    most_recent_mortgage, _, yearly_mortgage = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["OtherBorrowings"]
-    most_recent_other_borr, _, yearly_other_borr = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    # DEBT SHORT
-    measures = [
-        "ShortTermBorrowings",
-        "ShorttermDebtAverageOutstandingAmount",
-        "ShorttermDebtFairValue",
-    ]
-    most_recent_debt_st, _, yearly_debt_st = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "CommercialPaper",
-        "CommercialPaperAtCarryingValue",
-    ]
-    most_recent_cp, _, yearly_cp = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["BankOverdrafts"]
-    most_recent_overdraft, _, yearly_overdraft = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["ShortTermBankLoansAndNotesPayable"]
-    most_recent_loans_st, _, yearly_loans_st = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["BridgeLoan"]
-    most_recent_bridge, _, yearly_bridge = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    # DEBT LONG
-    measures = [
-        "LongTermDebtAndCapitalLeaseObligationsIncludingCurrentMaturities",
-        "LongTermDebt",
-        "LongTermDebtFairValue",
-        "DebtInstrumentFaceAmount",
-        "DebtInstrumentCarryingAmount",
-    ]
-    most_recent_debt_lt, _, yearly_debt_lt = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "ConvertibleDebt",
-        "ConvertibleNotesPayable",
-    ]
-    most_recent_convertible, _, yearly_convertible = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "LineOfCredit",
-        "LineOfCreditFacilityFairValueOfAmountOutstanding",
-    ]
-    most_recent_revolver, _, yearly_revolver = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["LoansPayable"]
-    most_recent_loans_pay, _, yearly_loans_pay = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["SecuredDebt"]
-    most_recent_debt_sec, _, yearly_debt_sec = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["NotesPayable",
-                "SeniorNotes"]
-    most_recent_debt_notes, _, yearly_debt_notes = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["UnsecuredDebt"]
-    most_recent_debt_unsec, _, yearly_debt_unsec = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    # DEBT LONG - CURRENT
-    measures = [
-        "LongTermDebtAndCapitalLeaseObligationsCurrent",
-        "LongTermDebtCurrent",
-    ]
-    most_recent_debt_lt_cur, _, yearly_debt_lt_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "ConvertibleDebtCurrent",
-        "ConvertibleNotesPayableCurrent",
-    ]
-    most_recent_convertible_cur, _, yearly_convertible_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["LinesOfCreditCurrent"]
-    most_recent_revolver_cur, _, yearly_revolver_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["NotesPayableCurrent",
-                "SeniorNotesCurrent"]
-    most_recent_notes_cur, _, yearly_notes_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["SecuredDebtCurrent"]
-    most_recent_debt_sec_cur, _, yearly_debt_sec_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["UnsecuredDebtCurrent"]
-    most_recent_debt_unsec_cur, _, yearly_debt_unsec_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    # DEBT LONG - NON CURRENT
-    measures = [
-        "LongTermDebtAndCapitalLeaseObligations",
-        "LongTermDebtNoncurrent",
-    ]
-    most_recent_debt_lt_noncur, _, yearly_debt_lt_noncur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "ConvertibleDebtNoncurrent",
-        "ConvertibleLongTermNotesPayable",
-    ]
-    most_recent_convertible_noncur, _, yearly_convertible_noncur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["LongTermLineOfCredit"]
-    most_recent_revolver_noncur, _, yearly_revolver_noncur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["LongTermNotesPayable",
-                "SeniorLongTermNotes"]
-    most_recent_notes_noncur, _, yearly_notes_noncur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["SecuredLongTermDebt"]
-    most_recent_debt_sec_noncur, _, yearly_debt_sec_noncur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-         get_ttm=False, debug=False)
-
-    measures = ["UnsecuredLongTermDebt"]
-    most_recent_debt_unsec_noncur, _, yearly_debt_unsec_noncur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-         get_ttm=False, debug=False)
-
-    merge_subsets_yearly(yearly_debt_st, [yearly_cp, yearly_overdraft, yearly_bridge, yearly_loans_st])
-    merge_subsets_yearly(yearly_debt_lt, [yearly_convertible, yearly_revolver, yearly_loans_pay, yearly_debt_sec,
-                                          yearly_debt_notes, yearly_debt_unsec])
-    merge_subsets_yearly(yearly_debt_lt_cur, [yearly_convertible_cur, yearly_revolver_cur, yearly_notes_cur,
-                                              yearly_debt_sec_cur, yearly_debt_unsec_cur])
-    merge_subsets_yearly(yearly_debt_lt_noncur, [yearly_convertible_noncur, yearly_revolver_noncur, yearly_notes_noncur,
-                                                 yearly_debt_sec_noncur, yearly_debt_unsec_noncur])
-    merge_subsets_yearly(yearly_debt_lt, [yearly_debt_lt_cur, yearly_debt_lt_noncur])
-    merge_subsets_yearly(yearly_debt, [yearly_debt_lt, yearly_debt_st])
-    merge_subsets_yearly(yearly_debt, [yearly_debt, yearly_mortgage, yearly_other_borr], (0,))
-
-    merge_subsets_most_recent(most_recent_debt_st, [most_recent_cp, most_recent_overdraft, most_recent_bridge, most_recent_loans_st])
-    merge_subsets_most_recent(most_recent_debt_lt, [most_recent_convertible, most_recent_revolver, most_recent_loans_pay, most_recent_debt_sec,
-                                          most_recent_debt_notes, most_recent_debt_unsec])
-    merge_subsets_most_recent(most_recent_debt_lt_cur, [most_recent_convertible_cur, most_recent_revolver_cur, most_recent_notes_cur,
-                                              most_recent_debt_sec_cur, most_recent_debt_unsec_cur])
-    merge_subsets_most_recent(most_recent_debt_lt_noncur, [most_recent_convertible_noncur, most_recent_revolver_noncur, most_recent_notes_noncur,
-                                                 most_recent_debt_sec_noncur, most_recent_debt_unsec_noncur])
-    merge_subsets_most_recent(most_recent_debt_lt, [most_recent_debt_lt_cur, most_recent_debt_lt_noncur])
-    merge_subsets_most_recent(most_recent_debt, [most_recent_debt_lt, most_recent_debt_st])
-
-    for m in [most_recent_mortgage, most_recent_other_borr]:
+    most_recent_debt = values["debt"][MOST_RECENT]
+    for m in [values["mortgage"][MOST_RECENT], values["other_borrowings"][MOST_RECENT]]:
         if m["date"] == most_recent_debt["date"]:
             most_recent_debt["value"] += m["value"]
 
-    return {
-        "mr_debt": most_recent_debt,
-        "debt": yearly_debt
-    }
-
-def extract_balance_sheet_liabilities(doc, quarter_of_annual_report, years_diff, most_recent_debt):
+def liabilities_most_recent(values, context):
     """
-    Extract balance sheet measures (Total Liabilities) from company financial document.
-    :param doc: company financial document
-    :param quarter_of_annual_report: quarter of annual report
-    :param years_diff: difference between fiscal year and solar year
-    :return: dict with most recent measures
+    Most recent liabilities: liabilities ex debt + debt, if more recent (or greater) than total liabilities
     """
-
-    measures = [
-        "Liabilities",
-        "LiabilitiesFairValueDisclosure",
-        "LiabilitiesAssumed1",
-    ]
-    most_recent_liabilities, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = ["DerivativeLiabilities"]
-    most_recent_derivatives_liability, _, yearly_derivatives_liability = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = [
-        "AccountsPayableAndAccruedLiabilitiesCurrentAndNoncurrent",
-        "AccountsPayableCurrentAndNoncurrent",
-    ]
-    most_recent_ap, _, yearly_ap = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["DueToRelatedPartiesCurrentAndNoncurrent"]
-    most_recent_due_related_parties, _, yearly_due_related_parties = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["DueToAffiliateCurrentAndNoncurrent"]
-    most_recent_due_affiliates, _, yearly_due_affiliates = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    # yearly_liabilities_ex_debt = {"dates": [], "values": []}
-    # merge_subsets_yearly(yearly_liabilities_ex_debt, [yearly_derivatives_liability, yearly_ap, yearly_due_related_parties,
-    #                                                   yearly_due_affiliates])
-
-    # Current
-    measures = ["LiabilitiesCurrent"]
-    most_recent_liabilities_cur, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = [
-        "AccountsPayableAndOtherAccruedLiabilitiesCurrent",
-        "AccountsPayableAndAccruedLiabilitiesCurrent",
-    ]
-    most_recent_ap_complete_cur, _, yearly_ap_complete_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["AccountsPayableCurrent"]
-    most_recent_ap_cur, _, yearly_ap_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["AccountsPayableOtherCurrent"]
-    most_recent_apother_cur, _, yearly_apother_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["AccountsPayableRelatedPartiesCurrent"]
-    most_recent_ap_rel_cur, _, yearly_ap_rel_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["AccountsPayableTradeCurrent"]
-    most_recent_ap_trade_cur, _, yearly_ap_trade_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    merge_subsets_yearly(yearly_ap_complete_cur, [yearly_ap_cur, yearly_apother_cur, yearly_ap_rel_cur,
-                                                  yearly_ap_trade_cur])
-
-
-    measures = ["DueToAffiliateCurrent"]
-    most_recent_due_affiliates_cur, _, yearly_due_affiliates_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["DueToRelatedPartiesCurrent"]
-    most_recent_due_related_cur, _, yearly_due_related_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["DerivativeLiabilitiesCurrent"]
-    most_recent_derivatives_liability_cur, _, yearly_derivatives_liability_cur = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    # merge_subsets_yearly(yearly_liabilities_cur, [yearly_ap_complete_cur, yearly_due_affiliates_cur, yearly_due_related_cur,
-    #                                               yearly_derivatives_liability_cur])
-
-    # Non - Current
-    measures = ["LiabilitiesNoncurrent"]
-    most_recent_liabilities_noncur, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = ["DerivativeLiabilitiesNoncurrent"]
-    most_recent_derivatives_liability_noncur, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    measures = ["DueToAffiliateNoncurrent"]
-    most_recent_due_affiliates_noncur, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-         get_ttm=False, get_yearly=False, debug=False)
-
-    measures = ["DueToRelatedPartiesNoncurrent"]
-    most_recent_due_related_noncur, _, _ = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, get_yearly=False, debug=False)
-
-    # merge_subsets_yearly(yearly_liabilities_noncur, [yearly_derivatives_liability_noncur, yearly_due_affiliates_noncur,
-    #                                                  yearly_due_related_noncur])
-    # merge_subsets_yearly(yearly_liabilities_ex_debt, [yearly_liabilities_cur, yearly_liabilities_noncur])
-    # merge_subsets_yearly(yearly_liabilities, [yearly_liabilities_ex_debt, yearly_debt])
-
-    merge_subsets_most_recent(most_recent_ap_complete_cur, [most_recent_ap_cur, most_recent_apother_cur,
-                                                            most_recent_ap_rel_cur, most_recent_ap_trade_cur])
-    merge_subsets_most_recent(most_recent_ap, [most_recent_ap_complete_cur])
-    merge_subsets_most_recent(most_recent_derivatives_liability, [most_recent_derivatives_liability_cur,
-                                                                  most_recent_derivatives_liability_noncur])
-    merge_subsets_most_recent(most_recent_due_affiliates, [most_recent_due_affiliates_cur,
-                                                                  most_recent_due_affiliates_noncur])
-    merge_subsets_most_recent(most_recent_due_related_parties, [most_recent_due_related_cur,
-                                                                  most_recent_due_related_noncur])
-
-    merge_subsets_most_recent(most_recent_liabilities, [most_recent_liabilities_cur, most_recent_liabilities_noncur])
-    combo_liabilities = {"date":None, "value":0}
-    merge_subsets_most_recent(combo_liabilities, [most_recent_ap, most_recent_derivatives_liability,
-                                                        most_recent_due_affiliates, most_recent_due_related_parties,
-                                                        most_recent_debt])
+    most_recent_liabilities = values["liabilities"][MOST_RECENT]
+    combo_liabilities = values["combo_liabilities"][MOST_RECENT]
 
     if most_recent_liabilities["date"] is None:
         most_recent_liabilities = combo_liabilities
@@ -1488,389 +324,298 @@ def extract_balance_sheet_liabilities(doc, quarter_of_annual_report, years_diff,
         elif combo_liabilities["date"] == most_recent_liabilities["date"] and combo_liabilities["value"] > most_recent_liabilities["value"]:
             most_recent_liabilities = combo_liabilities
 
-    # for working capital
-    merge_subsets_yearly(yearly_ap_complete_cur, [yearly_ap])
-    merge_subsets_yearly(yearly_due_affiliates_cur, [yearly_due_affiliates])
-    merge_subsets_yearly(yearly_due_related_cur, [yearly_due_related_parties])
-
+    values["liabilities"][MOST_RECENT] = most_recent_liabilities
 
-    return {
-        "mr_liabilities": most_recent_liabilities,
-        "account_payable": yearly_ap_complete_cur,
-        "due_to_affiliates": yearly_due_affiliates_cur,
-        "due_to_related_parties": yearly_due_related_cur
-    }
+# adjustments of the measure spec that are not merges (HOOK steps of measure_spec.STEPS)
+EXTRACTION_HOOKS = {
+    "equity_most_recent": equity_most_recent,
+    "shares_unit": shares_unit,
+    "cash_most_recent": cash_most_recent,
+    "debt_other_borrowings": debt_other_borrowings,
+    "liabilities_most_recent": liabilities_most_recent,
+}
 
-def extract_balance_sheet_equity(doc, last_annual_report_date, last_annual_report_fy):
+class ExtractionPlan:
     """
-    Extract balance sheet EQUITY measures from company financial document.
-    :param doc: company financial document
-    :param last_annual_report_date: date of last annual report
-    :return: dict with most recent and yearly measures
+    Extraction plan compiled from a measure spec (see measure_spec.py).
+    Every concept used by the spec is read once from the company financial document and its ttm, most recent and yearly
+    values are computed once, then measures are built from their concepts (hierarchically: for every value the first
+    concept that has it wins) and the steps of the spec are applied in order.
     """
 
-    # measures = ["LiabilitiesAndStockholdersEquity"]
-    # most_recent_liabilities_and_equity, _, yearly_liabilities_and_equity = get_values_from_measures(
-    #     doc, measures, instant=True, last_annual_report_date=last_annual_report_date, get_ttm=False, debug=False)
-
-    df = build_financial_df(doc, "StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest")
-    quarter_of_annual_report, years_diff = get_quarter_of_annual_report(df, last_annual_report_date, last_annual_report_fy)
-
-    if quarter_of_annual_report is None:
-        df = build_financial_df(doc, "StockholdersEquity")
-        quarter_of_annual_report, years_diff = get_quarter_of_annual_report(df, last_annual_report_date,
-                                                                            last_annual_report_fy)
-
-    measures = ["StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest"]
-    most_recent_equity, _, yearly_equity = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["StockholdersEquity"]
-    most_recent_equity_no_mi, _, yearly_equity_no_mi = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    measures = ["MinorityInterest"]
-    most_recent_minority_interest, _, yearly_minority_interest = get_values_from_measures(
-        doc, measures, instant=True, quarter_of_annual_report=quarter_of_annual_report, years_diff=years_diff,
-        get_ttm=False, debug=False)
-
-    merge_subsets_yearly(yearly_equity, [yearly_equity_no_mi, yearly_minority_interest], (0,))
-
-    if most_recent_equity["date"] is None or \
-            (most_recent_equity_no_mi["date"] is not None and most_recent_equity_no_mi["date"] > most_recent_equity["date"]):
-        merge_subsets_most_recent(most_recent_equity, [most_recent_equity_no_mi, most_recent_minority_interest])
-
-    return {
-        "mr_equity": most_recent_equity,
-        "equity": yearly_equity,
-        "mr_minority_interest": most_recent_minority_interest,
-        "quarter_of_annual_report": quarter_of_annual_report,
-        "years_diff": years_diff
-    }
+    def __init__(self, measures, steps, outputs, hooks, annual_report_measure, annual_report_quarter_measures):
+
+        self.measures = measures
+        self.steps = steps
+        self.outputs = outputs
+        self.hooks = hooks
+        self.annual_report_measure = annual_report_measure
+        self.annual_report_quarter_measures = annual_report_quarter_measures
+
+        # (tax, concept, unit) -> values to compute: TTM, MOST_RECENT, (YEARLY, instant)
+        self.concepts = {}
+        # measure -> list of (tax, concept, unit)
+        self.measure_concepts = {}
+
+        for name, spec in measures.items():
+            keys = [(spec.get("tax", "us-gaap"), c, spec.get("unit", "USD")) for c in spec["concepts"]]
+            self.measure_concepts[name] = keys
+            for key in keys:
+                needs = self.concepts.setdefault(key, set())
+                for v in spec["values"]:
+                    needs.add((YEARLY, spec.get("instant", False)) if v == YEARLY else v)
+
+        self.ttm_concepts = [key for key, needs in self.concepts.items() if TTM in needs]
+
+        # check references, a wrong spec fails at import instead of during a valuation
+        referenced = [annual_report_measure] + list(annual_report_quarter_measures)
+        for step in steps:
+            if step[0] == HOOK:
+                if step[1] not in hooks:
+                    raise Exception(f"unknown hook {step[1]}")
+            elif step[0] in [YEARLY, MOST_RECENT, TTM]:
+                referenced += [step[1]] + list(step[2])
+            else:
+                raise Exception(f"unknown step {step[0]}")
+        referenced += [name for name, _ in outputs.values() if name != CONTEXT]
+
+        for name in referenced:
+            if name not in measures:
+                raise Exception(f"unknown measure {name}")
+
+    def get_context(self, frames):
+        """
+        Get last annual report date and fy, quarter of annual report and years diff (used by instant measures)
+        :param frames: dictionary (tax, concept, unit) -> DataFrame
+        :return: dictionary
+        """
+        last_annual_report_date = None
+        last_annual_report_fy = None
+        for key in self.measure_concepts[self.annual_report_measure]:
+            df = frames[key]
+            if df is not None and not df.empty and "frame" in df.columns:
+                annual_rd, annual_fy = get_last_annual_report_date_and_fy(df)
+                if last_annual_report_date is None or (annual_rd is not None and annual_rd > last_annual_report_date):
+                    last_annual_report_date = annual_rd
+                    last_annual_report_fy = annual_fy
+
+        quarter_of_annual_report, years_diff = None, None
+        for name in self.annual_report_quarter_measures:
+            quarter_of_annual_report, years_diff = get_quarter_of_annual_report(
+                frames[self.measure_concepts[name][0]], last_annual_report_date, last_annual_report_fy)
+            if quarter_of_annual_report is not None:
+                break
+
+        return {
+            "last_annual_report_date": last_annual_report_date,
+            "last_annual_report_fy": last_annual_report_fy,
+            "quarter_of_annual_report": quarter_of_annual_report,
+            "years_diff": years_diff
+        }
 
-def extract_cashflow_statement(doc):
+    def build_measure(self, name, concept_values):
+        """
+        Build a measure from the values of its concepts, for each value the first concept that has it wins (the most
+        recent one for ttm and most recent values)
+        :param name: measure name
+        :param concept_values: dictionary (tax, concept, unit) -> values of the concept
+        :return: dictionary {MOST_RECENT: {"date", "value"}, TTM: {"date", "value"}, YEARLY: YearlySeries}
+        """
+        spec = self.measures[name]
+        yearly_key = (YEARLY, spec.get("instant", False))
+
+        ttm = {"date": None, "value": 0}
+        most_recent = {"date": None, "value": 0}
+        yearly = YearlySeries()
+
+        for key in self.measure_concepts[name]:
+
+            # the company does not have the concept in its financial data
+            if key not in concept_values:
+                continue
+            v = concept_values[key]
+
+            if TTM in spec["values"]:
+                ttm_value, ttm_year = v[TTM]
+                if ttm_value is not None and (ttm["date"] is None or ttm_year > ttm["date"]):
+                    ttm = {"date": ttm_year, "value": ttm_value}
+
+            if MOST_RECENT in spec["values"]:
+                if v[MOST_RECENT]["value"] is not None and \
+                        (most_recent["date"] is None or v[MOST_RECENT]["date"] > most_recent["date"]):
+                    most_recent = {"date": v[MOST_RECENT]["date"], "value": v[MOST_RECENT]["value"]}
+
+            if YEARLY in spec["values"]:
+                yearly.fill(v[yearly_key])
+
+        return {MOST_RECENT: most_recent, TTM: ttm, YEARLY: yearly}
+
+    def run(self, doc):
+        """
+        Extract the measures of the spec from a company financial document
+        :param doc: company financial document, or its FactTable
+        :return: dictionary with the OUTPUTS of the spec
+        """
+
+        if not isinstance(doc, FactTable):
+            doc = FactTable(doc)
+
+        # single sweep over the concepts
+        frames = {(tax, concept, unit): build_financial_df(doc, concept, unit, tax)
+                  for tax, concept, unit in self.concepts}
+
+        context = self.get_context(frames)
+
+        # ttm of all the concepts at once
+        ttm = get_ttm_from_facts(doc.select(self.ttm_concepts), ["tax", "measure", "unit"])
+        ttm = dict(zip(ttm.index, zip(ttm["value"], ttm["date"])))
+
+        concept_values = {}
+        for key, needs in self.concepts.items():
+            df = frames[key]
+            if df is None or df.empty:
+                continue
+
+            v = {}
+            for need in needs:
+                if need == TTM:
+                    v[TTM] = ttm.get(key, (None, None))
+                elif need == MOST_RECENT:
+                    v[MOST_RECENT] = get_most_recent_value_from_df(df)
+                else:
+                    v[need] = get_yearly_values_from_df(df, need[1], context["quarter_of_annual_report"],
+                                                        context["years_diff"])
+            concept_values[key] = v
+
+        values = {name: self.build_measure(name, concept_values) for name in self.measures}
+        values[CONTEXT] = context
+
+        for step in self.steps:
+            if step[0] == HOOK:
+                self.hooks[step[1]](values, context)
+            elif step[0] == YEARLY:
+                merge_subsets_yearly(values[step[1]][YEARLY], [values[s][YEARLY] for s in step[2]], step[3])
+            else:
+                merge_subsets_most_recent(values[step[1]][step[0]], [values[s][step[0]] for s in step[2]])
+
+        return {key: values[name][value] for key, (name, value) in self.outputs.items()}
+
+EXTRACTION_PLAN = ExtractionPlan(MEASURES, STEPS, OUTPUTS, EXTRACTION_HOOKS, ANNUAL_REPORT_MEASURE,
+                                 ANNUAL_REPORT_QUARTER_MEASURES)
+
+def get_financial_document(cik):
     """
-    Extract cashflow statement measures from company financial document.
-    Measures include:
-    - dividends
-    - CAPEX
-    - net income
-    - interest expense
-    - gross profit
-    - depreciation and amortization
-    - EBIT
-    :param doc: company financial document
-    :return: dict with ttm and yearly measures
+    Get the company financial document, download it if we don't have it
+    :param cik: company cik
+    :return: company financial document
     """
+    try:
+        return storage.get_document("financial_data", cik)
+    except:
+        download_financial_data(cik)
+        return storage.get_document("financial_data", cik)
 
-    # DIVIDENDS
-    measures = [
-        "Dividends",
-        "DividendsCash",
-        "PaymentsOfDividends",
-        "PaymentsOfOrdinaryDividends"
-    ]
-    _, ttm_dividends, yearly_dividends = get_values_from_measures(doc, measures, get_most_recent=False,
-                                                                  debug=False)
-
-    measures = [
-        "DividendsCommonStock",
-        "DividendsCommonStockCash",
-        "PaymentsOfDividendsCommonStock"
-    ]
-    _, ttm_dividends_cs, yearly_dividends_cs = get_values_from_measures(doc, measures, get_most_recent=False,
-                                                                        debug=False)
-
-    measures = [
-        "DividendsPreferredStock",
-        "DividendsPreferredStockCash",
-        "PaymentsOfDividendsPreferredStockAndPreferenceStock"
-    ]
-    _, ttm_dividends_ps, yearly_dividends_ps = get_values_from_measures(doc, measures, get_most_recent=False,
-                                                                        debug=False)
-    merge_subsets_yearly(yearly_dividends, [yearly_dividends_cs, yearly_dividends_ps])
-    merge_subsets_most_recent(ttm_dividends, [ttm_dividends_cs, ttm_dividends_ps])
-
-    # CAPEX
-
-    # Acquisition
-    measures = ["BusinessAcquisitionCostOfAcquiredEntityTransactionCosts"]
-    _, _, yearly_acquisition_costs = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                  debug=False)
-
-    measures = [
-        "PaymentsForPreviousAcquisition",
-        "PaymentsForProceedsFromPreviousAcquisition",
-    ]
-    _, _, yearly_acquisition_adj = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                              debug=False)
+def extract_company_financial_information(cik, doc=None, as_of=None):
 
-    measures = [
-        "PaymentsToAcquireBusinessesNetOfCashAcquired",
-        "PaymentsToAcquireBusinessesGross",
-    ]
-    _, _, yearly_acquisition = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                      debug=False)
-
-    measures = ["PaymentsToAcquireBusinessTwoNetOfCashAcquired"]
-    _, _, yearly_acquisition2 = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                        debug=False)
-
-    measures = ["PaymentsToAcquireInterestInSubsidiariesAndAffiliates"]
-    _, _, yearly_sub_aff = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                              debug=False)
-
-    measures = ["PaymentsToAcquireAdditionalInterestInSubsidiaries"]
-    _, _, yearly_sub = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                      debug=False)
-
-    measures = ["PaymentsToAcquireBusinessesAndInterestInAffiliates"]
-    _, _, yearly_aff = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                      debug=False)
-
-    merge_subsets_yearly(yearly_sub_aff, [yearly_sub, yearly_aff])
-
-    measures = ["PaymentsToAcquireInterestInJointVenture"]
-    _, _, yearly_jv = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                    debug=False)
-
-    # PP&E
-    measures = ["CapitalExpendituresIncurredButNotYetPaid"]
-    _, _, yearly_capex_not_paid = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                            debug=False)
-
-    measures = ["PaymentsForCapitalImprovements"]
-    _, _, yearly_capex_imp = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                  debug=False)
-
-    measures = ["PaymentsToAcquireOtherProductiveAssets"]
-    _, _, yearly_productive_assets_other = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                              debug=False)
-
-    measures = ["PaymentsToAcquireOtherPropertyPlantAndEquipment"]
-    _, _, yearly_ppe_other = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                  debug=False)
-
-    measures = ["PaymentsToAcquireProductiveAssets"]
-    _, _, yearly_productive_assets = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                                  debug=False)
-
-    measures = ["PaymentsToAcquirePropertyPlantAndEquipment"]
-    _, _, yearly_ppe = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                      debug=False)
-
-    measures = ["PaymentsForSoftware"]
-    _, _, yearly_sw = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                    debug=False)
-
-    measures = ["PaymentsToDevelopSoftware"]
-    _, _, yearly_sw_dev = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                            debug=False)
-
-    # Intangibles
-    measures = ["PaymentsToAcquireIntangibleAssets"]
-    _, _, yearly_intangibles = get_values_from_measures(doc, measures, get_most_recent=False, get_ttm=False,
-                                                                      debug=False)
-
-    yearly_capex = {"dates": [], "values": []}
-    merge_subsets_yearly(yearly_capex, [yearly_acquisition_costs, yearly_acquisition_adj, yearly_acquisition,
-                                        yearly_acquisition2, yearly_sub_aff, yearly_jv, yearly_capex_not_paid,
-                                        yearly_capex_imp, yearly_productive_assets_other, yearly_ppe_other,
-                                        yearly_productive_assets,
-                                        yearly_ppe, yearly_sw, yearly_sw_dev, yearly_intangibles])
-
-    return {
-        "ttm_dividends": ttm_dividends,
-        "dividends": yearly_dividends,
-        "capex": yearly_capex
-    }
-
-def extract_operating_leases(doc):
     """
-    Extract operating leases measures from company financial document.
-    :param doc: company financial document
-    :return: dict with most recent measures
+    Extract financial data required for valuation from company financial document
+    :param cik: company cik
+    :param doc: company financial document or its FactTable, None reads it from storage. Pass the same FactTable to
+    extract many as_of snapshots of a company: the facts are parsed and indexed once
+    :param as_of: date, extract the values known at that date (filed on or before it) instead of the latest ones.
+    A list of dates returns a list of extractions (one per date)
+    :return: dict with income statement and balance sheet metrics (list of dicts if as_of is a list)
     """
 
-    # Last year expenses
-    measures = [
-        "OperatingLeasePayments",
-        "OperatingLeaseCost",
-        "OperatingLeaseExpense",
-    ]
-    _, mr_op_leases_expense, _ = get_values_from_measures(doc, measures, get_ttm=True, get_most_recent=False, get_yearly=False, debug=False)
-
-    # Next year expenses
-    measures = [
-        "LesseeOperatingLeaseLiabilityPaymentsDueNextTwelveMonths",
-        "OperatingLeasesFutureMinimumPaymentsDueCurrent",
-        "LesseeOperatingLeaseLiabilityPaymentsDueNextRollingTwelveMonths",
-    ]
-    mr_op_leases_next_year, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
-
-    # Next 2year expenses
-    measures = [
-        "LesseeOperatingLeaseLiabilityPaymentsDueYearTwo",
-        "OperatingLeasesFutureMinimumPaymentsDueInTwoYears",
-        "LesseeOperatingLeaseLiabilityPaymentsDueInRollingYearTwo",
-    ]
-    mr_op_leases_next_2year, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
+    if doc is None:
+        doc = get_financial_document(cik)
 
-    # Next 3year expenses
-    measures = [
-        "LesseeOperatingLeaseLiabilityPaymentsDueYearThree",
-        "OperatingLeasesFutureMinimumPaymentsDueInThreeYears",
-        "LesseeOperatingLeaseLiabilityPaymentsDueInRollingYearThree",
-    ]
-    mr_op_leases_next_3year, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
+    # parse all the facts once, the plan reads them from the fact table
+    facts = doc if isinstance(doc, FactTable) else FactTable(doc)
 
-    # Next 4year expenses
-    measures = [
-        "LesseeOperatingLeaseLiabilityPaymentsDueYearFour",
-        "OperatingLeasesFutureMinimumPaymentsDueInFourYears",
-        "LesseeOperatingLeaseLiabilityPaymentsDueInRollingYearFour",
-    ]
-    mr_op_leases_next_4year, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
+    if as_of is None:
+        return EXTRACTION_PLAN.run(facts)
+    if isinstance(as_of, (list, tuple)):
+        return [EXTRACTION_PLAN.run(facts.as_of(date)) for date in as_of]
+    return EXTRACTION_PLAN.run(facts.as_of(as_of))
 
-    # Next 5year expenses
-    measures = [
-        "LesseeOperatingLeaseLiabilityPaymentsDueYearFive",
-        "OperatingLeasesFutureMinimumPaymentsDueInFiveYears",
-        "LesseeOperatingLeaseLiabilityPaymentsDueInRollingYearFive",
-    ]
-    mr_op_leases_next_5year, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
-
-    # After 5year expenses
-    measures = [
-        "LesseeOperatingLeaseLiabilityPaymentsDueAfterYearFive",
-        "OperatingLeasesFutureMinimumPaymentsDueThereafter",
-        "LesseeOperatingLeaseLiabilityPaymentsDueAfterRollingYearFive",
-    ]
-    mr_op_leases_after_5year, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
-
-    return {
-        "mr_op_leases_expense": mr_op_leases_expense,
-        "mr_op_leases_next_year": mr_op_leases_next_year,
-        "mr_op_leases_next_2year": mr_op_leases_next_2year,
-        "mr_op_leases_next_3year": mr_op_leases_next_3year,
-        "mr_op_leases_next_4year": mr_op_leases_next_4year,
-        "mr_op_leases_next_5year": mr_op_leases_next_5year,
-        "mr_op_leases_after_5year": mr_op_leases_after_5year
-    }
-
-def extract_options(doc):
+def cache_company_financial_information(cik):
     """
-    Extract options measures from company financial document.
-    :param doc: company financial document
-    :return: dict with most recent measures
+    Extract financial information of a company and save it in "financial_extractions", keyed by the fingerprint of the
+    facts it was extracted from and by EXTRACTOR_VERSION, so that valuations can read it instead of extracting it again
+    (see pipeline.py)
+    :param cik: company cik
+    :return: dict with income statement and balance sheet metrics
     """
 
-    # Last year expenses
-    measures = [
-        "EmployeeServiceShareBasedCompensationNonvestedAwardsTotalCompensationCostNotYetRecognized",
-    ]
-    mr_sbc, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
-
-    measures = [
-        # options
-        "EmployeeServiceShareBasedCompensationNonvestedAwardsTotalCompensationCostNotYetRecognizedStockOptions",
-        "ShareBasedCompensationArrangementByShareBasedPaymentAwardOptionsOutstandingIntrinsicValue",
-        "ShareBasedCompensationArrangementByShareBasedPaymentAwardOptionsVestedAndExpectedToVestOutstandingAggregateIntrinsicValue",
-        "ShareBasedCompensationArrangementByShareBasedPaymentAwardOptionsVestedAndExpectedToVestExercisableAggregateIntrinsicValue",
-        "SharebasedCompensationArrangementBySharebasedPaymentAwardOptionsExercisableIntrinsicValue1",
-    ]
-    mr_sbc_options, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
-
-    measures = [
-        # non-options
-        "EmployeeServiceShareBasedCompensationNonvestedAwardsTotalCompensationCostNotYetRecognizedShareBasedAwardsOtherThanOptions",
-        "SharebasedCompensationArrangementBySharebasedPaymentAwardEquityInstrumentsOtherThanOptionsAggregateIntrinsicValueOutstanding",
-        "SharebasedCompensationArrangementBySharebasedPaymentAwardEquityInstrumentsOtherThanOptionsAggregateIntrinsicValueNonvested",
-    ]
-    mr_sbc_non_options, _, _ = get_values_from_measures(doc, measures, get_ttm=False, get_yearly=False, debug=False)
+    doc = get_financial_document(cik)
+    data = extract_company_financial_information(cik, doc)
 
-    merge_subsets_most_recent(mr_sbc, [mr_sbc_options, mr_sbc_non_options])
+    fingerprint = doc.get("facts_fingerprint")
+    if fingerprint is None:
+        # documents downloaded before facts_fingerprint was stored: save it once, so that the next reads hit the cache
+        fingerprint = get_facts_fingerprint(doc)
+        doc["facts_fingerprint"] = fingerprint
+        storage.upsert_document("financial_data", doc)
 
-    return {
-        "mr_sbc": mr_sbc,
-    }
+    storage.upsert_document("financial_extractions", {
+        "_id": cik,
+        "facts_fingerprint": fingerprint,
+        "extractor_version": EXTRACTOR_VERSION,
+        "data": pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL),
+        "created_at": datetime.datetime.utcnow()
+    })
 
-def extract_company_financial_information(cik):
+    return data
 
+def get_company_financial_information(cik):
     """
-    Extract financial data required for valuation from company financial document
+    Get financial information of a company from "financial_extractions", if it was extracted from the current facts
+    by the current extractor, otherwise extract it (and cache it)
     :param cik: company cik
     :return: dict with income statement and balance sheet metrics
     """
 
     try:
-        doc = mongodb.get_document("financial_data", cik)
-    except:
-        download_financial_data(cik)
-        doc = mongodb.get_document("financial_data", cik)
-
-    income_statement_measures = extract_income_statement(doc)
-    last_annual_report_date = income_statement_measures["last_annual_report_date"]
-    last_annual_report_fy = income_statement_measures["last_annual_report_fy"]
-
-    equity = extract_balance_sheet_equity(doc, last_annual_report_date, last_annual_report_fy)
-    quarter_of_annual_report = equity["quarter_of_annual_report"]
-    years_diff = equity["years_diff"]
-
-    shares = extract_shares(doc, quarter_of_annual_report, years_diff)
-    current_assets = extract_balance_sheet_current_assets(doc, quarter_of_annual_report, years_diff)
-    non_current_assets = extract_balance_sheet_noncurrent_assets(doc, quarter_of_annual_report, years_diff)
-    debt = extract_balance_sheet_debt(doc, quarter_of_annual_report, years_diff)
-    liabilities = extract_balance_sheet_liabilities(doc, quarter_of_annual_report, years_diff, debt["mr_debt"])
-    cashflow_statement_measures = extract_cashflow_statement(doc)
-    leases = extract_operating_leases(doc)
-    options = extract_options(doc)
-
-    return {
-        **shares,
-        **income_statement_measures,
-        **current_assets,
-        **non_current_assets,
-        **debt,
-        **liabilities,
-        **equity,
-        **cashflow_statement_measures,
-        **leases,
-        **options
-    }
+        cached = storage.get_document("financial_extractions", cik, ["facts_fingerprint", "extractor_version"])
+        facts = storage.get_document("financial_data", cik, ["facts_fingerprint"])
+    except StopIteration:
+        return cache_company_financial_information(cik)
+
+    if facts.get("facts_fingerprint") is None \
+            or cached.get("facts_fingerprint") != facts.get("facts_fingerprint") \
+            or cached.get("extractor_version") != EXTRACTOR_VERSION:
+        return cache_company_financial_information(cik)
+
+    return pickle.loads(storage.get_document("financial_extractions", cik, ["data"])["data"])
 
 def get_selected_years(data, key, start, end):
     """
-    Get the values corresponding to selected years from a dictionary {"key": {"dates":[],"values":[]}}
-    :param data: dictionary {"key": {"dates":[],"values":[]}}
+    Get the values corresponding to selected years from a dictionary {"key": YearlySeries}
+    :param data: dictionary {"key": YearlySeries} (or {"key": {"dates":[],"values":[]}})
     :param key: the key of the dictionary that we want to extract the selected years
     :param start: initial year
     :param end: final year
     :return: list of values corresponding to selected years (or 0 if year not found)
     """
 
-    r = []
-
-    for y in range(start, end + 1, 1):
-        try:
-            idx = data[key]["dates"].index(y)
-            r.append(data[key]["values"][idx] / 1000)
-        except ValueError:
-            r.append(0)
+    series = data[key]
+    if not isinstance(series, YearlySeries):
+        series = YearlySeries.from_dict(series)
 
-    return r
+    return (series.select(start, end) / 1000).tolist()
 
 def null_valuation(price_per_share=0):
 
     fcff_value = div_value = liquidation_per_share = -1
     fcff_delta = div_delta = liquidation_delta = 10
     status = STATUS_KO
+    company_info_df = financial_data_df = geo_segments_df = summary_df = None
 
-    return price_per_share, fcff_value, div_value, fcff_delta, div_delta, liquidation_per_share, liquidation_delta, status
+    return price_per_share, fcff_value, div_value, fcff_delta, div_delta, liquidation_per_share, liquidation_delta, \
+           status, company_info_df, financial_data_df, geo_segments_df, summary_df
 
-def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debug=False):
+def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debug=False, reference_data=None):
     """
     Compute valuation for company. Valuation is done following principles teached by Prof. Damodaran in his Valuation
     Course (FCFF Valuation and Dividends Valuation).
@@ -1888,16 +633,20 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
     :param cik: company cik
     :param years: how many financial years to consider in the valuation
     :param debug:
+    :param reference_data: ReferenceData snapshot, None uses the snapshot shared by the process
     :return: price_per_share (current price/share), fcff_value (FCFF EV), div_value (Dividends EV),
     fcff_delta premium(discount) on shares, div_delta premium(discount) on shares, status
     (OK if company is underpriced, NI if company is correctly priced, KO is company is overpriced)
     """
 
+    if reference_data is None:
+        reference_data = get_reference_data()
+
     # Check if we have financial data
     # Check if we have submissions (at least the last 10k)
     try:
         download_financial_data(cik)
-        data = extract_company_financial_information(cik)
+        data = get_company_financial_information(cik)
     except NoSharesException:
         print(cik, "no shares")
         return null_valuation()
@@ -1918,8 +667,7 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
         return null_valuation()
 
     # Calculate ERP
-    erp = get_df_from_table("damodaran_erp")
-    erp = erp[erp["date"] == erp["date"].max()]["value"].iloc[0]
+    erp = reference_data.erp
 
     # Retrieve company info
     company_info = company_from_cik(cik)
@@ -1931,22 +679,21 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
         print(ticker, "delisted")
         return null_valuation()
 
-    # Get generic info
+    # Get generic info, currency and financial currency from postgreSQL DB
     try:
-        company_name, country, industry, region = get_generic_info(ticker)
+        generic_info = get_generic_info_batch([ticker]).iloc[0]
     except IndexError:
         print(ticker, "not found in db")
         return null_valuation()
+    company_name = generic_info["company_name"]
+    country = generic_info["country"]
+    industry = generic_info["industry"]
+    region = generic_info["region"]
+    db_curr = generic_info["currency"]
+    db_financial_curr = generic_info["financial_currency"]
 
-    # Retrieve currency and financial currency from postgreSQL DB
-    yahoo_equity_ticker = get_df_from_table("yahoo_equity_tickers", f"where symbol = '{ticker}'", most_recent=True).iloc[0]
-    db_curr = yahoo_equity_ticker["currency"]
-    db_financial_curr = yahoo_equity_ticker["financial_currency"]
-
-    # Retrieve bond_spread from postgreSQL DB
-    damodaran_bond_spread = get_df_from_table("damodaran_bond_spread", most_recent=True)
-    damodaran_bond_spread["greater_than"] = pd.to_numeric(damodaran_bond_spread["greater_than"])
-    damodaran_bond_spread["less_than"] = pd.to_numeric(damodaran_bond_spread["less_than"])
+    # Retrieve bond_spread
+    damodaran_bond_spread = reference_data.bond_spread
 
     # Make sure to retrieve last annual report (10-K on SEC)
     doc = get_last_document(cik, "10-K")
@@ -1954,13 +701,10 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
     # Extract business segments and geographic distributions
     if doc is not None:
         segments = extract_segments(doc)
-        geo_segments_df = geography_distribution(segments, ticker)
+        geo_segments_df = geography_distribution(segments, ticker, reference_data)
     else:
         geo_segments_df = None
 
-    # Retrieve country statistics from postgreSQL DB
-    country_stats = get_df_from_table("damodaran_country_stats", most_recent=True)
-
     # Compute tax rate, country default spread anc country risk premium based on company country
     tax_rate = 0
     country_default_spread = 0
@@ -1968,9 +712,9 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
 
     if geo_segments_df is None or geo_segments_df.empty:
         try:
-            filter_df = country_stats[country_stats["country"] == country.replace(" ", "")].iloc[0]
+            filter_df = reference_data.get_country_stats(country.replace(" ", ""))
         except:
-            filter_df = country_stats[country_stats["country"] == "Global"].iloc[0]
+            filter_df = reference_data.get_country_stats("Global")
         tax_rate = float(filter_df["tax_rate"])
         country_default_spread = float(filter_df["adjusted_default_spread"])
         country_risk_premium = float(filter_df["country_risk_premium"])
@@ -1980,9 +724,9 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
             search_key = row["country_area"]
 
             try:
-                filter_df = country_stats[country_stats["country"] == search_key.replace(" ", "")].iloc[0]
+                filter_df = reference_data.get_country_stats(search_key.replace(" ", ""))
             except:
-                filter_df = country_stats[country_stats["country"] == "Global"].iloc[0]
+                filter_df = reference_data.get_country_stats("Global")
 
             t = float(filter_df["tax_rate"])
             cds = float(filter_df["adjusted_default_spread"])
@@ -1997,12 +741,12 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
 
     # Select alpha_3_code from company country
     try:
-        alpha_3_code = country_stats[country_stats["country"] == country.replace(" ", "")].iloc[0]["alpha_3_code"]
+        alpha_3_code = reference_data.get_country_stats(country.replace(" ", ""))["alpha_3_code"]
     except:
         alpha_3_code = None
 
     # Retrieve the riskfree rate based on the company financial currency and the country statistics
-    riskfree = currency_bond_yield(db_financial_curr, alpha_3_code, country_stats)
+    riskfree = currency_bond_yield(db_financial_curr, alpha_3_code, reference_data)
 
     # Check if the riskfree rate exists
     if riskfree == -1:
@@ -2178,7 +922,8 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
     # Get company industry data
     target_sales_capital, industry_payout, pbv, unlevered_beta, target_operating_margin, target_debt_equity = \
         get_industry_data(industry, region, geo_segments_df, revenue, ebit_adj, revenue_delta, reinvestment,
-                          equity_mkt, debt_mkt, equity_bv_adj, debt_bv_adj, mr_equity_adj, mr_debt_adj)
+                          equity_mkt, debt_mkt, equity_bv_adj, debt_bv_adj, mr_equity_adj, mr_debt_adj,
+                          reference_data=reference_data)
 
     # Retrieve minority interest
     mr_original_min_interest = data["mr_minority_interest"]["value"] / 1000
@@ -2532,15 +1277,15 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
             print(d["form_type"], d["filing_date"], d["_id"])
             print("##############\n")
 
-            if not mongodb.check_document_exists("parsed_documents", d["_id"]):
-                parse_document(d)
+            if not storage.check_document_exists("parsed_documents", d["_id"]):
+                parse_document(storage.get_document("documents", d["_id"]))
 
-            parsed_doc = mongodb.get_document("parsed_documents", d["_id"])
+            parsed_doc = storage.get_document("parsed_documents", d["_id"])
 
-            if not mongodb.check_document_exists("items_summary", d["_id"]):
+            if not storage.check_document_exists("items_summary", d["_id"]):
                 sections_summary(parsed_doc)
 
-            summary_doc = mongodb.get_document("items_summary", d["_id"])
+            summary_doc = storage.get_document("items_summary", d["_id"])
 
             for k, v in summary_doc.items():
                 if isinstance(v, dict):
@@ -2654,6 +1399,7 @@ def valuation(cik, years=5, recession_probability = 0.5, qualitative=False, debu
              "region": region
              }
         ])
+    geo_segments_df = geo_segments_df.assign(ticker=ticker, created_at=datetime.datetime.now().date())
 
     return price_per_share, fcff_value, div_value, fcff_delta, div_delta, liquidation_per_share, liquidation_delta, \
            status, company_info_df, financial_data_df, geo_segments_df, summary_df
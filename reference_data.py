@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from investing_com import get_10y_bond_yield
+from postgresql import get_df_from_table
+
+# Reference tables (Damodaran datasets, OECD CPI) change a few times a year: they are loaded once in a ReferenceData
+# snapshot shared by all the valuations of a process, instead of being queried for every company.
+# The snapshot is reloaded daily. The inflation table only depends on the CPI month, it is built on first use (only the
+# riskfree fallback needs it) once per month and reused by the reloads of the month. Market data (10y bond yields) is not part of the snapshot, it is read live.
+
+INDUSTRY_DATA_COLUMNS = ["industry_name", "region", "sales_capital", "cash_return", "unlevered_beta",
+                         "opmargin_adjusted", "debt_equity", "pbv"]
+
+# the shared snapshot is reloaded when older than this
+REFERENCE_DATA_MAX_AGE = timedelta(days=1)
+
+_reference_data = None
+# (CPI month, {alpha 3 code: yearly inflation}) of the last inflation table built
+_inflation = None
+
+
+class ReferenceData:
+    """
+    In memory snapshot of the reference tables used by valuation, with lookups indexed by country and industry,
+    and the yearly inflation of every country computed once per month from CPI (when first needed).
+    """
+
+    def __init__(self):
+        self.loaded_at = datetime.now()
+
+        # ERP
+        erp = get_df_from_table("damodaran_erp")
+        self.erp = erp[erp["date"] == erp["date"].max()]["value"].iloc[0]
+
+        # Bond spread (by interest coverage ratio)
+        self.bond_spread = get_df_from_table("damodaran_bond_spread", most_recent=True, columnar=True)
+        self.bond_spread["greater_than"] = pd.to_numeric(self.bond_spread["greater_than"])
+        self.bond_spread["less_than"] = pd.to_numeric(self.bond_spread["less_than"])
+
+        # Country statistics, the lookup keeps the first row of a country as filtering the DataFrame did
+        self.country_stats = get_df_from_table("damodaran_country_stats", most_recent=True, columnar=True)
+        self.country_stats_by_country = {}
+        for _, row in self.country_stats.iterrows():
+            self.country_stats_by_country.setdefault(row["country"], row)
+
+        # Industry data of the most recent dataset and of the last dataset of the previous year
+        industry_data = get_df_from_table("damodaran_industry_data", most_recent=True,
+                                          columns=INDUSTRY_DATA_COLUMNS, columnar=True)
+        industry_data_last_year = get_df_from_table("damodaran_industry_data", previous_year=True,
+                                                    columns=INDUSTRY_DATA_COLUMNS, columnar=True)
+        self.industry_data = {k: v.reset_index(drop=True) for k, v in industry_data.groupby("industry_name")}
+        self.industry_data_last_year = {k: v.reset_index(drop=True)
+                                        for k, v in industry_data_last_year.groupby("industry_name")}
+
+        # CPI of the last available month (2 months ago) and of the same month one year before
+        self.cpi_current_date = datetime.now().date().replace(day=1) - relativedelta(months=2)
+        self.cpi_last_year_date = self.cpi_current_date - relativedelta(years=1)
+
+    def get_country_stats(self, country):
+        """
+        Get the statistics of a country
+        :param country: country name as in damodaran_country_stats (no spaces)
+        :return: row of damodaran_country_stats (pd.Series), raise KeyError if not found
+        """
+        return self.country_stats_by_country[country]
+
+    def get_industry_data(self, industry):
+        """
+        Get industry data (all regions) of the most recent and previous year datasets
+        :param industry: Damodaran industry name
+        :return: (DataFrame most recent, DataFrame previous year), empty DataFrames if not found
+        """
+        empty = pd.DataFrame(columns=INDUSTRY_DATA_COLUMNS)
+        return self.industry_data.get(industry, empty), self.industry_data_last_year.get(industry, empty)
+
+    def get_inflation(self, alpha_3_code):
+        """
+        Get yearly inflation of a country and of the US
+        :param alpha_3_code: country alpha 3 code
+        :return: (country inflation, US inflation), country inflation is the US one if the country has no CPI.
+        Raise KeyError if US CPI is not available
+        """
+        inflation = get_inflation_table(self.cpi_current_date, self.cpi_last_year_date)
+        inflation_us = inflation["USA"]
+        return inflation.get(alpha_3_code, inflation_us), inflation_us
+
+    def get_riskfree_us(self):
+        """
+        Get US riskfree rate (10y treasury yield - US default spread), the yield is scraped live at every call as the
+        yields of the other currencies are
+        :return: riskfree rate
+        """
+        us_10y_bond, _ = get_10y_bond_yield("USD")
+        us_cds = float(self.get_country_stats("UnitedStates")["adjusted_default_spread"])
+        return us_10y_bond - us_cds
+
+
+def get_inflation_table(cpi_current_date, cpi_last_year_date):
+    """
+    Get the yearly inflation of every country between two CPI months, built once per month
+    :param cpi_current_date: CPI month (first day of the month)
+    :param cpi_last_year_date: same month one year before
+    :return: dictionary {alpha 3 code: yearly inflation}, only countries with both months. An empty table (CPI of the
+    month not loaded yet) is not kept, the next call reads CPI again
+    """
+    global _inflation
+    if _inflation is not None and _inflation[0] == cpi_current_date:
+        return _inflation[1]
+
+    cpi = get_df_from_table("oecd_financial", "where indicator = 'CPI' and date in (%s, %s)",
+                            params=(cpi_last_year_date.strftime('%Y-%m-%d'), cpi_current_date.strftime('%Y-%m-%d')),
+                            columns=["location", "indicator", "date", "value"], columnar=True)
+
+    inflation = {}
+    for location, rows in cpi.groupby("location"):
+        current = rows[rows["date"] == cpi_current_date]["value"]
+        last_year = rows[rows["date"] == cpi_last_year_date]["value"]
+        if len(current) > 0 and len(last_year) > 0:
+            inflation[location] = current.iloc[0] / last_year.iloc[0] - 1
+
+    if len(inflation) > 0:
+        _inflation = (cpi_current_date, inflation)
+    return inflation
+
+
+def get_reference_data():
+    """
+    Get the reference data snapshot shared by the process (loaded on first use, reloaded once a day)
+    :return: ReferenceData
+    """
+    global _reference_data
+    if _reference_data is None or datetime.now() - _reference_data.loaded_at > REFERENCE_DATA_MAX_AGE:
+        _reference_data = ReferenceData()
+    return _reference_data
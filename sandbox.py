@@ -12,7 +12,6 @@
 #     :return:
 #     """
 #
-#     docs = mongodb.get_collection_documents("financial_data")
 #     measures = [
 #         "OtherAssetsCurrent",
 #         "OtherAssetsFairValueDisclosure",
@@ -24,6 +23,10 @@
 #         "PrepaidTaxes"
 #     ]
 #
+#     # only the measures we count, not the whole companyfacts document
+#     projection = ["entityName"] + [f"facts.us-gaap.{m}.units.USD" for m in measures]
+#     docs = mongodb.iter_collection("financial_data", projection=projection, batch_size=500)
+#
 #     l = []
 #
 #     i = 0
@@ -31,7 +34,7 @@
 #
 #         i += 1
 #         if i % 100 == 0:
-#             print(f"{i} / {len(docs)}")
+#             print(f"{i} documents")
 #
 #         d = {"company": doc["entityName"]}
 #
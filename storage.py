@@ -0,0 +1,520 @@
+import os
+import pickle
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+
+import zstandard
+
+import mongodb
+
+# Document storage used by the project (filings, submissions, financial data, parsed documents, summaries).
+# The backend is selected in credentials.cfg:
+#
+# [storage]
+# backend = sqlite          (mongodb if the section is missing)
+# path = company_eval.sqlite
+#
+# Missing documents raise StopIteration with every backend, as mongodb.get_document does.
+
+ASCENDING = 1
+DESCENDING = -1
+
+_storage = None
+# sqlite connections inherited from the parent process, kept referenced so that they are never finalized by the child
+_inherited_connections = []
+
+
+class StorageBackend(ABC):
+    """
+    Operations on the document store used by the project. Documents are dicts with an "_id".
+    Filings ("documents" collection) have their html loaded lazily on doc["html"] access.
+    A backend must implement every method, an incomplete one cannot be instantiated.
+    """
+
+    @abstractmethod
+    def get_document(self, collection_name, document_id, projection=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_document(self, collection_name, data):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_document(self, collection_name, data):
+        raise NotImplementedError
+
+    @abstractmethod
+    def check_document_exists(self, collection_name, document_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_documents(self, collection_name, cik=None, form_type=None, filing_date_gte=None, sort=None, limit=None,
+                       projection=None):
+        """
+        Query documents by cik, form type and filing date
+        :param collection_name: name of the collection
+        :param cik: company cik, None for any
+        :param form_type: form type (10-K, 10-Q, 8-K), None for any
+        :param filing_date_gte: yyyy-mm-dd, keep documents filed on or after this date, None for any
+        :param sort: ASCENDING or DESCENDING to sort by filing_date, None for no sorting
+        :param limit: max number of documents, None for no limit
+        :param projection: list of fields to return, None returns entire documents
+        :return: list of documents
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_inserted_after(self, collection_name, inserted_at, projection=None):
+        """
+        Documents inserted (or replaced) after a given time, used to poll for new documents
+        :param collection_name: name of the collection
+        :param inserted_at: datetime, None returns all documents with an inserted_at
+        :param projection: list of fields to return, None returns entire documents
+        :return: list of documents sorted by inserted_at
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_last_documents(self, ciks, form_type):
+        """
+        Most recent document of form_type for each cik
+        :param ciks: list of company ciks
+        :param form_type: form type (10-K, 10-Q, 8-K)
+        :return: dictionary {cik: document}, companies without a document of form_type are not included
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_document_payload(self, document_id):
+        """
+        Get the html of a filing
+        :param document_id: url of the filing
+        :return: html string
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_id_partitions(self, collection_name, num_partitions):
+        """
+        Split the documents of a collection in contiguous _id ranges with a similar number of documents
+        :param collection_name: name of the collection
+        :param num_partitions: number of ranges wanted
+        :return: list of (start_at, end_before) to be passed as id_range to iter_documents, empty if the collection
+        is empty
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_documents(self, collection_name, projection=None, id_range=None, batch_size=100):
+        """
+        Stream the documents of a collection in _id order, one page of batch_size documents at a time
+        :param collection_name: name of the collection
+        :param projection: list of fields to return, None returns entire documents
+        :param id_range: tuple (start_at, end_before) from get_id_partitions, None for all documents
+        :param batch_size: number of documents per page
+        :return: generator of documents
+        """
+        raise NotImplementedError
+
+
+class MongoStorage(StorageBackend):
+    """
+    MongoDB backend, built on mongodb module helpers.
+    """
+
+    def _wrap(self, collection_name, doc):
+        return mongodb.FilingDocument(doc) if collection_name == "documents" else doc
+
+    def get_document(self, collection_name, document_id, projection=None):
+        return self._wrap(collection_name, mongodb.get_document(collection_name, document_id, projection))
+
+    def upsert_document(self, collection_name, data):
+        mongodb.upsert_document(collection_name, data)
+
+    def insert_document(self, collection_name, data):
+        if collection_name == "documents" and "html" in data:
+            mongodb.insert_filing(data)
+        else:
+            mongodb.insert_document(collection_name, data)
+
+    def check_document_exists(self, collection_name, document_id):
+        return mongodb.check_document_exists(collection_name, document_id)
+
+    def find_documents(self, collection_name, cik=None, form_type=None, filing_date_gte=None, sort=None, limit=None,
+                       projection=None):
+        mongodb.create_indexes()
+        query = {}
+        if cik is not None:
+            query["cik"] = cik
+        if form_type is not None:
+            query["form_type"] = form_type
+        if filing_date_gte is not None:
+            query["filing_date"] = {"$gte": filing_date_gte}
+
+        cursor = mongodb.get_collection_documents(collection_name, query, projection)
+        if sort is not None:
+            cursor = cursor.sort("filing_date", sort)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return [self._wrap(collection_name, doc) for doc in cursor]
+
+    def find_inserted_after(self, collection_name, inserted_at, projection=None):
+        mongodb.create_indexes()
+        query = {"inserted_at": {"$gt": inserted_at} if inserted_at is not None else {"$ne": None}}
+        cursor = mongodb.get_collection_documents(collection_name, query, projection).sort("inserted_at", ASCENDING)
+        return [self._wrap(collection_name, doc) for doc in cursor]
+
+    def get_last_documents(self, ciks, form_type):
+        mongodb.create_indexes()
+        collection = mongodb.get_collection("documents")
+
+        # sort follows the (cik, form_type, filing_date) index, the group keeps only the id of the most recent
+        # document so that payloads are not moved through the aggregation
+        pipeline = [
+            {"$match": {"cik": {"$in": list(ciks)}, "form_type": form_type}},
+            {"$sort": {"cik": ASCENDING, "form_type": ASCENDING, "filing_date": DESCENDING}},
+            {"$group": {"_id": "$cik", "document_id": {"$first": "$_id"}}},
+        ]
+        document_ids = [r["document_id"] for r in collection.aggregate(pipeline)]
+
+        return {doc["cik"]: mongodb.FilingDocument(doc) for doc in mongodb.get_documents("documents", document_ids)}
+
+    def get_document_payload(self, document_id):
+        return mongodb.get_document_payload(document_id)
+
+    def get_id_partitions(self, collection_name, num_partitions):
+        return mongodb.get_id_partitions(collection_name, num_partitions)
+
+    def iter_documents(self, collection_name, projection=None, id_range=None, batch_size=100):
+        for doc in mongodb.iter_collection(collection_name, None, projection, batch_size, id_range=id_range):
+            yield self._wrap(collection_name, doc)
+
+
+class SQLiteFilingDocument(dict):
+    """
+    A filing read from SQLiteStorage, html is decompressed only the first time doc["html"] is accessed.
+    """
+
+    def __init__(self, data, storage):
+        super().__init__(data)
+        self._storage = storage
+
+    def __missing__(self, key):
+        if key != "html":
+            raise KeyError(key)
+        html = self._storage.get_document_payload(self["_id"])
+        self["html"] = html
+        return html
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Embedded single-file backend, no server needed. Every document is a row (collection, _id) with cik, form_type
+    and filing_date columns for queries and the document pickled and zstd compressed. Filings html is saved in a
+    separate compressed column, read only when needed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._compressor = zstandard.ZstdCompressor(level=mongodb.PAYLOAD_COMPRESSION_LEVEL)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+        conn = self._connection()
+        conn.execute("""CREATE TABLE IF NOT EXISTS store (
+                            collection TEXT NOT NULL,
+                            id TEXT NOT NULL,
+                            cik TEXT,
+                            form_type TEXT,
+                            filing_date TEXT,
+                            inserted_at TEXT,
+                            data BLOB NOT NULL,
+                            payload BLOB,
+                            PRIMARY KEY (collection, id))""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS store_cik_form_type_filing_date
+                        ON store (collection, cik, form_type, filing_date)""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS store_inserted_at ON store (collection, inserted_at)""")
+        conn.commit()
+
+    def _connection(self):
+        # sqlite connections cannot be shared between threads, keep one per thread. They must not be used across a
+        # fork either: a process forked from this one (e.g. ProcessPoolExecutor workers) opens its own connections
+        # and leaves the inherited ones alone (closing them could release locks held by the parent)
+        conn = getattr(self._local, "conn", None)
+        pid = os.getpid()
+        if conn is None or self._local.pid != pid:
+            if conn is not None:
+                _inherited_connections.append(conn)
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    def _encode(self, data):
+        return self._compressor.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _decode(self, blob):
+        return pickle.loads(self._decompressor.decompress(blob))
+
+    def _to_document(self, collection_name, blob, projection):
+        doc = _apply_projection(self._decode(blob), projection)
+        return SQLiteFilingDocument(doc, self) if collection_name == "documents" else doc
+
+    def _write(self, collection_name, data, replace):
+        data = dict(data)
+        payload = data.pop("html", None)
+        inserted_at = data.get("inserted_at")
+        row = (collection_name, data["_id"], data.get("cik"), data.get("form_type"), data.get("filing_date"),
+               _format_datetime(inserted_at), self._encode(data),
+               self._compressor.compress(payload.encode("utf-8")) if payload is not None else None)
+
+        conn = self._connection()
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        conn.execute(f"{verb} INTO store (collection, id, cik, form_type, filing_date, inserted_at, data, payload) "
+                     f"VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+        conn.commit()
+
+    def get_document(self, collection_name, document_id, projection=None):
+        row = self._connection().execute("SELECT data FROM store WHERE collection = ? AND id = ?",
+                                         (collection_name, document_id)).fetchone()
+        if row is None:
+            raise StopIteration
+        return self._to_document(collection_name, row[0], projection)
+
+    def upsert_document(self, collection_name, data):
+        self._write(collection_name, data, replace=True)
+
+    def insert_document(self, collection_name, data):
+        self._write(collection_name, data, replace=False)
+
+    def check_document_exists(self, collection_name, document_id):
+        row = self._connection().execute("SELECT 1 FROM store WHERE collection = ? AND id = ?",
+                                         (collection_name, document_id)).fetchone()
+        return row is not None
+
+    def find_documents(self, collection_name, cik=None, form_type=None, filing_date_gte=None, sort=None, limit=None,
+                       projection=None):
+        sql = "SELECT data FROM store WHERE collection = ?"
+        params = [collection_name]
+        if cik is not None:
+            sql += " AND cik = ?"
+            params.append(cik)
+        if form_type is not None:
+            sql += " AND form_type = ?"
+            params.append(form_type)
+        if filing_date_gte is not None:
+            sql += " AND filing_date >= ?"
+            params.append(filing_date_gte)
+        if sort is not None:
+            sql += " ORDER BY filing_date " + ("ASC" if sort == ASCENDING else "DESC")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        return [self._to_document(collection_name, r[0], projection) for r in rows]
+
+    def find_inserted_after(self, collection_name, inserted_at, projection=None):
+        sql = "SELECT data FROM store WHERE collection = ? AND inserted_at IS NOT NULL"
+        params = [collection_name]
+        if inserted_at is not None:
+            sql += " AND inserted_at > ?"
+            params.append(_format_datetime(inserted_at))
+        sql += " ORDER BY inserted_at"
+
+        rows = self._connection().execute(sql, params).fetchall()
+        return [self._to_document(collection_name, r[0], projection) for r in rows]
+
+    def get_last_documents(self, ciks, form_type):
+        ciks = list(ciks)
+        if len(ciks) == 0:
+            return {}
+        placeholders = ",".join("?" * len(ciks))
+        rows = self._connection().execute(
+            f"""SELECT data FROM (
+                    SELECT data, ROW_NUMBER() OVER (PARTITION BY cik ORDER BY filing_date DESC) AS rn
+                    FROM store
+                    WHERE collection = 'documents' AND form_type = ? AND cik IN ({placeholders}))
+                WHERE rn = 1""", [form_type] + ciks).fetchall()
+
+        docs = [self._to_document("documents", r[0], None) for r in rows]
+        return {doc["cik"]: doc for doc in docs}
+
+    def get_document_payload(self, document_id):
+        row = self._connection().execute("SELECT payload FROM store WHERE collection = 'documents' AND id = ?",
+                                         (document_id,)).fetchone()
+        if row is None or row[0] is None:
+            raise StopIteration
+        return self._decompressor.decompress(row[0]).decode("utf-8")
+
+    def get_id_partitions(self, collection_name, num_partitions):
+        # bounds are ids as stored in the id column, to be compared with it by iter_documents
+        conn = self._connection()
+        count = conn.execute("SELECT COUNT(*) FROM store WHERE collection = ?", (collection_name,)).fetchone()[0]
+        if count == 0:
+            return []
+        num_partitions = min(num_partitions, count)
+        bounds = [conn.execute("SELECT id FROM store WHERE collection = ? ORDER BY id LIMIT 1 OFFSET ?",
+                               (collection_name, i * count // num_partitions)).fetchone()[0]
+                  for i in range(1, num_partitions)]
+        return list(zip([None] + bounds, bounds + [None]))
+
+    def iter_documents(self, collection_name, projection=None, id_range=None, batch_size=100):
+        start_at, end_before = id_range if id_range is not None else (None, None)
+
+        # every page is a new query that resumes after the last id seen, as mongodb.iter_collection does
+        last_id = None
+        while True:
+            sql = "SELECT id, data FROM store WHERE collection = ?"
+            params = [collection_name]
+            if last_id is not None:
+                sql += " AND id > ?"
+                params.append(last_id)
+            elif start_at is not None:
+                sql += " AND id >= ?"
+                params.append(start_at)
+            if end_before is not None:
+                sql += " AND id < ?"
+                params.append(end_before)
+            sql += " ORDER BY id LIMIT ?"
+            params.append(batch_size)
+
+            rows = self._connection().execute(sql, params).fetchall()
+            if len(rows) == 0:
+                return
+            for r in rows:
+                yield self._to_document(collection_name, r[1], projection)
+            last_id = rows[-1][0]
+
+
+def _format_datetime(value):
+    # fixed width iso format, so that the string order of the column is the chronological order
+    return value.isoformat(timespec="microseconds") if value is not None else None
+
+
+def _apply_projection(doc, projection):
+    """
+    Keep only the projected fields of a document (mongodb inclusion projection, dotted paths allowed). _id is
+    always kept.
+    :param doc: document
+    :param projection: list of fields or dict {field: 1}, None to keep everything
+    :return: projected document
+    """
+    if projection is None:
+        return doc
+    if isinstance(projection, dict):
+        projection = [k for k, v in projection.items() if v]
+
+    result = {"_id": doc["_id"]}
+    for field in projection:
+        keys = field.split(".")
+        src = doc
+        dst = result
+        for i, k in enumerate(keys):
+            if not isinstance(src, dict) or k not in src:
+                break
+            if i == len(keys) - 1:
+                dst[k] = src[k]
+            else:
+                src = src[k]
+                dst = dst.setdefault(k, {})
+    return result
+
+
+def get_storage():
+    """
+    Get the storage backend configured in credentials.cfg (created once per process)
+    :return: StorageBackend
+    """
+    global _storage
+    if _storage is None:
+        parser = ConfigParser()
+        _ = parser.read(os.path.join("credentials.cfg"))
+        backend = parser.get("storage", "backend", fallback="mongodb")
+        if backend == "sqlite":
+            _storage = SQLiteStorage(parser.get("storage", "path", fallback="company_eval.sqlite"))
+        else:
+            _storage = MongoStorage()
+    return _storage
+
+
+def set_storage(storage):
+    """
+    Replace the storage backend used by the project, e.g. an in-process SQLiteStorage for tests and benchmarks
+    :param storage: StorageBackend
+    """
+    global _storage
+    _storage = storage
+
+
+def get_document(collection_name, document_id, projection=None):
+    return get_storage().get_document(collection_name, document_id, projection)
+
+
+def upsert_document(collection_name, data):
+    get_storage().upsert_document(collection_name, data)
+
+
+def insert_document(collection_name, data):
+    get_storage().insert_document(collection_name, data)
+
+
+def check_document_exists(collection_name, document_id):
+    return get_storage().check_document_exists(collection_name, document_id)
+
+
+def find_documents(collection_name, cik=None, form_type=None, filing_date_gte=None, sort=None, limit=None,
+                   projection=None):
+    return get_storage().find_documents(collection_name, cik, form_type, filing_date_gte, sort, limit, projection)
+
+
+def find_inserted_after(collection_name, inserted_at, projection=None):
+    return get_storage().find_inserted_after(collection_name, inserted_at, projection)
+
+
+def get_last_documents(ciks, form_type):
+    return get_storage().get_last_documents(ciks, form_type)
+
+
+def get_document_payload(document_id):
+    return get_storage().get_document_payload(document_id)
+
+
+def iter_documents(collection_name, projection=None, id_range=None, batch_size=100):
+    return get_storage().iter_documents(collection_name, projection, id_range, batch_size)
+
+
+def _map_partition(collection_name, func, projection, batch_size, id_range):
+    result = []
+    for doc in iter_documents(collection_name, projection, id_range, batch_size):
+        r = func(doc)
+        if r is not None:
+            result.append(r)
+    return result
+
+
+def parallel_map_collection(collection_name, func, num_workers=None, projection=None, batch_size=100):
+    """
+    Apply func to every document of a collection of the configured storage, splitting the collection in _id ranges
+    processed by num_workers processes (see mongodb.parallel_map_collection)
+    :param collection_name: name of the collection
+    :param func: module level function (it must be picklable) taking a document, None results are discarded
+    :param num_workers: number of processes, default number of cpus
+    :param projection: list of fields to return
+    :param batch_size: number of documents per page
+    :return: list of func results
+    """
+    num_workers = num_workers if num_workers is not None else os.cpu_count()
+    partitions = get_storage().get_id_partitions(collection_name, num_workers)
+
+    result = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        tasks = [executor.submit(_map_partition, collection_name, func, projection, batch_size, p)
+                 for p in partitions]
+        for t in tasks:
+            result.extend(t.result())
+    return result
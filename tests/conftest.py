@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the modules live at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+# credentials.cfg is read from the working directory (some modules read it at import): the tests run in a scratch
+# directory with a minimal configuration, SQLite storage and no external service
+WORKDIR = tempfile.mkdtemp(prefix="company_eval_tests_")
+with open(os.path.join(WORKDIR, "credentials.cfg"), "w") as f:
+    f.write("[open_ai]\n"
+            "api_key = test\n"
+            "\n"
+            "[storage]\n"
+            "backend = sqlite\n"
+            f"path = {os.path.join(WORKDIR, 'test.sqlite')}\n")
+os.chdir(WORKDIR)
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def companyfacts():
+    """
+    Synthetic companyfacts document (cik 999001): quarterly, year to date and annual periods, balance sheet instants,
+    comparatives of later filings and restated values, for the measures of measure_spec.py
+    """
+    return load_fixture("companyfacts_999001.json")
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    """
+    Run a test in its own directory (panel, coverage index files)
+    """
+    cwd = os.getcwd()
+    with open(os.path.join(WORKDIR, "credentials.cfg")) as src, open(tmp_path / "credentials.cfg", "w") as dst:
+        dst.write(src.read())
+    os.chdir(tmp_path)
+    yield tmp_path
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    """
+    Use an empty SQLiteStorage as the storage backend of a test
+    """
+    # imported after the repository root was added to sys.path
+    import storage
+
+    previous = storage.get_storage()
+    backend = storage.SQLiteStorage(str(tmp_path / "storage.sqlite"))
+    storage.set_storage(backend)
+    yield backend
+    storage.set_storage(previous)
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+import coverage_index
+import storage
+from coverage_index import CoverageIndex, build_coverage_index
+
+CONCEPTS = ["Revenues", "RevenueFromContractWithCustomerExcludingAssessedTax", "SalesRevenueNet", "Assets",
+            "NetIncomeLoss"]
+
+
+@pytest.fixture
+def companies(sqlite_storage):
+    """
+    financial_data with 21 companies (more than a byte of the bitmap) reporting random concepts
+    """
+    rng = random.Random(0)
+    docs = []
+    for cik in range(100, 121):
+        measures = {}
+        for concept in CONCEPTS:
+            if rng.random() < 0.5:
+                year = rng.randint(2010, 2020)
+                measures[concept] = {"units": {"USD": [{"end": f"{year}-12-31", "val": 1},
+                                                       {"end": f"{year + 2}-12-31", "val": 2}]}}
+        docs.append({"_id": cik, "facts": {"us-gaap": measures}})
+        storage.upsert_document("financial_data", docs[-1])
+    return docs
+
+
+def reporting(docs, concept, ciks=None):
+    return [d["_id"] for d in docs if concept in d["facts"]["us-gaap"] and (ciks is None or d["_id"] in ciks)]
+
+
+def test_queries_match_brute_force(companies, tmp_path):
+    path = str(tmp_path / "coverage_index.npz")
+    build_coverage_index(num_workers=3, path=path)
+    index = CoverageIndex(path)
+
+    cohort = [d["_id"] for d in companies[::3]] + [999]
+    names = [coverage_index.get_concept_name("us-gaap", c) for c in CONCEPTS]
+
+    assert index.count_companies(names).tolist() == [len(reporting(companies, c)) for c in CONCEPTS]
+    assert index.count_companies(names, cohort).tolist() == [len(reporting(companies, c, cohort)) for c in CONCEPTS]
+    for name, concept in zip(names, CONCEPTS):
+        if name in index.concept_index:
+            assert index.get_companies(name) == reporting(companies, concept)
+
+
+def test_cohort_concepts_dates(companies, tmp_path):
+    path = str(tmp_path / "coverage_index.npz")
+    build_coverage_index(num_workers=3, path=path)
+    index = CoverageIndex(path)
+
+    cohort = [d["_id"] for d in companies[:5]]
+    df = index.get_cohort_concepts(cohort).set_index("concept")
+
+    for concept in CONCEPTS:
+        docs = [d for d in companies[:5] if concept in d["facts"]["us-gaap"]]
+        name = coverage_index.get_concept_name("us-gaap", concept)
+        if len(docs) == 0:
+            assert name not in df.index
+            continue
+        ends = [r["end"] for d in docs for r in d["facts"]["us-gaap"][concept]["units"]["USD"]]
+        assert df.loc[name, "companies"] == len(docs)
+        assert df.loc[name, "share"] == pytest.approx(len(docs) / 5)
+        assert str(df.loc[name, "first_date"])[:10] == min(ends)
+        assert str(df.loc[name, "last_date"])[:10] == max(ends)
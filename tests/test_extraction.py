@@ -0,0 +1,91 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from conftest import load_fixture
+from financial_facts import FactTable
+from quantitative_analysis import EXTRACTION_PLAN, extract_company_financial_information
+from yearly_series import YearlySeries
+
+CIK = 999001
+
+
+def to_json(value):
+    """
+    Convert an extraction result to the types of the reference json (dates as yyyy-mm-dd, series as dictionaries)
+    """
+    if isinstance(value, YearlySeries):
+        value = value.to_dict()
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_json(v) for v in value]
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def assert_same(actual, expected, path=""):
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool) and expected is not None:
+        assert isinstance(actual, (int, float)), path
+        assert math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-6), f"{path}: {actual} != {expected}"
+    elif isinstance(expected, dict):
+        assert isinstance(actual, dict) and actual.keys() == expected.keys(), path
+        for k in expected:
+            assert_same(actual[k], expected[k], f"{path}/{k}")
+    elif isinstance(expected, list):
+        assert isinstance(actual, list) and len(actual) == len(expected), path
+        for i, (a, e) in enumerate(zip(actual, expected)):
+            assert_same(a, e, f"{path}[{i}]")
+    else:
+        assert actual == expected, f"{path}: {actual!r} != {expected!r}"
+
+
+def test_extraction_matches_reference(companyfacts):
+    # reference computed with the extract_* functions that the measure spec replaced, the only difference is
+    # quarter_of_annual_report, an int instead of the frame character since frames are parsed once
+    expected = load_fixture("extraction_999001.json")
+
+    result = extract_company_financial_information(CIK, doc=companyfacts)
+
+    assert_same(to_json(result), expected)
+
+
+def test_extraction_from_fact_table(companyfacts):
+    expected = to_json(extract_company_financial_information(CIK, doc=companyfacts))
+
+    assert_same(to_json(EXTRACTION_PLAN.run(FactTable(companyfacts))), expected)
+
+
+def test_extraction_as_of_future_date_is_full_extraction(companyfacts):
+    expected = to_json(extract_company_financial_information(CIK, doc=companyfacts))
+
+    assert_same(to_json(extract_company_financial_information(CIK, doc=companyfacts, as_of="2100-01-01")), expected)
+
+
+def test_extraction_as_of_past_date(companyfacts):
+    result = extract_company_financial_information(CIK, doc=companyfacts, as_of="2022-03-01")
+
+    # the 10-K of 2021 was filed on 2022-02-20, the quarters of 2022 are not known yet
+    assert result["last_annual_report_date"] == pd.Timestamp("2021-12-31")
+    assert result["ttm_revenue"]["date"] == pd.Timestamp("2021-12-31")
+    assert max(result["revenue"]["dates"]) == 2021
+
+
+def test_extraction_as_of_many_dates(companyfacts):
+    facts = FactTable(companyfacts)
+    dates = ["2021-03-01", "2022-03-01", "2100-01-01"]
+
+    results = extract_company_financial_information(CIK, doc=facts, as_of=dates)
+    index = facts._as_of_index
+
+    assert len(results) == len(dates)
+    for date, result in zip(dates, results):
+        assert_same(to_json(result), to_json(extract_company_financial_information(CIK, doc=facts, as_of=date)))
+    # the snapshots reuse the as of index of the fact table
+    assert facts._as_of_index is index
@@ -0,0 +1,155 @@
+import pandas as pd
+
+from financial_facts import FactTable, add_frame_columns, get_facts_fingerprint
+from quantitative_analysis import get_ttm_from_facts
+
+KEYS = ["tax", "measure", "unit"]
+
+
+def period(start, end, val, filed, frame=None, form="10-Q"):
+    row = {"start": start, "end": end, "val": val, "accn": "0000", "fy": int(end[:4]), "fp": "", "form": form,
+           "filed": filed}
+    if frame is not None:
+        row["frame"] = frame
+    return row
+
+
+def instant(end, val, filed, frame=None, form="10-Q"):
+    row = period(None, end, val, filed, frame, form)
+    del row["start"]
+    return row
+
+
+def companyfacts(measures):
+    return {"facts": {"us-gaap": {m: {"units": {"USD": rows}} for m, rows in measures.items()}}}
+
+
+def test_add_frame_columns():
+    df = add_frame_columns(pd.DataFrame({"frame": ["CY2022", "CY2022Q3", "CY2022Q4I", None]}))
+
+    assert df.frame_year.tolist() == [2022, 2022, 2022, 0]
+    assert df.frame_quarter.tolist() == [0, 3, 4, 0]
+    assert df.frame_instant.tolist() == [False, False, True, False]
+
+
+def test_facts_fingerprint_ignores_key_order():
+    a = companyfacts({"Revenues": [period("2022-01-01", "2022-12-31", 100, "2023-02-20", "CY2022")],
+                      "Assets": [instant("2022-12-31", 50, "2023-02-20", "CY2022Q4I")]})
+    b = companyfacts({"Assets": [instant("2022-12-31", 50, "2023-02-20", "CY2022Q4I")],
+                      "Revenues": [period("2022-01-01", "2022-12-31", 100, "2023-02-20", "CY2022")]})
+    c = companyfacts({"Revenues": [period("2022-01-01", "2022-12-31", 101, "2023-02-20", "CY2022")],
+                      "Assets": [instant("2022-12-31", 50, "2023-02-20", "CY2022Q4I")]})
+
+    assert get_facts_fingerprint(a) == get_facts_fingerprint(b)
+    assert get_facts_fingerprint(a) != get_facts_fingerprint(c)
+
+
+def test_fact_table_get():
+    facts = FactTable(companyfacts({"Revenues": [
+        period("2022-01-01", "2022-03-31", 20, "2022-05-10", "CY2022Q1"),
+        period("2022-01-01", "2022-06-30", 45, "2022-08-10"),
+        period("2022-01-01", "2022-12-31", 100, "2023-02-20", "CY2022", "10-K"),
+    ]}))
+
+    df = facts.get("Revenues")
+    # rows without a frame are dropped, the index is the position of the row in the document
+    assert df.index.tolist() == [0, 2]
+    assert df.val.tolist() == [20, 100]
+    assert facts.get("Assets") is None
+
+
+def test_ttm_from_facts():
+    facts = FactTable(companyfacts({
+        "Revenues": [
+            period("2022-01-01", "2022-03-31", 20, "2022-05-10", "CY2022Q1"),
+            period("2022-04-01", "2022-06-30", 25, "2022-08-10", "CY2022Q2"),
+            # year to date, no frame: ignored
+            period("2022-01-01", "2022-06-30", 45, "2022-08-10"),
+            period("2022-01-01", "2022-12-31", 100, "2023-02-20", "CY2022", "10-K"),
+            period("2023-01-01", "2023-03-31", 30, "2023-05-10", "CY2023Q1"),
+            period("2023-04-01", "2023-06-30", 35, "2023-08-10", "CY2023Q2"),
+        ],
+        "NetIncomeLoss": [
+            period("2021-01-01", "2021-12-31", 10, "2022-02-20", "CY2021", "10-K"),
+            period("2022-01-01", "2022-12-31", 12, "2023-02-20", "CY2022", "10-K"),
+        ],
+        # no annual value: no ttm
+        "OperatingIncomeLoss": [
+            period("2023-01-01", "2023-03-31", 5, "2023-05-10", "CY2023Q1"),
+        ],
+    }))
+
+    ttm = get_ttm_from_facts(facts.df, KEYS)
+
+    # last annual value + quarters after it - same quarters one year before
+    assert ttm.loc[("us-gaap", "Revenues", "USD"), "value"] == 100 + 30 + 35 - 20 - 25
+    assert ttm.loc[("us-gaap", "Revenues", "USD"), "date"] == pd.Timestamp("2022-12-31")
+    assert ttm.loc[("us-gaap", "NetIncomeLoss", "USD"), "value"] == 12
+    assert ("us-gaap", "OperatingIncomeLoss", "USD") not in ttm.index
+
+
+def test_ttm_from_facts_of_many_companies():
+    rows = [
+        period("2022-01-01", "2022-03-31", 20, "2022-05-10", "CY2022Q1"),
+        period("2022-01-01", "2022-12-31", 100, "2023-02-20", "CY2022", "10-K"),
+        period("2023-01-01", "2023-03-31", 30, "2023-05-10", "CY2023Q1"),
+    ]
+    df = pd.concat([FactTable(companyfacts({"Revenues": rows})).df.assign(cik=1),
+                    FactTable(companyfacts({"Revenues": rows[:2]})).df.assign(cik=2)], ignore_index=True)
+
+    ttm = get_ttm_from_facts(df, ["cik"] + KEYS)
+
+    assert ttm.loc[(1, "us-gaap", "Revenues", "USD"), "value"] == 110
+    assert ttm.loc[(2, "us-gaap", "Revenues", "USD"), "value"] == 100
+
+
+def restated_facts():
+    return FactTable(companyfacts({
+        "Revenues": [
+            # annual value of 2021, restated in the 10-K of 2022: companyfacts puts the frame on the last filing only
+            period("2021-01-01", "2021-12-31", 100, "2022-02-20", form="10-K"),
+            period("2021-01-01", "2021-12-31", 90, "2023-02-20", "CY2021", "10-K"),
+            period("2022-01-01", "2022-12-31", 120, "2023-02-20", "CY2022", "10-K"),
+        ],
+        "Assets": [
+            instant("2021-12-31", 500, "2022-02-20", form="10-K"),
+            instant("2021-12-31", 480, "2023-02-20", "CY2021Q4I", "10-K"),
+        ],
+    }))
+
+
+def test_as_of_before_restatement():
+    facts = restated_facts().as_of("2022-06-30")
+
+    revenues = facts.get("Revenues")
+    assert revenues.val.tolist() == [100]
+    # the frame of the period is copied to the filing known at the date
+    assert revenues.frame.tolist() == ["CY2021"]
+    assert facts.get("Assets").val.tolist() == [500]
+
+
+def test_as_of_after_restatement():
+    facts = restated_facts().as_of("2023-02-20")
+
+    # a filing is known on its filing date
+    assert facts.get("Revenues").val.tolist() == [90, 120]
+    assert facts.get("Assets").val.tolist() == [480]
+
+
+def test_as_of_before_first_filing():
+    facts = restated_facts().as_of("2022-02-19")
+
+    assert facts.get("Revenues") is None
+    assert facts.get("Assets") is None
+    assert len(facts.df) == 0
+
+
+def test_as_of_snapshots_share_the_index():
+    facts = restated_facts()
+    first = facts.as_of("2022-06-30")
+    index = facts._as_of_index
+    second = facts.as_of("2023-06-30")
+
+    assert facts._as_of_index is index
+    assert first.get("Revenues").val.tolist() == [100]
+    assert second.get("Revenues").val.tolist() == [90, 120]
@@ -0,0 +1,85 @@
+import copy
+
+import numpy as np
+import pytest
+
+import panel
+import storage
+from quantitative_analysis import extract_company_financial_information
+
+NUM_WORKERS = 2
+
+
+def scaled(doc, factor):
+    doc = copy.deepcopy(doc)
+    for measures in doc["facts"].values():
+        for measure_data in measures.values():
+            for rows in measure_data["units"].values():
+                for row in rows:
+                    row["val"] *= factor
+    return doc
+
+
+def save(cik, doc):
+    storage.upsert_document("financial_data", dict(doc, _id=cik))
+
+
+@pytest.fixture
+def companies(companyfacts, sqlite_storage):
+    """
+    Three companies in financial_data: 1 and 2 with facts, 3 without (its extraction fails)
+    """
+    docs = {1: companyfacts, 2: scaled(companyfacts, 2), 3: {"facts": {}}}
+    for cik, doc in docs.items():
+        save(cik, doc)
+    return docs
+
+
+def test_build_panel(companies, tmp_path):
+    path = str(tmp_path / "panel")
+    assert panel.build_panel(num_workers=NUM_WORKERS, path=path) == 2
+
+    p = panel.Panel(path)
+    assert p.ciks == [1, 2]
+
+    expected = extract_company_financial_information(1, doc=companies[1])
+    revenue = p.get_company(1, "revenue")
+    years = p.years[~np.isnan(revenue)]
+    assert years.tolist() == expected["revenue"]["dates"]
+    assert revenue[~np.isnan(revenue)].tolist() == pytest.approx(expected["revenue"]["values"])
+    assert p.get_company(2, "revenue")[~np.isnan(revenue)].tolist() == \
+        pytest.approx([2 * v for v in expected["revenue"]["values"]])
+    assert p.get_company(1, "mr_equity") == pytest.approx(expected["mr_equity"]["value"])
+
+    df = p.to_df("revenue")
+    assert df.shape == (2, p.num_years)
+
+    with pytest.raises(KeyError):
+        p.get_company(3, "revenue")
+
+
+def test_rebuild_keeps_open_panels_consistent(companies, tmp_path):
+    path = str(tmp_path / "panel")
+    panel.build_panel(num_workers=NUM_WORKERS, path=path)
+    old = panel.Panel(path)
+    old_revenue = np.array(old.get_company(1, "revenue"))
+
+    save(1, scaled(companies[1], 3))
+    panel.build_panel(num_workers=NUM_WORKERS, path=path)
+    new = panel.Panel(path)
+
+    assert new.version != old.version
+    # the panel opened before the build still reads its own version
+    np.testing.assert_array_equal(old.get_company(1, "revenue"), old_revenue)
+    np.testing.assert_allclose(new.get_company(1, "revenue"), 3 * old_revenue)
+
+
+def test_get_panel_reloads_new_version(companies, workdir, monkeypatch):
+    monkeypatch.setattr(panel, "_panel", None)
+    panel.build_panel(num_workers=NUM_WORKERS)
+    first = panel.get_panel()
+    assert panel.get_panel() is first
+
+    panel.build_panel(num_workers=NUM_WORKERS)
+    assert panel.get_panel() is not first
+    assert panel.get_panel().version == panel.get_current_version(panel.get_panel_path())
@@ -0,0 +1,100 @@
+import datetime
+
+import storage
+from pipeline import Pipeline, EXTRACT
+
+
+class Polls:
+    """
+    Stop event of a pipeline that stops after a number of polls, running a callback between polls
+    """
+
+    def __init__(self, num_polls, between=None):
+        self.num_polls = num_polls
+        self.between = between
+
+    def is_set(self):
+        return self.num_polls <= 0
+
+    def wait(self, timeout=None):
+        self.num_polls -= 1
+        if self.between is not None and self.num_polls > 0:
+            self.between()
+
+
+def test_poll_sees_late_commits_once(sqlite_storage):
+    t0 = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    storage.upsert_document("financial_data", {"_id": 1, "inserted_at": t0 + datetime.timedelta(seconds=10)})
+
+    def late_commit():
+        # inserted_at before the one of the document already polled
+        storage.upsert_document("financial_data", {"_id": 2, "inserted_at": t0 + datetime.timedelta(seconds=5)})
+
+    pipeline = Pipeline(stages=(EXTRACT,), poll_interval=0)
+    pipeline.stop_event = Polls(3, late_commit)
+    pipeline.poll("financial_data", since=t0)
+
+    assert [pipeline.tasks.get_nowait() for _ in range(pipeline.tasks.qsize())] == [(EXTRACT, 1), (EXTRACT, 2)]
+
+
+def test_poll_processes_replaced_documents_again(sqlite_storage):
+    t0 = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    storage.upsert_document("financial_data", {"_id": 1, "inserted_at": t0 + datetime.timedelta(seconds=10)})
+
+    def replace():
+        storage.upsert_document("financial_data", {"_id": 1, "inserted_at": t0 + datetime.timedelta(seconds=20)})
+
+    pipeline = Pipeline(stages=(EXTRACT,), poll_interval=0)
+    pipeline.stop_event = Polls(3, replace)
+    pipeline.poll("financial_data", since=t0)
+
+    assert [pipeline.tasks.get_nowait() for _ in range(pipeline.tasks.qsize())] == [(EXTRACT, 1), (EXTRACT, 1)]
+
+
+def test_poll_skips_documents_before_since(sqlite_storage):
+    t0 = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    storage.upsert_document("financial_data", {"_id": 1, "inserted_at": t0 - datetime.timedelta(seconds=10)})
+    storage.upsert_document("financial_data", {"_id": 2, "inserted_at": t0 + datetime.timedelta(seconds=10)})
+
+    pipeline = Pipeline(stages=(EXTRACT,), poll_interval=0)
+    pipeline.stop_event = Polls(1)
+    pipeline.poll("financial_data", since=t0)
+
+    assert [pipeline.tasks.get_nowait() for _ in range(pipeline.tasks.qsize())] == [(EXTRACT, 2)]
+
+
+class ChangeStream:
+    """
+    Change stream returning a list of changes, then nothing
+    """
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def try_next(self):
+        return self.changes.pop(0) if self.changes else None
+
+
+def test_watch_catches_up_since(sqlite_storage, monkeypatch):
+    t0 = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    storage.upsert_document("financial_data", {"_id": 1, "inserted_at": t0 - datetime.timedelta(seconds=10)})
+    # inserted while the pipeline was down
+    storage.upsert_document("financial_data", {"_id": 2, "inserted_at": t0 + datetime.timedelta(seconds=10)})
+
+    class Collection:
+        def watch(self, change_pipeline):
+            return ChangeStream([{"documentKey": {"_id": 3}}])
+
+    monkeypatch.setattr("pipeline.mongodb.get_collection", lambda collection_name: Collection())
+    monkeypatch.setattr("pipeline.time.sleep", lambda seconds: pipeline.stop())
+
+    pipeline = Pipeline(stages=(EXTRACT,), poll_interval=0)
+    pipeline.watch("financial_data", since=t0)
+
+    assert [pipeline.tasks.get_nowait() for _ in range(pipeline.tasks.qsize())] == [(EXTRACT, 2), (EXTRACT, 3)]
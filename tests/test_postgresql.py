@@ -0,0 +1,194 @@
+import datetime
+from collections import namedtuple
+from contextlib import contextmanager
+
+import pandas as pd
+import pytest
+from psycopg2 import sql
+
+import postgresql
+
+Column = namedtuple("Column", ["name", "type_code"])
+
+
+class CopyCursor:
+    """
+    Cursor returning a fixed CSV from COPY ... TO STDOUT
+    """
+
+    def __init__(self, description, csv):
+        self.description = description
+        self.csv = csv
+
+    def mogrify(self, query, params=None):
+        return query.encode("utf-8")
+
+    def execute(self, query, params=None):
+        pass
+
+    def copy_expert(self, query, buffer):
+        buffer.write(self.csv.encode("utf-8"))
+
+
+DESCRIPTION = [Column("country", 25), Column("date", postgresql.DATE_OID), Column("created_at", 1114),
+               Column("value", 701), Column("valid", postgresql.BOOL_OID)]
+
+
+def test_df_from_copy():
+    cur = CopyCursor(DESCRIPTION, "country,date,created_at,value,valid\n"
+                                  "USA,2023-05-01,2023-06-01 10:00:00,1.5,t\n"
+                                  "FRA,2023-04-01,2023-06-01 10:00:00,,f\n")
+
+    df = postgresql.get_df_from_copy(cur, "SELECT * FROM oecd_financial")
+
+    assert df.country.tolist() == ["USA", "FRA"]
+    assert df.date.tolist() == [datetime.date(2023, 5, 1), datetime.date(2023, 4, 1)]
+    assert df.created_at.tolist() == [pd.Timestamp("2023-06-01 10:00:00")] * 2
+    assert df.value.iloc[0] == 1.5 and pd.isna(df.value.iloc[1])
+    assert df.valid.tolist() == [True, False]
+
+
+def test_df_from_copy_without_rows():
+    cur = CopyCursor(DESCRIPTION, "country,date,created_at,value,valid\n")
+
+    df = postgresql.get_df_from_copy(cur, "SELECT * FROM oecd_financial WHERE date = %s",
+                                     (datetime.date(2100, 1, 1),))
+
+    assert df.empty
+    assert df.columns.tolist() == [c.name for c in DESCRIPTION]
+    assert pd.api.types.is_datetime64_any_dtype(df.created_at)
+
+
+def render(query):
+    """
+    Text of a query (psycopg2 sql objects need a connection to be rendered)
+    """
+    if isinstance(query, sql.Composed):
+        return "".join(render(q) for q in query.seq)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return ".".join(f'"{s}"' for s in query.strings)
+    if isinstance(query, sql.Literal):
+        return repr(query.wrapped)
+    if isinstance(query, sql.Placeholder):
+        return "%s"
+    return query
+
+
+class RecordingCursor:
+    """
+    Cursor recording the queries it runs, every query returns the next result of results
+    """
+
+    def __init__(self, queries, results):
+        self.queries = queries
+        self.results = results
+        self.rows = []
+        self.description = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.queries.append(render(query))
+        self.rows, columns = self.results.pop(0) if self.results else ([], [])
+        self.description = [Column(c, 25) for c in columns]
+
+    def fetchall(self):
+        return self.rows
+
+
+class RecordingConnection:
+
+    def __init__(self, results=None):
+        self.queries = []
+        self.results = results if results is not None else []
+        self.prepared_statements = set()
+
+    def cursor(self):
+        return RecordingCursor(self.queries, self.results)
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    conn = RecordingConnection()
+
+    @contextmanager
+    def pooled_connection():
+        yield conn
+
+    monkeypatch.setattr(postgresql, "pooled_connection", pooled_connection)
+    monkeypatch.setattr(postgresql, "_snapshot_views_checked_at", None)
+    return conn
+
+
+def test_most_recent_reads_table_without_fresh_view(connection, monkeypatch):
+    monkeypatch.setattr(postgresql, "get_fresh_snapshot_views", lambda: frozenset())
+
+    postgresql.get_df_from_table("damodaran_country_stats", most_recent=True)
+
+    assert connection.queries == ['SELECT * FROM "damodaran_country_stats"  WHERE created_at = '
+                                  '(SELECT MAX(created_at) FROM damodaran_country_stats)']
+
+
+def test_most_recent_reads_fresh_view(connection, monkeypatch):
+    monkeypatch.setattr(postgresql, "get_fresh_snapshot_views", lambda: frozenset(["damodaran_country_stats_latest"]))
+    connection.results.append(([(1, "France")], [postgresql.SNAPSHOT_ROW, "country"]))
+
+    df = postgresql.get_df_from_table("damodaran_country_stats", most_recent=True)
+
+    assert connection.queries == ['SELECT * FROM "damodaran_country_stats_latest" ;']
+    assert df.columns.tolist() == ["country"]
+
+
+def test_fresh_views_are_checked_with_read_only_queries(connection):
+    connection.results += [([("damodaran_country_stats_latest",), ("yahoo_equity_tickers_latest",)], ["relname"]),
+                           ([("damodaran_country_stats_latest", True), ("yahoo_equity_tickers_latest", False)],
+                            ["view", "fresh"])]
+
+    assert postgresql.get_fresh_snapshot_views() == {"damodaran_country_stats_latest"}
+    # checked once per SNAPSHOT_VIEWS_CHECK_INTERVAL
+    assert postgresql.get_fresh_snapshot_views() == {"damodaran_country_stats_latest"}
+
+    assert len(connection.queries) == 2
+    assert all(q.startswith("SELECT") for q in connection.queries)
+
+
+def test_prepared_statement_reads_table_without_fresh_view(connection, monkeypatch):
+    monkeypatch.setattr(postgresql, "get_fresh_snapshot_views", lambda: frozenset())
+
+    postgresql.get_df_from_prepared("generic_info", (["AAPL"],))
+
+    assert connection.queries[0].startswith('PREPARE "generic_info_from_tables" AS ')
+    assert "FROM (SELECT * FROM yahoo_equity_tickers WHERE created_at = " \
+           "(SELECT MAX(created_at) FROM yahoo_equity_tickers)) y" in connection.queries[0]
+    assert connection.queries[1] == 'EXECUTE "generic_info_from_tables" (%s)'
+
+
+def test_create_table_from_df_updates_existing_table():
+    conn = RecordingConnection([([], []), ([], []),
+                                ([("ticker", "text"), ("created_at", "date"), ("value", "bigint"),
+                                  ("note", "double precision"), ("amount", "numeric")], ["attname", "type"])])
+    df = pd.DataFrame({"ticker": ["AAPL"], "created_at": [datetime.date(2023, 6, 1)], "value": [1.5],
+                       "note": [None], "amount": ["1"], "region": ["US"]})
+
+    postgresql.create_table_from_df(conn.cursor(), df, "valuation_summary", ["ticker", "created_at"])
+
+    # note has no value, amount has a type get_sql_type does not create: both are left as they are
+    assert conn.queries[-1] == 'ALTER TABLE "valuation_summary" ' \
+                               'ALTER COLUMN "value" TYPE DOUBLE PRECISION USING "value"::DOUBLE PRECISION, ' \
+                               'ADD COLUMN IF NOT EXISTS "region" TEXT'
+
+
+def test_create_table_from_df_keeps_matching_table():
+    conn = RecordingConnection([([], []), ([], []), ([("ticker", "text"), ("value", "double precision")],
+                                                     ["attname", "type"])])
+
+    postgresql.create_table_from_df(conn.cursor(), pd.DataFrame({"ticker": ["AAPL"], "value": [1]}),
+                                    "valuation_summary", ["ticker"])
+
+    assert len(conn.queries) == 3
@@ -0,0 +1,49 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import reference_data
+from reference_data import INDUSTRY_DATA_COLUMNS, ReferenceData
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    """
+    Reference tables read by ReferenceData, oecd_financial without any CPI row
+    """
+    tables = {
+        "damodaran_erp": pd.DataFrame({"date": [datetime.date(2023, 1, 1)], "value": [0.05]}),
+        "damodaran_bond_spread": pd.DataFrame({"greater_than": ["0"], "less_than": ["100"], "spread": [0.01]}),
+        "damodaran_country_stats": pd.DataFrame({"country": ["UnitedStates"], "adjusted_default_spread": [0.0]}),
+        "damodaran_industry_data": pd.DataFrame(columns=INDUSTRY_DATA_COLUMNS),
+        "oecd_financial": pd.DataFrame(columns=["location", "indicator", "date", "value"]),
+    }
+
+    def get_df_from_table(tablename, where=";", most_recent=False, params=None, columns=None, previous_year=False,
+                          columnar=False):
+        return tables[tablename].copy()
+
+    monkeypatch.setattr(reference_data, "get_df_from_table", get_df_from_table)
+    monkeypatch.setattr(reference_data, "_inflation", None)
+    return tables
+
+
+def cpi(data, country, value_last_year, value):
+    return pd.DataFrame({"location": [country] * 2, "indicator": ["CPI"] * 2,
+                         "date": [data.cpi_last_year_date, data.cpi_current_date], "value": [value_last_year, value]})
+
+
+def test_missing_cpi_only_fails_inflation(tables):
+    data = ReferenceData()
+
+    assert data.get_country_stats("UnitedStates")["adjusted_default_spread"] == 0.0
+    with pytest.raises(KeyError):
+        data.get_inflation("FRA")
+
+    # CPI loaded later in the month
+    tables["oecd_financial"] = pd.concat([cpi(data, "USA", 100, 103), cpi(data, "FRA", 100, 102)])
+    inflation_country, inflation_us = data.get_inflation("FRA")
+    assert inflation_country == pytest.approx(0.02)
+    assert inflation_us == pytest.approx(0.03)
+    assert data.get_inflation("DEU") == (inflation_us, inflation_us)
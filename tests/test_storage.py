@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import storage
+
+
+def read_in_child(document_id):
+    backend = storage.get_storage()
+    doc = backend.get_document("financial_data", document_id)
+    inherited = list(storage._inherited_connections)
+    return doc["val"], backend._local.pid == os.getpid(), backend._connection() not in inherited, len(inherited)
+
+
+def test_sqlite_connection_is_not_shared_with_forked_processes(sqlite_storage):
+    storage.upsert_document("financial_data", {"_id": 1, "val": 10})
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as executor:
+        val, own_pid, own_connection, num_inherited = executor.submit(read_in_child, 1).result()
+
+    assert val == 10
+    assert own_pid and own_connection and num_inherited == 1
+    # the parent keeps its connection
+    assert sqlite_storage._local.pid == os.getpid()
+    assert storage.get_document("financial_data", 1)["val"] == 10
+
+
+def test_sqlite_partitions_cover_the_collection_once(sqlite_storage):
+    for cik in range(1, 24):
+        storage.upsert_document("financial_data", {"_id": cik, "val": cik})
+    storage.upsert_document("documents", {"_id": "other", "cik": "1"})
+
+    partitions = sqlite_storage.get_id_partitions("financial_data", 4)
+    ids = [[d["_id"] for d in storage.iter_documents("financial_data", ["_id"], p, batch_size=2)] for p in partitions]
+
+    assert len(partitions) == 4
+    assert sorted(i for part in ids for i in part) == list(range(1, 24))
+    assert all(5 <= len(part) <= 6 for part in ids)
+    assert sqlite_storage.get_id_partitions("financial_extractions", 4) == []
+
+
+def square(doc):
+    return doc["val"] ** 2 if doc["val"] % 2 == 0 else None
+
+
+def test_parallel_map_collection(sqlite_storage):
+    for cik in range(1, 11):
+        storage.upsert_document("financial_data", {"_id": cik, "val": cik})
+
+    assert sorted(storage.parallel_map_collection("financial_data", square, num_workers=3)) == [4, 16, 36, 64, 100]
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import mongodb
+import mongodb_async
+import tiering
+
+URL = "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+METADATA = {"_id": URL, "cik": "320193", "filing_date": "2023-11-03"}
+
+
+@pytest.fixture
+def tiered_filing(workdir, monkeypatch):
+    """
+    A filing whose html is only in the cold tier
+    """
+    tiering.write_archive(tiering.get_archive_path(METADATA["cik"], METADATA["filing_date"]), {URL: "<html/>"})
+
+    def get_document(collection_name, document_id, projection=None):
+        if collection_name != "documents" or document_id != URL:
+            raise StopIteration
+        return dict(METADATA)
+
+    async def get_document_async(collection_name, document_id, projection=None):
+        try:
+            return get_document(collection_name, document_id, projection)
+        except StopIteration:
+            raise mongodb_async.DocumentNotFoundException(document_id)
+
+    monkeypatch.setattr(mongodb, "get_document", get_document)
+    monkeypatch.setattr(mongodb_async, "get_document", get_document_async)
+
+
+def test_payload_from_cold_tier(tiered_filing):
+    assert mongodb.get_document_payload(URL) == "<html/>"
+
+
+def test_async_payload_from_cold_tier(tiered_filing):
+    assert asyncio.run(mongodb_async.get_document_payload(URL)) == "<html/>"
+
+
+def test_async_payload_not_in_cold_tier(tiered_filing):
+    tiering.write_archive(tiering.get_archive_path(METADATA["cik"], METADATA["filing_date"]), {})
+
+    with pytest.raises(mongodb_async.DocumentNotFoundException):
+        asyncio.run(mongodb_async.get_document_payload(URL))
@@ -0,0 +1,48 @@
+from yearly_series import YearlySeries, get_year_range
+
+
+def test_from_years_keeps_first_value_of_a_year():
+    s = YearlySeries.from_years([2020, 2022, 2020], [1, 3, 2])
+
+    assert s["dates"] == [2020, 2022]
+    assert s["values"] == [1, 3]
+    assert len(s) == 2
+
+
+def test_fill_adds_missing_years_only():
+    s = YearlySeries.from_years([2020, 2021], [1, 2])
+    s.fill(YearlySeries.from_years([2019, 2021, 2023], [10, 20, 30]))
+
+    assert s.to_dict() == {"dates": [2019, 2020, 2021, 2023], "values": [10, 1, 2, 30]}
+
+
+def test_merge_subsets():
+    superset = YearlySeries.from_years([2021], [100])
+    subsets = [YearlySeries.from_years([2019, 2020, 2021], [1, 2, 3]), YearlySeries.from_years([2020], [10])]
+
+    s = YearlySeries.from_years([2021], [100])
+    s.merge_subsets(subsets)
+    assert s.to_dict() == {"dates": [2019, 2020, 2021], "values": [1, 12, 100]}
+
+    superset.merge_subsets(subsets, must_include=(0, 1))
+    assert superset.to_dict() == {"dates": [2020, 2021], "values": [12, 100]}
+
+
+def test_select():
+    s = YearlySeries.from_years([2020, 2022], [1, 3])
+
+    assert s.select(2019, 2023).tolist() == [0, 1, 0, 3, 0]
+    assert s.select(2019, 2020, default=-1).tolist() == [-1, 1]
+
+
+def test_set_values():
+    s = YearlySeries.from_years([2020, 2022], [1, 3])
+    s["values"] = [x * 1000 for x in s["values"]]
+
+    assert s.to_dict() == {"dates": [2020, 2022], "values": [1000, 3000]}
+
+
+def test_get_year_range():
+    assert get_year_range([YearlySeries.from_years([2020], [1]), YearlySeries.from_years([2018, 2019], [1, 2])]) \
+        == (2018, 3)
+    assert get_year_range([YearlySeries()]) == (0, 0)
@@ -0,0 +1,175 @@
+import datetime
+import json
+import os
+from configparser import ConfigParser
+
+import zstandard
+
+import mongodb
+from utils import PARSER_VERSION
+
+# Cold tier for filings html.
+# html of filings older than max_age_days, or already parsed with the current parser, is moved from the payload
+# collection (mongodb.PAYLOAD_COLLECTION) to zstd compressed archives on local disk, one per company and filing year:
+#
+#   <path>/<cik>/<year>.json.zst    ->    {"<url>": "<html>", ...}
+#
+# mongodb.get_document_payload (and mongodb_async.get_document_payload) reads the archives when the html is not in
+# mongodb anymore, rehydrate_documents copies the html back to mongodb before parsing documents again.
+# Only the payload collection is tiered: tier_documents first moves the html of filings saved before the payload split
+# (still inline in "documents") to the payload collection with mongodb.split_documents_payload.
+#
+# Configuration in credentials.cfg (optional):
+# [tiering]
+# path = cold_storage
+# max_age_days = 730
+
+DEFAULT_PATH = "cold_storage"
+DEFAULT_MAX_AGE_DAYS = 730
+ARCHIVE_COMPRESSION_LEVEL = 19
+
+
+def get_tiering_config():
+    """
+    Get cold tier configuration
+    :return: (archives path, max age in days of hot filings)
+    """
+    parser = ConfigParser()
+    _ = parser.read(os.path.join("credentials.cfg"))
+    path = parser.get("tiering", "path", fallback=DEFAULT_PATH)
+    max_age_days = parser.getint("tiering", "max_age_days", fallback=DEFAULT_MAX_AGE_DAYS)
+    return path, max_age_days
+
+
+def get_archive_path(cik, filing_date, path=None):
+    """
+    Get the archive of a filing
+    :param cik: company cik
+    :param filing_date: yyyy-mm-dd
+    :param path: archives path, None reads the configured one (pass it when getting the archives of many filings)
+    :return: archive path
+    """
+    if path is None:
+        path, _ = get_tiering_config()
+    return os.path.join(path, cik, f"{filing_date[:4]}.json.zst")
+
+
+def read_archive(archive_path):
+    """
+    Read a cold tier archive
+    :param archive_path: path of the archive
+    :return: dictionary {url: html}, empty if the archive does not exist
+    """
+    if not os.path.exists(archive_path):
+        return {}
+    with open(archive_path, "rb") as f:
+        return json.loads(zstandard.ZstdDecompressor().decompress(f.read()).decode("utf-8"))
+
+
+def write_archive(archive_path, filings):
+    """
+    Write a cold tier archive. The file is replaced atomically, a failure never leaves a truncated archive.
+    :param archive_path: path of the archive
+    :param filings: dictionary {url: html}
+    """
+    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+    data = zstandard.ZstdCompressor(level=ARCHIVE_COMPRESSION_LEVEL).compress(json.dumps(filings).encode("utf-8"))
+    tmp_path = archive_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, archive_path)
+
+
+def get_cold_payload(document_id):
+    """
+    Get the html of a filing from the cold tier
+    :param document_id: url of the filing
+    :return: html string, raise StopIteration if not found
+    """
+    metadata = mongodb.get_document_metadata(document_id)
+    filings = read_archive(get_archive_path(metadata["cik"], metadata["filing_date"]))
+    if document_id not in filings:
+        raise StopIteration
+    return filings[document_id]
+
+
+def get_tiering_candidates(max_age_days, path):
+    """
+    Get filings whose html can be moved to the cold tier, grouped by archive
+    :param max_age_days: filings older than max_age_days are moved
+    :param path: archives path
+    :return: dictionary {archive path: set of urls}
+    """
+    cutoff = (datetime.date.today() - datetime.timedelta(days=max_age_days)).isoformat()
+
+    old_docs = mongodb.iter_collection("documents", {"filing_date": {"$lt": cutoff}}, ["cik", "filing_date"])
+    parsed_docs = mongodb.iter_collection("parsed_documents", {"parser_version": PARSER_VERSION},
+                                          ["cik", "filing_date"])
+
+    candidates = {}
+    for docs in [old_docs, parsed_docs]:
+        for doc in docs:
+            candidates.setdefault(get_archive_path(doc["cik"], doc["filing_date"], path), set()).add(doc["_id"])
+    return candidates
+
+
+def tier_documents(max_age_days=None):
+    """
+    Move html of old or already parsed filings from mongodb to the cold tier.
+    The archive is written before the html is deleted from mongodb.
+    :param max_age_days: filings older than max_age_days are moved, None uses the configured value
+    :return: number of filings moved
+    """
+    path, configured_max_age_days = get_tiering_config()
+    if max_age_days is None:
+        max_age_days = configured_max_age_days
+
+    # legacy filings with inline html are tiered like the others
+    mongodb.split_documents_payload()
+
+    moved = 0
+    for archive_path, document_ids in get_tiering_candidates(max_age_days, path).items():
+
+        # filings already in the cold tier are not in the payload collection anymore
+        payloads = mongodb.get_documents(mongodb.PAYLOAD_COLLECTION, document_ids)
+        if len(payloads) == 0:
+            continue
+
+        filings = read_archive(archive_path)
+        for p in payloads:
+            filings[p["_id"]] = mongodb.decompress_payload(p["html"])
+        write_archive(archive_path, filings)
+
+        mongodb.get_collection(mongodb.PAYLOAD_COLLECTION).delete_many({"_id": {"$in": [p["_id"] for p in payloads]}})
+        moved += len(payloads)
+        print(f"{archive_path}: {len(payloads)} filings moved")
+
+    return moved
+
+
+def rehydrate_documents(document_ids):
+    """
+    Copy html of filings from the cold tier back to mongodb (e.g. before parsing them again with a new parser).
+    The archives are left untouched, the next tier_documents run deletes the html from mongodb again.
+    :param document_ids: list of urls
+    :return: number of filings rehydrated
+    """
+    path, _ = get_tiering_config()
+    rehydrated = 0
+    archives = {}
+    for metadata in mongodb.get_documents("documents", document_ids, ["cik", "filing_date"]):
+        archive_path = get_archive_path(metadata["cik"], metadata["filing_date"], path)
+        if archive_path not in archives:
+            archives[archive_path] = read_archive(archive_path)
+        html = archives[archive_path].get(metadata["_id"])
+        if html is None:
+            continue
+        mongodb.upsert_document_payload(metadata["_id"], html)
+        rehydrated += 1
+    return rehydrated
+
+
+if __name__ == '__main__':
+    tier_documents()
@@ -11,11 +11,15 @@ from bs4 import BeautifulSoup, NavigableString
 from unidecode import unidecode
 
 import mongodb
+import storage
 from edgar_utils import company_from_cik, AAPL_CIK, download_submissions_documents, download_all_cik_submissions
 import string
 
 from openai_interface import summarize_section
 
+# saved in parsed_documents, increase it when a change to the parser requires documents to be parsed again
+PARSER_VERSION = 1
+
 list_10k_items = [
     "business",
     "risk factors",
@@ -179,14 +183,9 @@ def is_title_valid(text):
 def parse_segments():
     done_ciks = []
 
-    docs = mongodb.get_collection_documents("documents")
+    docs = mongodb.get_documents_metadata({"form_type": "10-K", "_id": {"$regex": "aapl"}})
     for doc in docs:
-
-        if "aapl" not in doc["_id"]:
-            continue
-
-        if doc["form_type"] != "10-K":
-            continue
+        doc = mongodb.FilingDocument(doc)
 
         cik = doc["_id"].split("data/")[1].split("/")[0]
 
@@ -260,8 +259,9 @@ def parse_segments():
 def find_possible_axis():
     axis = []
 
-    docs = mongodb.get_collection_documents("documents")
+    docs = mongodb.iter_collection("documents", projection=mongodb.DOCUMENT_METADATA_FIELDS)
     for doc in docs:
+        doc = mongodb.FilingDocument(doc)
 
         page = doc["html"]
         soap = BeautifulSoup(page, features="html.parser")
@@ -624,7 +624,8 @@ def parse_document(doc):
     if len(sections) == 0:
         sections = get_sections_using_strings(soup, table_of_contents, default_sections)
 
-    result = {"_id": url, "cik": cik, "form_type":form_type, "filing_date": filing_date, "sections":{}}
+    result = {"_id": url, "cik": cik, "form_type":form_type, "filing_date": filing_date, "sections":{},
+              "parser_version": PARSER_VERSION}
 
     for s in sections:
         section = sections[s]
@@ -636,7 +637,7 @@ def parse_document(doc):
             result["sections"][section["title"]] = {"text":text, "link":section["link"] if "link" in section else None}
 
     try:
-        mongodb.upsert_document("parsed_documents", result)
+        storage.upsert_document("parsed_documents", result)
     except:
         traceback.print_exc()
         print(result.keys())
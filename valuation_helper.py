@@ -1,12 +1,10 @@
 import re
 import sys
 import time
-from datetime import datetime
 from statistics import median
 
 import requests
 from bs4 import BeautifulSoup
-from dateutil.relativedelta import relativedelta
 from forex_python.converter import CurrencyRates, RatesNotAvailableError
 from unidecode import unidecode
 from urllib3.exceptions import ProtocolError
@@ -14,7 +12,7 @@ import numpy as np
 
 import mongodb
 from investing_com import get_10y_bond_yield
-from postgresql import get_df_from_table
+from reference_data import get_reference_data
 from yahoo_finance import get_current_price_from_yahoo
 import math
 import pandas as pd
@@ -823,13 +821,16 @@ def get_target_info(revenue, ttm_revenue, country_default_spread, tax_rate, fina
 
     return cagr, target_levered_beta, target_cost_of_equity, target_cost_of_debt, target_cost_of_capital
 
-def currency_bond_yield(currency, alpha_3_code, country_stats):
+def currency_bond_yield(currency, alpha_3_code, reference_data=None):
+
+    if reference_data is None:
+        reference_data = get_reference_data()
 
     currency_10y_bond, mother_country = get_10y_bond_yield(currency)
 
     if currency_10y_bond is not None:
 
-        filter_df = country_stats[country_stats["country"] == mother_country.replace(" ", "")].iloc[0]
+        filter_df = reference_data.get_country_stats(mother_country.replace(" ", ""))
         country_default_spread = float(filter_df["adjusted_default_spread"])
 
         #10y yield currency - default risk mother currency
@@ -840,31 +841,9 @@ def currency_bond_yield(currency, alpha_3_code, country_stats):
         if alpha_3_code is None:
             return -1
 
-        us_10y_bond, _ = get_10y_bond_yield("USD")
-
-        filter_df = country_stats[country_stats["country"] == "UnitedStates"].iloc[0]
-        us_cds = float(filter_df["adjusted_default_spread"])
-
-        riskfree_us = us_10y_bond - us_cds
-
-        current_year_date = datetime.now().date().replace(day=1) - relativedelta(months=2)
-        last_year_date = current_year_date - relativedelta(years=1)
+        riskfree_us = reference_data.get_riskfree_us()
 
-        cpi_data = get_df_from_table("oecd_financial", f"where location IN ('{alpha_3_code}','USA') "
-                                                       f"and indicator='CPI' "
-                                                       f"and date in ('{last_year_date.strftime('%Y-%m-%d')}',"
-                                                       f"'{current_year_date.strftime('%Y-%m-%d')}')")
-
-        inflation_us = cpi_data[cpi_data["location"] == "USA"]
-        inflation_us = inflation_us[inflation_us["date"] == current_year_date]["value"].iloc[0] / \
-                       inflation_us[inflation_us["date"] == last_year_date]["value"].iloc[0] - 1
-
-        inflation_country = cpi_data[cpi_data["location"] == alpha_3_code]
-        if inflation_country.empty:
-            inflation_country = inflation_us
-        else:
-            inflation_country = inflation_country[inflation_country["date"] == current_year_date]["value"].iloc[0] / \
-                                inflation_country[inflation_country["date"] == last_year_date]["value"].iloc[0] - 1
+        inflation_country, inflation_us = reference_data.get_inflation(alpha_3_code)
 
         riskfree = riskfree_us * float(inflation_country) / float(inflation_us)
         print("10y bond yield not found - inflation_country", inflation_country, "inflation_us", inflation_us)
@@ -1065,17 +1044,16 @@ def get_industry_parameter(df, industry, region, parameter, debug=True):
         return float(value)
 
 def get_industry_data(industry, region, geo_segments_df, revenue, ebit_adj, revenue_delta, reinvestment, equity_mkt, debt_mkt,
-                          equity_bv_adj, debt_bv_adj, mr_equity_adj, mr_debt_adj, min_std=0.1, max_std=1):
+                          equity_bv_adj, debt_bv_adj, mr_equity_adj, mr_debt_adj, min_std=0.1, max_std=1,
+                          reference_data=None):
 
     # TAKE 1/3 value from last year
     # 2/3 value from this year
 
     columns = ["industry_name","region","sales_capital","cash_return","unlevered_beta","opmargin_adjusted","debt_equity","pbv"]
-    df_last_year = get_df_from_table("damodaran_industry_data", f"where industry_name = '{industry}' and "
-                                                                f"created_at = (SELECT MAX(created_at) "
-                                                                f"FROM damodaran_industry_data "
-                                                                f"WHERE created_at < date_trunc('year',now()))")[columns]
-    df = get_df_from_table("damodaran_industry_data", f"where industry_name = '{industry}'", most_recent=True)[columns]
+    if reference_data is None:
+        reference_data = get_reference_data()
+    df, df_last_year = reference_data.get_industry_data(industry)
 
     # print(df_last_year)
     # print(df)
@@ -0,0 +1,161 @@
+import numpy as np
+
+# Yearly values of a measure (revenue, ebit, shares, ...) indexed by year.
+# A series is a dense array of values starting at base_year plus a mask of the years that have a value, so that
+# hierarchical fills, subset merges and year range selections are array operations instead of list lookups.
+# For compatibility with code (and pickled results) using the previous {"dates": [...], "values": [...]} dictionaries,
+# series["dates"] and series["values"] return the lists of years with a value and of their values, in year order.
+
+
+def get_year_range(series):
+    """
+    Get the range of years covering a list of series
+    :param series: list of YearlySeries
+    :return: (first year, number of years), (0, 0) if all the series are empty
+    """
+    series = [s for s in series if len(s.values) > 0]
+    if len(series) == 0:
+        return 0, 0
+    base_year = min(s.base_year for s in series)
+    return base_year, max(s.end_year for s in series) - base_year
+
+
+class YearlySeries:
+    """
+    Values of a measure by year: values[i] is the value of year base_year + i, valid only if mask[i] is True.
+    """
+
+    def __init__(self, base_year=0, values=None, mask=None):
+        self.base_year = int(base_year)
+        self.values = np.zeros(0) if values is None else np.asarray(values, dtype=float)
+        self.mask = np.zeros(len(self.values), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+    @classmethod
+    def from_years(cls, years, values):
+        """
+        Build a series from years and values. If a year is repeated, its first value is kept.
+        :param years: list (or array) of years
+        :param values: list (or array) of values
+        :return: YearlySeries
+        """
+        years = np.asarray(years, dtype=int)
+        values = np.asarray(values, dtype=float)
+        if len(years) == 0:
+            return cls()
+
+        years, first = np.unique(years, return_index=True)
+        base_year = years[0]
+        series_values = np.zeros(years[-1] - base_year + 1)
+        mask = np.zeros(len(series_values), dtype=bool)
+        series_values[years - base_year] = values[first]
+        mask[years - base_year] = True
+        return cls(base_year, series_values, mask)
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Build a series from a {"dates": [...], "values": [...]} dictionary
+        :param d: dictionary
+        :return: YearlySeries
+        """
+        return cls.from_years(d["dates"], d["values"])
+
+    @property
+    def end_year(self):
+        return self.base_year + len(self.values)
+
+    @property
+    def years(self):
+        return self.base_year + np.flatnonzero(self.mask)
+
+    def __len__(self):
+        return int(self.mask.sum())
+
+    def __getitem__(self, key):
+        if key == "dates":
+            return self.years.tolist()
+        if key == "values":
+            return self.values[self.mask].tolist()
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        # values can be replaced (e.g. rescaled), years cannot
+        if key != "values":
+            raise KeyError(key)
+        self.values = self.values.copy()
+        self.values[self.mask] = np.asarray(value, dtype=float)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        return {"dates": self["dates"], "values": self["values"]}
+
+    def reindex(self, base_year, length):
+        """
+        Get values and mask on another range of years
+        :param base_year: first year of the range
+        :param length: number of years of the range
+        :return: (values, mask) arrays of size length, years outside of the series have mask False
+        """
+        values = np.zeros(length)
+        mask = np.zeros(length, dtype=bool)
+        start = max(self.base_year, base_year)
+        end = min(self.end_year, base_year + length)
+        if start < end:
+            values[start - base_year:end - base_year] = self.values[start - self.base_year:end - self.base_year]
+            mask[start - base_year:end - base_year] = self.mask[start - self.base_year:end - self.base_year]
+        return values, mask
+
+    def fill(self, other):
+        """
+        Add the values of the years that are in other but not in this series (hierarchical fill), in place
+        :param other: YearlySeries
+        """
+        base_year, length = get_year_range([self, other])
+        values, mask = self.reindex(base_year, length)
+        other_values, other_mask = other.reindex(base_year, length)
+
+        add = other_mask & ~mask
+        values[add] = other_values[add]
+
+        self.base_year, self.values, self.mask = base_year, values, mask | add
+
+    def merge_subsets(self, subsets, must_include=None):
+        """
+        Add the sum of the subsets for the years that are not in this series, in place (see merge_subsets_yearly)
+        :param subsets: list of YearlySeries
+        :param must_include: None or tuple of indexes of subsets that must have a value for a year to be added
+        """
+        if len(subsets) == 0:
+            return
+
+        base_year, length = get_year_range([self] + list(subsets))
+        values, mask = self.reindex(base_year, length)
+
+        total = np.zeros(length)
+        subset_masks = []
+        for s in subsets:
+            s_values, s_mask = s.reindex(base_year, length)
+            total[s_mask] += s_values[s_mask]
+            subset_masks.append(s_mask)
+
+        if must_include is None:
+            add = np.logical_or.reduce(subset_masks) & ~mask
+        else:
+            add = np.logical_and.reduce([subset_masks[i] for i in must_include]) & ~mask
+
+        values[add] = total[add]
+
+        self.base_year, self.values, self.mask = base_year, values, mask | add
+
+    def select(self, start, end, default=0):
+        """
+        Get the values of a range of years
+        :param start: initial year
+        :param end: final year (included)
+        :param default: value of the years without a value
+        :return: array of end - start + 1 values
+        """
+        values, mask = self.reindex(start, end - start + 1)
+        return np.where(mask, values, default)